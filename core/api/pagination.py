@@ -0,0 +1,80 @@
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+from core.pagination import InvalidCursor, decode_cursor, paginate_by_cursor
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination on a compound, indexed ordering such as (created_at, id).
+
+    Unlike PageNumberPagination it never runs a COUNT(*) and deep pages cost
+    the same as the first one. Views may define ``get_keyset_ordering()`` to
+    pick the ordering per request; ``ordering`` is used otherwise.
+    """
+    page_size = 10
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    ordering = ('-created_at', '-id')
+
+    def get_ordering(self, view):
+        if hasattr(view, 'get_keyset_ordering'):
+            return view.get_keyset_ordering()
+        return getattr(view, 'keyset_ordering', self.ordering)
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        ordering = self.get_ordering(view)
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            # paginate_by_cursor would silently restart from the first page
+            try:
+                decode_cursor(cursor, queryset.model, ordering)
+            except InvalidCursor:
+                raise NotFound('Invalid cursor')
+        self.page = paginate_by_cursor(
+            queryset,
+            ordering,
+            cursor=cursor,
+            per_page=self.get_page_size(request),
+        )
+        return list(self.page)
+
+    def get_next_link(self):
+        if not self.page.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.page.next_cursor)
+
+    def get_first_link(self):
+        if not self.page.has_previous:
+            return None
+        url = self.request.build_absolute_uri()
+        return remove_query_param(url, self.cursor_query_param)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'first': self.get_first_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'first': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
@@ -2,6 +2,7 @@ from rest_framework import serializers
 from django.contrib.auth.models import User
 from core.models import Profile, Community, Post, Comment, Vote, Notification, Payment
 from taggit.serializers import TagListSerializerField, TaggitSerializer
+from core.voting import BULK_VOTE_LIMIT, TARGET_MODELS
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -28,18 +29,12 @@ class ProfileSerializer(serializers.ModelSerializer):
 
 class CommunitySerializer(serializers.ModelSerializer):
     """Serializer for the Community model"""
-    member_count = serializers.SerializerMethodField()
-    post_count = serializers.SerializerMethodField()
+    member_count = serializers.IntegerField(read_only=True)
+    post_count = serializers.IntegerField(read_only=True)
     
     class Meta:
         model = Community
         fields = ['id', 'name', 'description', 'created_at', 'member_count', 'post_count']
-    
-    def get_member_count(self, obj):
-        return obj.members.count()
-    
-    def get_post_count(self, obj):
-        return obj.posts.count()
 
 
 class PostListSerializer(TaggitSerializer, serializers.ModelSerializer):
@@ -48,7 +43,7 @@ class PostListSerializer(TaggitSerializer, serializers.ModelSerializer):
     community = CommunitySerializer(read_only=True)
     tags = TagListSerializerField()
     vote_score = serializers.SerializerMethodField()
-    comment_count = serializers.SerializerMethodField()
+    comment_count = serializers.IntegerField(read_only=True)
     
     class Meta:
         model = Post
@@ -56,10 +51,7 @@ class PostListSerializer(TaggitSerializer, serializers.ModelSerializer):
                   'community', 'tags', 'vote_score', 'comment_count']
     
     def get_vote_score(self, obj):
-        return obj.vote_count()
-    
-    def get_comment_count(self, obj):
-        return obj.comment_count()
+        return obj.vote_count
 
 
 class PostDetailSerializer(TaggitSerializer, serializers.ModelSerializer):
@@ -68,7 +60,7 @@ class PostDetailSerializer(TaggitSerializer, serializers.ModelSerializer):
     community = CommunitySerializer(read_only=True)
     tags = TagListSerializerField()
     vote_score = serializers.SerializerMethodField()
-    comment_count = serializers.SerializerMethodField()
+    comment_count = serializers.IntegerField(read_only=True)
     
     class Meta:
         model = Post
@@ -76,10 +68,7 @@ class PostDetailSerializer(TaggitSerializer, serializers.ModelSerializer):
                   'author', 'community', 'tags', 'vote_score', 'comment_count']
     
     def get_vote_score(self, obj):
-        return obj.vote_count()
-    
-    def get_comment_count(self, obj):
-        return obj.comment_count()
+        return obj.vote_count
 
 
 class CommentSerializer(serializers.ModelSerializer):
@@ -95,7 +84,7 @@ class CommentSerializer(serializers.ModelSerializer):
                   'parent_id', 'vote_score']
     
     def get_vote_score(self, obj):
-        return obj.vote_count()
+        return obj.vote_count
 
 
 class VoteSerializer(serializers.ModelSerializer):
@@ -105,7 +94,19 @@ class VoteSerializer(serializers.ModelSerializer):
     class Meta:
         model = Vote
         fields = ['id', 'user', 'post', 'comment', 'value', 'created_at']
-        
+
+
+class VoteOperationSerializer(serializers.Serializer):
+    """One vote of a bulk vote request; a value of 0 removes the vote"""
+    target = serializers.ChoiceField(choices=list(TARGET_MODELS))
+    id = serializers.IntegerField(min_value=1)
+    value = serializers.ChoiceField(choices=[1, -1, 0])
+
+
+class BulkVoteSerializer(serializers.Serializer):
+    """Serializer for a batch of votes, applied in order"""
+    votes = VoteOperationSerializer(many=True, allow_empty=False, max_length=BULK_VOTE_LIMIT)
+
 
 class NotificationSerializer(serializers.ModelSerializer):
     """Serializer for the Notification model"""
@@ -115,7 +116,7 @@ class NotificationSerializer(serializers.ModelSerializer):
     class Meta:
         model = Notification
         fields = ['id', 'recipient', 'sender', 'notification_type', 
-                  'post', 'comment', 'text', 'created_at', 'is_read']
+                  'post', 'comment', 'text', 'count', 'created_at', 'is_read']
 
 
 class PaymentSerializer(serializers.ModelSerializer):
@@ -2,7 +2,7 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .viewsets import (
     UserViewSet, ProfileViewSet, CommunityViewSet, PostViewSet,
-    CommentViewSet, NotificationViewSet, PaymentViewSet
+    CommentViewSet, VoteViewSet, NotificationViewSet, PaymentViewSet
 )
 
 # Create a router and register our viewsets with it
@@ -12,6 +12,7 @@ router.register(r'profiles', ProfileViewSet)
 router.register(r'communities', CommunityViewSet)
 router.register(r'posts', PostViewSet)
 router.register(r'comments', CommentViewSet)
+router.register(r'votes', VoteViewSet, basename='vote')
 router.register(r'notifications', NotificationViewSet, basename='notification')
 router.register(r'payments', PaymentViewSet, basename='payment')
 
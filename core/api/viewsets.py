@@ -3,15 +3,33 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.contrib.auth.models import User
 from django_filters.rest_framework import DjangoFilterBackend
-from core.models import Profile, Community, Post, Comment, Vote, Notification, Payment
+from core.models import Profile, Community, Post, Comment, Notification, Payment
+from core.voting import cast_vote, cast_votes
+from core.ranking import feed_ordering
+from core.notifications import invalidate_unread_count, notify_upvote
 from .serializers import (
     UserSerializer, ProfileSerializer, CommunitySerializer,
     PostListSerializer, PostDetailSerializer, CommentSerializer,
-    VoteSerializer, NotificationSerializer, PaymentSerializer
+    VoteSerializer, BulkVoteSerializer, NotificationSerializer, PaymentSerializer
 )
+from .pagination import KeysetPagination
 from .permissions import IsOwnerOrReadOnly, IsRecipientOrReadOnly, IsAuthorOrReadOnly
 
 
+def community_queryset():
+    """Communities with the counters CommunitySerializer renders stored on the row"""
+    return Community.objects.all()
+
+
+def post_queryset():
+    """Posts with everything PostListSerializer/PostDetailSerializer render"""
+    return Post.objects.select_related('author', 'community').prefetch_related('tags')
+
+
+def comment_queryset():
+    return Comment.objects.select_related('author')
+
+
 class UserViewSet(viewsets.ReadOnlyModelViewSet):
     """ViewSet for viewing user information"""
     queryset = User.objects.all()
@@ -24,7 +42,7 @@ class UserViewSet(viewsets.ReadOnlyModelViewSet):
     def profile(self, request, pk=None):
         """Get the user's profile"""
         user = self.get_object()
-        profile = Profile.objects.get(user=user)
+        profile = Profile.objects.select_related('user').prefetch_related('interests').get(user=user)
         serializer = ProfileSerializer(profile)
         return Response(serializer.data)
     
@@ -32,7 +50,7 @@ class UserViewSet(viewsets.ReadOnlyModelViewSet):
     def posts(self, request, pk=None):
         """Get the user's posts"""
         user = self.get_object()
-        posts = Post.objects.filter(author=user)
+        posts = post_queryset().filter(author=user)
         serializer = PostListSerializer(posts, many=True)
         return Response(serializer.data)
     
@@ -40,7 +58,7 @@ class UserViewSet(viewsets.ReadOnlyModelViewSet):
     def comments(self, request, pk=None):
         """Get the user's comments"""
         user = self.get_object()
-        comments = Comment.objects.filter(author=user)
+        comments = comment_queryset().filter(author=user)
         serializer = CommentSerializer(comments, many=True)
         return Response(serializer.data)
 
@@ -53,7 +71,7 @@ class ProfileViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         """Optionally restrict to the current user only"""
-        queryset = Profile.objects.all()
+        queryset = Profile.objects.select_related('user').prefetch_related('interests')
         username = self.request.query_params.get('username', None)
         if username is not None:
             queryset = queryset.filter(user__username=username)
@@ -68,11 +86,14 @@ class CommunityViewSet(viewsets.ModelViewSet):
     filter_backends = [filters.SearchFilter, DjangoFilterBackend]
     search_fields = ['name', 'description']
     
+    def get_queryset(self):
+        return community_queryset()
+    
     @action(detail=True, methods=['get'])
     def posts(self, request, pk=None):
         """Get the community's posts"""
         community = self.get_object()
-        posts = Post.objects.filter(community=community)
+        posts = post_queryset().filter(community=community)
         serializer = PostListSerializer(posts, many=True)
         return Response(serializer.data)
     
@@ -98,6 +119,14 @@ class PostViewSet(viewsets.ModelViewSet):
     filter_backends = [filters.SearchFilter, DjangoFilterBackend]
     search_fields = ['title', 'content', 'author__username', 'community__name']
     filterset_fields = ['post_type', 'community', 'author']
+    pagination_class = KeysetPagination
+    
+    def get_keyset_ordering(self):
+        """Paginate on the requested feed sort, e.g. ?sort=hot"""
+        return feed_ordering(self.request.query_params.get('sort'))
+    
+    def get_queryset(self):
+        return post_queryset()
     
     def get_serializer_class(self):
         """Return different serializers for list and detail views"""
@@ -109,7 +138,7 @@ class PostViewSet(viewsets.ModelViewSet):
     def comments(self, request, pk=None):
         """Get the post's comments"""
         post = self.get_object()
-        comments = Comment.objects.filter(post=post, parent=None)
+        comments = comment_queryset().filter(post=post, parent=None)
         serializer = CommentSerializer(comments, many=True)
         return Response(serializer.data)
     
@@ -117,27 +146,17 @@ class PostViewSet(viewsets.ModelViewSet):
     def upvote(self, request, pk=None):
         """Upvote the post"""
         post = self.get_object()
-        # Check if user already voted
-        try:
-            vote = Vote.objects.get(user=request.user, post=post)
-            vote.value = 1
-            vote.save()
-        except Vote.DoesNotExist:
-            Vote.objects.create(user=request.user, post=post, value=1)
-        return Response({'status': 'post upvoted'})
+        result = cast_vote(request.user, post, 1, toggle=False)
+        if result.status in ('added', 'changed'):
+            notify_upvote(request.user, post)
+        return Response({'status': 'post upvoted', 'vote_score': result.score})
     
     @action(detail=True, methods=['post'])
     def downvote(self, request, pk=None):
         """Downvote the post"""
         post = self.get_object()
-        # Check if user already voted
-        try:
-            vote = Vote.objects.get(user=request.user, post=post)
-            vote.value = -1
-            vote.save()
-        except Vote.DoesNotExist:
-            Vote.objects.create(user=request.user, post=post, value=-1)
-        return Response({'status': 'post downvoted'})
+        result = cast_vote(request.user, post, -1, toggle=False)
+        return Response({'status': 'post downvoted', 'vote_score': result.score})
 
 
 class CommentViewSet(viewsets.ModelViewSet):
@@ -147,12 +166,16 @@ class CommentViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticatedOrReadOnly, IsAuthorOrReadOnly]
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['post', 'author', 'parent']
+    pagination_class = KeysetPagination
+    
+    def get_queryset(self):
+        return comment_queryset()
     
     @action(detail=True, methods=['get'])
     def replies(self, request, pk=None):
         """Get the comment's replies"""
         comment = self.get_object()
-        replies = Comment.objects.filter(parent=comment)
+        replies = comment_queryset().filter(parent=comment)
         serializer = CommentSerializer(replies, many=True)
         return Response(serializer.data)
     
@@ -160,37 +183,69 @@ class CommentViewSet(viewsets.ModelViewSet):
     def upvote(self, request, pk=None):
         """Upvote the comment"""
         comment = self.get_object()
-        # Check if user already voted
-        try:
-            vote = Vote.objects.get(user=request.user, comment=comment)
-            vote.value = 1
-            vote.save()
-        except Vote.DoesNotExist:
-            Vote.objects.create(user=request.user, comment=comment, value=1)
-        return Response({'status': 'comment upvoted'})
+        result = cast_vote(request.user, comment, 1, toggle=False)
+        if result.status in ('added', 'changed'):
+            notify_upvote(request.user, comment)
+        return Response({'status': 'comment upvoted', 'vote_score': result.score})
     
     @action(detail=True, methods=['post'])
     def downvote(self, request, pk=None):
         """Downvote the comment"""
         comment = self.get_object()
-        # Check if user already voted
-        try:
-            vote = Vote.objects.get(user=request.user, comment=comment)
-            vote.value = -1
-            vote.save()
-        except Vote.DoesNotExist:
-            Vote.objects.create(user=request.user, comment=comment, value=-1)
-        return Response({'status': 'comment downvoted'})
+        result = cast_vote(request.user, comment, -1, toggle=False)
+        return Response({'status': 'comment downvoted', 'vote_score': result.score})
+
+
+class VoteViewSet(viewsets.GenericViewSet):
+    """ViewSet for casting votes in bulk"""
+    serializer_class = BulkVoteSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Cast a batch of votes on posts and comments in one transaction, e.g.
+        votes queued by an offline client. Returns one result per vote.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        votes = serializer.validated_data['votes']
+        operations = [(vote['target'], vote['id'], vote['value']) for vote in votes]
+        results = cast_votes(request.user, operations)
+        
+        # Authors hear about upvotes the batch leaves in place
+        upvoted = set()
+        for key, result in zip(((kind, pk) for kind, pk, _ in operations), results):
+            if result.status in ('added', 'changed') and result.value == 1:
+                upvoted.add(key)
+            elif result.value != 1:
+                upvoted.discard(key)
+        targets = [
+            *Post.objects.filter(pk__in=[pk for kind, pk in upvoted if kind == 'post']),
+            *Comment.objects.select_related('post').filter(pk__in=[pk for kind, pk in upvoted if kind == 'comment']),
+        ]
+        for target in targets:
+            notify_upvote(request.user, target)
+        
+        return Response({'results': [
+            {
+                'target': kind, 'id': pk, 'status': result.status,
+                'value': result.value, 'vote_score': result.score,
+            }
+            for (kind, pk, _), result in zip(operations, results)
+        ]})
 
 
 class NotificationViewSet(viewsets.ReadOnlyModelViewSet):
     """ViewSet for viewing notifications"""
     serializer_class = NotificationSerializer
     permission_classes = [permissions.IsAuthenticated, IsRecipientOrReadOnly]
+    pagination_class = KeysetPagination
     
     def get_queryset(self):
         """Return only the current user's notifications"""
-        return Notification.objects.filter(recipient=self.request.user)
+        return Notification.objects.filter(recipient=self.request.user)\
+            .select_related('recipient', 'sender')
     
     @action(detail=True, methods=['post'])
     def mark_read(self, request, pk=None):
@@ -204,6 +259,7 @@ class NotificationViewSet(viewsets.ReadOnlyModelViewSet):
     def mark_all_read(self, request):
         """Mark all notifications as read"""
         Notification.objects.filter(recipient=request.user, is_read=False).update(is_read=True)
+        invalidate_unread_count(request.user.pk)
         return Response({'status': 'all notifications marked as read'})
 
 
@@ -214,4 +270,4 @@ class PaymentViewSet(viewsets.ReadOnlyModelViewSet):
     
     def get_queryset(self):
         """Return only the current user's payments"""
-        return Payment.objects.filter(user=self.request.user)
\ No newline at end of file
+        return Payment.objects.filter(user=self.request.user).select_related('user')
\ No newline at end of file
@@ -0,0 +1,28 @@
+"""
+Authentication backends that load the user's profile together with the user.
+
+The authentication middleware fetches ``request.user`` through the backend's
+``get_user()``; joining the profile there means templates and the
+``user_profile`` context processor never issue a separate profile query.
+"""
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from allauth.account.auth_backends import AuthenticationBackend
+
+
+class SelectProfileMixin:
+    def get_user(self, user_id):
+        UserModel = get_user_model()
+        try:
+            user = UserModel._default_manager.select_related('profile').get(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        return user if self.user_can_authenticate(user) else None
+
+
+class ProfileModelBackend(SelectProfileMixin, ModelBackend):
+    """ModelBackend that joins the profile when loading the session user"""
+
+
+class ProfileAuthenticationBackend(SelectProfileMixin, AuthenticationBackend):
+    """allauth's backend that joins the profile when loading the session user"""
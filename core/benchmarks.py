@@ -0,0 +1,178 @@
+"""
+Endpoint benchmarks with query-count, latency and allocation budgets.
+
+The main pages and API list endpoints are requested through the test client
+against the busiest rows of the current database, normally a dataset made
+with ``generate_dataset``. Each endpoint is requested once to warm caches,
+then timed over several runs while its queries are counted, then once more
+under tracemalloc for its peak allocation. An endpoint whose worst query
+count, p95 latency or peak allocation exceeds its budget is a regression.
+"""
+import math
+import time
+import tracemalloc
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .models import Community, Post, Comment
+
+
+# name: (max queries, max p95 milliseconds, max peak allocation in KiB).
+# Query budgets sit below the page sizes, so an N+1 query pattern on a list
+# breaks them however small the dataset is.
+ENDPOINT_BUDGETS = {
+    'home': (8, 300, 16384),
+    'post_detail': (15, 400, 32768),
+    'comment_thread': (12, 300, 16384),
+    'community_detail': (15, 300, 16384),
+    'profile': (15, 300, 16384),
+    'advanced_search': (15, 400, 16384),
+    'api_posts': (8, 200, 8192),
+    'api_comments': (8, 200, 8192),
+    'api_communities': (8, 200, 8192),
+    'api_users': (8, 200, 8192),
+    'api_profiles': (8, 200, 8192),
+    'api_notifications': (8, 200, 8192),
+}
+
+# Instrumentation that would be measured along with the endpoints
+EXCLUDED_MIDDLEWARE = (
+    'debug_toolbar.middleware.DebugToolbarMiddleware',
+    'core.profiling.ProfilingMiddleware',
+)
+
+
+class BenchmarkError(Exception):
+    """Raised when an endpoint does not respond with a 200"""
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(pct / 100 * len(ordered)) - 1, 0)]
+
+
+class EndpointResult:
+    """
+    Measurements of one endpoint.
+
+    Attributes:
+        queries: Most queries made by one request
+        timings: Milliseconds taken by each timed request
+        peak_kb: Peak memory allocated while serving one request, in KiB
+    """
+
+    def __init__(self, name, url, queries, timings, peak_kb):
+        self.name = name
+        self.url = url
+        self.queries = queries
+        self.timings = timings
+        self.peak_kb = peak_kb
+
+    @property
+    def p50(self):
+        return percentile(self.timings, 50)
+
+    @property
+    def p95(self):
+        return percentile(self.timings, 95)
+
+    def regressions(self, budget, latency=True):
+        """Descriptions of the budgets this result exceeds"""
+        max_queries, max_p95, max_peak_kb = budget
+        exceeded = []
+        if self.queries > max_queries:
+            exceeded.append(f'{self.queries} queries > {max_queries}')
+        if latency and self.p95 > max_p95:
+            exceeded.append(f'p95 {self.p95:.1f} ms > {max_p95} ms')
+        if latency and self.peak_kb > max_peak_kb:
+            exceeded.append(f'peak {self.peak_kb:.0f} KiB > {max_peak_kb} KiB')
+        return exceeded
+
+    def as_dict(self):
+        return {
+            'url': self.url, 'queries': self.queries, 'p50_ms': round(self.p50, 2),
+            'p95_ms': round(self.p95, 2), 'peak_kb': round(self.peak_kb),
+        }
+
+
+def endpoint_urls():
+    """
+    Return ``(user, {name: url})``: the endpoints to benchmark, pointed at
+    the busiest post, thread and community, and the user to request them as
+    """
+    post = Post.objects.order_by('-comment_count', 'pk').select_related('author').first()
+    if post is None:
+        return None, {}
+    thread = Comment.objects.filter(post=post, parent=None).order_by(F('lft') - F('rght'), 'pk').first()
+    community = Community.objects.order_by('-post_count', 'pk').first()
+    query = ' '.join(post.title.split()[:2])
+
+    urls = {
+        'home': reverse('home'),
+        'post_detail': reverse('post_detail', args=[post.pk]),
+        'comment_thread': reverse('comment_thread', args=[thread.pk]) if thread else None,
+        'community_detail': reverse('community_detail', args=[community.pk]),
+        'profile': reverse('profile', args=[post.author.username]),
+        'advanced_search': f'{reverse("advanced_search")}?{urlencode({"q": query})}',
+        'api_posts': reverse('post-list'),
+        'api_comments': reverse('comment-list'),
+        'api_communities': reverse('community-list'),
+        'api_users': reverse('user-list'),
+        'api_profiles': reverse('profile-list'),
+        'api_notifications': reverse('notification-list'),
+    }
+    return post.author, {name: url for name, url in urls.items() if url}
+
+
+def measure(client, name, url, repeat):
+    """Request an endpoint ``repeat`` times and return an EndpointResult"""
+    def get():
+        response = client.get(url)
+        if response.status_code != 200:
+            raise BenchmarkError(f'{name}: GET {url} returned {response.status_code}')
+
+    # Warm up caches and lazy imports
+    get()
+
+    queries = 0
+    timings = []
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            get()
+            timings.append((time.perf_counter() - started) * 1000)
+        queries = max(queries, len(captured))
+
+    # Tracing slows every allocation down, so it gets a run of its own
+    tracemalloc.start()
+    try:
+        get()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return EndpointResult(name, url, queries, timings, peak / 1024)
+
+
+def run_benchmarks(names=None, repeat=20, user=None):
+    """
+    Benchmark the named endpoints (default: all of them), logged in as
+    ``user`` (default: the author of the busiest post)
+    """
+    default_user, urls = endpoint_urls()
+    client = Client()
+    client.force_login(user or default_user)
+    middleware = [path for path in settings.MIDDLEWARE if path not in EXCLUDED_MIDDLEWARE]
+    with override_settings(MIDDLEWARE=middleware):
+        return [
+            measure(client, name, url, repeat)
+            for name, url in urls.items()
+            if names is None or name in names
+        ]
@@ -0,0 +1,78 @@
+"""
+Shared-cache helpers.
+
+``invalidated_update`` and ``invalidate_model_cache`` keep cacheops' query
+cache correct for writes it cannot see: ``QuerySet.update()`` and
+``bulk_update()`` bypass the model signals cacheops invalidates on.
+
+``get_or_refresh`` implements stale-while-revalidate: a cached value is served
+for ``timeout`` seconds, after which the first request to see it stale
+recomputes it in a background thread while every request, including that
+one, keeps getting the stale copy. Only a cold cache makes a request wait
+for the computation.
+"""
+import logging
+import threading
+import time
+
+from django.apps import apps
+from django.core.cache import cache
+from django.db import connections
+
+
+logger = logging.getLogger(__name__)
+
+# How long a stale value may still be served while it is being refreshed
+STALE_GRACE_SECONDS = 60 * 60
+# A refresh that takes longer than this is assumed dead and may be retried
+REFRESH_LOCK_SECONDS = 60
+
+
+def _store(key, value, timeout):
+    cache.set(key, (value, time.time() + timeout), timeout + STALE_GRACE_SECONDS)
+
+
+def _refresh(key, compute, timeout):
+    try:
+        _store(key, compute(), timeout)
+    except Exception:
+        logger.exception('Background refresh of %s failed', key)
+    finally:
+        cache.delete(f'{key}:refreshing')
+        # The thread opened its own connections; don't leak them
+        connections.close_all()
+
+
+def get_or_refresh(key, compute, timeout):
+    """
+    Return the cached result of ``compute()``, refreshing it in the background
+    once it is older than ``timeout`` seconds.
+    """
+    entry = cache.get(key)
+    if entry is None:
+        value = compute()
+        _store(key, value, timeout)
+        return value
+
+    value, fresh_until = entry
+    # cache.add() succeeds for exactly one process, so only one refresh runs
+    if time.time() >= fresh_until and cache.add(f'{key}:refreshing', True, REFRESH_LOCK_SECONDS):
+        threading.Thread(target=_refresh, args=(key, compute, timeout), daemon=True).start()
+    return value
+
+
+def invalidated_update(queryset, **changes):
+    """
+    ``queryset.update(**changes)`` that also drops the cached queries the
+    updated rows appear in when cacheops is active.
+    """
+    if hasattr(queryset, 'invalidated_update'):
+        return queryset.invalidated_update(**changes)
+    return queryset.update(**changes)
+
+
+def invalidate_model_cache(model):
+    """Drop every cached query of a model, e.g. after a bulk_update()"""
+    if apps.is_installed('cacheops'):
+        from cacheops import invalidate_model
+        invalidate_model(model)
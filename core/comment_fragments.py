@@ -0,0 +1,158 @@
+"""
+Cached rendering of comment threads.
+
+A thread (a comment and the replies under it) is rendered once and stored in
+the shared cache under the comment's id and the version of its MPTT tree.
+The version is bumped whenever a comment of the tree is saved or deleted or
+one of its comments is voted on. Readers then look for fragments under the new
+version and the old ones simply expire.
+
+The cached HTML is the same for every viewer. The parts that depend on the
+viewer are holes (see core.holes), filled in per request: the viewer's votes,
+the CSRF token and the return path of the login link. Only whether the viewer
+is logged in changes the markup, so it is part of the cache key.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.template.loader import render_to_string
+
+from .comment_tree import COMMENTS_PER_PAGE, load_comment_subtree, load_trees
+from .holes import fill, fill_many, placeholder
+from .models import Comment
+
+
+# Bounds how stale the relative dates and author badges in a fragment get
+FRAGMENT_TIMEOUT = 5 * 60
+
+THREAD_TEMPLATE = 'core/includes/comments/comment_thread_component.html'
+
+
+class PendingVotes:
+    """Stands in for the viewer's votes while a cacheable fragment is rendered"""
+
+
+def vote_placeholder(object_id, value):
+    """Placeholder for the class of a vote button, 'active' once filled in"""
+    return placeholder('comment_vote', object_id, value)
+
+
+class _Viewer:
+    # The only attribute of the viewer the thread templates look at
+    def __init__(self, is_authenticated):
+        self.is_authenticated = is_authenticated
+
+
+def _version_key(tree_id):
+    return f'comment_tree:version:{tree_id}'
+
+
+def tree_versions(tree_ids):
+    """Return ``{tree_id: version}`` of comment trees"""
+    keys = {tree_id: _version_key(tree_id) for tree_id in tree_ids}
+    values = cache.get_many(keys.values())
+    for key in keys.values():
+        if key not in values:
+            # Starting from the clock means an evicted version never comes
+            # back with a value older fragments were stored under
+            cache.add(key, time.time_ns(), None)
+            values[key] = cache.get(key)
+    return {tree_id: values[key] for tree_id, key in keys.items()}
+
+
+def _bump(tree_ids):
+    for tree_id in tree_ids:
+        try:
+            cache.incr(_version_key(tree_id))
+        except ValueError:
+            cache.add(_version_key(tree_id), time.time_ns(), None)
+
+
+def invalidate_trees(tree_ids):
+    """
+    Start new versions of comment trees, now and again once the transaction
+    commits: a thread rendered from uncommitted rows in between is never read.
+    """
+    tree_ids = [tree_id for tree_id in set(tree_ids) if tree_id is not None]
+    _bump(tree_ids)
+    transaction.on_commit(lambda: _bump(tree_ids))
+
+
+def _fragment_key(comment_id, version, authenticated, max_depth):
+    return f'comment_fragment:{comment_id}:{version}:{int(authenticated)}:{max_depth}'
+
+
+def render_fragment(root, authenticated):
+    """Render the thread under a loaded root comment for any viewer"""
+    return render_to_string(THREAD_TEMPLATE, {
+        'comment': root,
+        'user_comment_votes': PendingVotes(),
+        'user': _Viewer(authenticated),
+        'request': {'path': placeholder('path')},
+        'csrf_token': placeholder('csrf_token'),
+    })
+
+
+class ThreadPage:
+    """
+    A page of rendered comment threads.
+
+    Attributes:
+        threads: HTML of each thread, ready for the template
+        page: The page of root comments that was rendered (1-based)
+        has_next: Whether there are more root comments after this page
+    """
+
+    def __init__(self, threads, page=1, has_next=False):
+        self.threads = threads
+        self.page = page
+        self.has_next = has_next
+
+
+def render_post_threads(request, post, page=1, per_page=COMMENTS_PER_PAGE):
+    """
+    Render a page of a post's comment threads, oldest first. Only the trees
+    without a fragment for their current version are loaded from the database.
+    """
+    try:
+        page = max(1, int(page))
+    except (TypeError, ValueError):
+        page = 1
+    offset = (page - 1) * per_page
+    roots = list(
+        Comment.objects.filter(post=post, parent=None).order_by('created_at', 'pk')
+        .values_list('pk', 'tree_id')[offset:offset + per_page + 1]
+    )
+    has_next = len(roots) > per_page
+    roots = roots[:per_page]
+    tree_ids = [tree_id for _, tree_id in roots]
+
+    authenticated = request.user.is_authenticated
+    versions = tree_versions(tree_ids)
+    keys = {pk: _fragment_key(pk, versions[tree_id], authenticated, None) for pk, tree_id in roots}
+    fragments = cache.get_many(keys.values())
+
+    missing = [tree_id for pk, tree_id in roots if keys[pk] not in fragments]
+    if missing:
+        rendered = {keys[root.pk]: render_fragment(root, authenticated) for root in load_trees(post, missing)}
+        cache.set_many(rendered, FRAGMENT_TIMEOUT)
+        fragments.update(rendered)
+
+    # One pass over all threads, so the viewer's votes take one query
+    threads = fill_many([fragments[keys[pk]] for pk, _ in roots if keys[pk] in fragments], request)
+    return ThreadPage(threads, page=page, has_next=has_next)
+
+
+def render_comment_thread(request, comment, max_depth=None):
+    """
+    Render the thread under a comment, down to ``max_depth`` levels below it
+    """
+    authenticated = request.user.is_authenticated
+    version = tree_versions([comment.tree_id])[comment.tree_id]
+    key = _fragment_key(comment.pk, version, authenticated, max_depth)
+    html = cache.get(key)
+    if html is None:
+        html = render_fragment(load_comment_subtree(comment, max_depth=max_depth).roots[0], authenticated)
+        cache.set(key, html, FRAGMENT_TIMEOUT)
+    return fill(html, request)
@@ -0,0 +1,169 @@
+"""
+Single-query loading of MPTT comment trees.
+
+Instead of walking a thread one level at a time, the loaders below fetch a
+whole subtree with one ``tree_id``/``lft`` range scan, build the nested
+structure in memory and attach the viewer's votes from one bulk query.
+"""
+from .models import Comment, Vote
+
+
+# Default number of root comments shown per page on a post
+COMMENTS_PER_PAGE = 50
+
+
+class CommentTree:
+    """
+    Result of loading a comment tree.
+
+    Attributes:
+        roots: Top-level comments, each with ``child_comments`` populated
+        user_votes: Dictionary mapping comment ids to the viewer's vote value
+        page: The page of root comments that was loaded (1-based)
+        has_next: Whether there are more root comments after this page
+    """
+
+    def __init__(self, roots, user_votes, page=1, has_next=False):
+        self.roots = roots
+        self.user_votes = user_votes
+        self.page = page
+        self.has_next = has_next
+
+    def __iter__(self):
+        return iter(self.roots)
+
+    def __len__(self):
+        return len(self.roots)
+
+
+def _comment_queryset():
+    # Authors and profiles are rendered next to every comment
+    return Comment.objects.select_related('author', 'author__profile')
+
+
+def _get_user_votes(user, comment_ids):
+    """Return a dictionary of the user's votes on the given comments"""
+    if not comment_ids or user is None or not user.is_authenticated:
+        return {}
+
+    return dict(
+        Vote.objects.filter(user=user, comment_id__in=comment_ids)
+        .values_list('comment_id', 'value')
+    )
+
+
+def _build_tree(nodes, user_votes, root_level, max_depth=None):
+    """
+    Link a flat list of comments (in tree_id, lft order) into nested trees.
+
+    Every node gets ``child_comments``, ``depth``, ``user_vote`` and
+    ``has_more`` attributes. MPTT's child cache is filled as well so that
+    ``get_children()`` in templates does not hit the database. Each root also
+    gets a flat ``descendants`` list in tree order for ``recursetree``.
+    """
+    roots = []
+    path = []
+
+    for node in nodes:
+        node.child_comments = []
+        node._cached_children = node.child_comments
+        node.descendants = []
+        node.depth = node.level - root_level
+        node.user_vote = user_votes.get(node.pk)
+        # Nodes on the depth limit may have replies that were not loaded
+        node.has_more = (
+            max_depth is not None
+            and node.depth >= max_depth
+            and node.rght - node.lft > 1
+        )
+
+        while len(path) > node.depth:
+            path.pop()
+
+        if path:
+            parent = path[-1]
+            parent.child_comments.append(node)
+            path[0].descendants.append(node)
+        else:
+            roots.append(node)
+
+        path.append(node)
+
+    return roots
+
+
+def load_post_comments(post, user=None, max_depth=None, page=1, per_page=None):
+    """
+    Load the comment trees of a post.
+
+    Root comments are ordered by creation time and optionally paginated with
+    ``page``/``per_page``. Each root comment starts its own MPTT tree, so the
+    selected trees are loaded with a single ``tree_id``/``lft`` ordered scan.
+    ``max_depth`` limits how many levels below the root comments are loaded.
+    """
+    try:
+        page = max(1, int(page))
+    except (TypeError, ValueError):
+        page = 1
+    queryset = _comment_queryset().filter(post=post)
+
+    has_next = False
+    if per_page:
+        offset = (page - 1) * per_page
+        tree_ids = list(
+            Comment.objects.filter(post=post, parent=None)
+            .order_by('created_at')
+            .values_list('tree_id', flat=True)[offset:offset + per_page + 1]
+        )
+        has_next = len(tree_ids) > per_page
+        queryset = queryset.filter(tree_id__in=tree_ids[:per_page])
+
+    if max_depth is not None:
+        queryset = queryset.filter(level__lte=max_depth)
+
+    nodes = list(queryset.order_by('tree_id', 'lft'))
+    for node in nodes:
+        node.post = post
+    user_votes = _get_user_votes(user, [node.pk for node in nodes])
+    roots = _build_tree(nodes, user_votes, root_level=0, max_depth=max_depth)
+
+    # Trees are stored by tree_id, but threads are shown oldest first
+    roots.sort(key=lambda node: (node.created_at, node.pk))
+
+    return CommentTree(roots, user_votes, page=page, has_next=has_next)
+
+
+def load_trees(post, tree_ids):
+    """
+    Load whole comment trees of a post by tree id, without votes. Returns
+    the root comments.
+    """
+    nodes = list(_comment_queryset().filter(post=post, tree_id__in=tree_ids).order_by('tree_id', 'lft'))
+    for node in nodes:
+        node.post = post
+    return _build_tree(nodes, {}, root_level=0)
+
+
+def load_comment_subtree(comment, user=None, max_depth=None):
+    """
+    Load a comment and its replies with one ``tree_id``/``lft`` range scan.
+
+    Returns a ``CommentTree`` whose only root is a fresh copy of ``comment``.
+    """
+    queryset = _comment_queryset().filter(
+        tree_id=comment.tree_id,
+        lft__gte=comment.lft,
+        rght__lte=comment.rght,
+    )
+
+    if max_depth is not None:
+        queryset = queryset.filter(level__lte=comment.level + max_depth)
+
+    nodes = list(queryset.order_by('lft'))
+    post = comment.post
+    for node in nodes:
+        node.post = post
+    user_votes = _get_user_votes(user, [node.pk for node in nodes])
+    roots = _build_tree(nodes, user_votes, root_level=comment.level, max_depth=max_depth)
+
+    return CommentTree(roots, user_votes)
@@ -0,0 +1,65 @@
+"""
+Repair of the denormalized comment, post and member counters.
+
+The counters are maintained incrementally by signals in core.models; the
+functions here recompute them in bulk when they have drifted, for example
+after raw SQL, bulk_create or cascading user deletions.
+"""
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .caching import invalidate_model_cache
+
+
+def count_subquery(queryset, field):
+    """
+    Count rows of queryset whose field points at the outer row.
+    Separate subqueries avoid the row explosion of several joined Count()s.
+    """
+    counts = queryset.filter(**{field: OuterRef('pk')}).order_by()\
+        .values(field).annotate(count=Count('*')).values('count')
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def _pk_ranges(queryset, chunk_size):
+    """Yield (first, last) primary keys of consecutive chunks of a table"""
+    last_pk = None
+    while True:
+        chunk = queryset.order_by('pk')
+        if last_pk is not None:
+            chunk = chunk.filter(pk__gt=last_pk)
+        pks = list(chunk.values_list('pk', flat=True)[:chunk_size])
+        if not pks:
+            return
+        yield pks[0], pks[-1]
+        last_pk = pks[-1]
+
+
+def reconcile_counters(Post, Comment, Community, chunk_size=1000):
+    """
+    Recompute the counters with one UPDATE per chunk of rows.
+
+    The models are passed in so the function also works with historical
+    models inside migrations. Returns the number of rows that had drifted.
+    """
+    targets = [
+        (Post, 'comment_count', lambda: count_subquery(Comment.objects.all(), 'post')),
+        (Community, 'post_count', lambda: count_subquery(Post.objects.all(), 'community')),
+        (Community, 'member_count', lambda: count_subquery(Community.members.through.objects.all(), 'community')),
+    ]
+
+    fixed = 0
+    for model, field, actual in targets:
+        drifted = 0
+        for first, last in _pk_ranges(model.objects.all(), chunk_size):
+            # Only rows whose stored value differs are written
+            drifted += model.objects.filter(pk__gte=first, pk__lte=last)\
+                .alias(actual=actual())\
+                .exclude(**{field: F('actual')})\
+                .update(**{field: actual()})
+        if drifted:
+            # Bulk updates bypass the query cache invalidation
+            invalidate_model_cache(model)
+        fixed += drifted
+
+    return fixed
@@ -0,0 +1,325 @@
+"""
+Deterministic synthetic datasets for load and regression testing.
+
+Rows are written with ``bulk_create`` in batches and explicit primary keys,
+so relations are wired up without reading anything back. Comment trees get
+their MPTT fields (tree_id, lft, rght, level) computed in memory, as
+``TreeManager.build_tree_nodes`` does, with each root comment starting its
+own tree. Popularity follows a power law: a few users, communities and posts
+get most of the activity.
+
+Bulk inserts send no signals, so denormalized counters, ranking scores and
+karma are left for the ``generate_dataset`` command to recompute with the
+existing reconcile commands, and the search index for rebuild_search_index.
+The same seed on the same starting database produces the same rows.
+"""
+import contextlib
+import random
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+from itertools import accumulate, islice
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.color import no_style
+from django.db import connection
+from django.db.models import Max
+from taggit.models import Tag, TaggedItem
+
+from .caching import invalidate_model_cache
+from .models import Profile, Community, Post, Comment, Vote, Notification
+
+
+# Generated timestamps end here unless told otherwise, so that a seed
+# always produces the same rows
+DATASET_END = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+
+WORDS = (
+    'python django database query index cache latency thread comment vote post community '
+    'garden coffee music travel photo science space history football climate bicycle recipe '
+    'startup design privacy linux keyboard camera weekend library budget question answer idea '
+    'review release bug feature benchmark tutorial guide opinion news update discussion'
+).split()
+
+
+@contextlib.contextmanager
+def explicit_timestamps(*models):
+    """Let bulk_create keep the values given to auto_now_add fields"""
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now_add', False)
+    ]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def _number_tree(root, children, tree_id):
+    """Set the MPTT fields of an in-memory comment tree, children in creation order"""
+    cursor = 1
+
+    def visit(node, level):
+        nonlocal cursor
+        node.tree_id, node.level, node.lft = tree_id, level, cursor
+        cursor += 1
+        for child in children.get(node.pk, ()):
+            visit(child, level + 1)
+        node.rght = cursor
+        cursor += 1
+
+    visit(root, 0)
+
+
+class DatasetGenerator:
+    """
+    Generates one kind of row per method, in dependency order: users,
+    communities, tags, posts, comments, votes, notifications.
+    """
+
+    def __init__(self, seed=0, batch_size=5000, end=DATASET_END, days=365, log=None):
+        self.random = random.Random(seed)
+        self.batch_size = batch_size
+        self.end = end
+        self.span = days * 24 * 60 * 60
+        self.log = log or (lambda message: None)
+        self.password = make_password('password')
+
+        self.user_ids = []
+        self.community_ids = []
+        self.tag_ids = []
+        self.post_rows = {}  # id -> (author_id, created_at)
+        self.comment_rows = {}  # id -> (post_id, parent_id, author_id, created_at)
+
+    # Helpers
+
+    @staticmethod
+    def _next_id(model):
+        return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+    def _insert(self, model, objects):
+        """bulk_create an iterable of objects in batches and return how many there were"""
+        started = time.monotonic()
+        objects = iter(objects)
+        total = 0
+        while True:
+            batch = list(islice(objects, self.batch_size))
+            if not batch:
+                break
+            model.objects.bulk_create(batch)
+            total += len(batch)
+        elapsed = time.monotonic() - started
+        self.log(f'  {total} {model._meta.verbose_name_plural} in {elapsed:.1f}s ({total / max(elapsed, 1e-6):.0f}/s)')
+        return total
+
+    def _timestamp(self, after=None):
+        """A random time in the dataset period, after ``after`` if given"""
+        start = after or self.end - timedelta(seconds=self.span)
+        seconds = (self.end - start).total_seconds()
+        return start + timedelta(seconds=self.random.uniform(0, max(seconds, 0)))
+
+    def _text(self, low, high):
+        return ' '.join(self.random.choices(WORDS, k=self.random.randint(low, high)))
+
+    def _popularity(self, count):
+        """Cumulative power-law weights for ``count`` items in a random order"""
+        weights = [1 / (rank + 1) ** 0.9 for rank in range(count)]
+        self.random.shuffle(weights)
+        return list(accumulate(weights))
+
+    def _pick(self, items, cum_weights, k=1):
+        return self.random.choices(items, cum_weights=cum_weights, k=k)
+
+    # Rows
+
+    def users(self, count):
+        start = self._next_id(User)
+        self.user_ids = list(range(start, start + count))
+        joined = {pk: self._timestamp() for pk in self.user_ids}
+        self._insert(User, (
+            User(
+                id=pk, username=f'user{pk}', email=f'user{pk}@example.com',
+                password=self.password, date_joined=joined[pk],
+            )
+            for pk in self.user_ids
+        ))
+        self._insert(Profile, (
+            Profile(user_id=pk, bio=self._text(0, 20), display_name=f'User {pk}')
+            for pk in self.user_ids
+        ))
+        self.user_weights = self._popularity(count)
+
+    def communities(self, count, memberships_per_user=5):
+        start = self._next_id(Community)
+        self.community_ids = list(range(start, start + count))
+        with explicit_timestamps(Community):
+            self._insert(Community, (
+                Community(id=pk, name=f'community{pk}', description=self._text(5, 30), created_at=self._timestamp())
+                for pk in self.community_ids
+            ))
+        self.community_weights = self._popularity(count)
+
+        Membership = Community.members.through
+        memberships = (
+            Membership(community_id=community_id, user_id=user_id)
+            for user_id in self.user_ids
+            for community_id in set(self._pick(
+                self.community_ids, self.community_weights, self.random.randint(0, memberships_per_user)
+            ))
+        )
+        self._insert(Membership, memberships)
+
+    def tags(self, count):
+        start = self._next_id(Tag)
+        self.tag_ids = list(range(start, start + count))
+        names = {pk: f'{self.random.choice(WORDS)}-{pk}' for pk in self.tag_ids}
+        self._insert(Tag, (Tag(id=pk, name=name, slug=name) for pk, name in names.items()))
+        self.tag_weights = self._popularity(count)
+
+    def posts(self, count, max_tags=4):
+        start = self._next_id(Post)
+        post_ids = range(start, start + count)
+        communities = self._pick(self.community_ids, self.community_weights, count)
+        authors = self._pick(self.user_ids, self.user_weights, count)
+
+        def build():
+            for pk, community_id, author_id in zip(post_ids, communities, authors):
+                created_at = self._timestamp()
+                self.post_rows[pk] = (author_id, created_at)
+                is_link = self.random.random() < 0.15
+                yield Post(
+                    id=pk, title=self._text(3, 12).capitalize()[:200],
+                    content=None if is_link else self._text(10, 150),
+                    url=f'https://example.com/{pk}' if is_link else None,
+                    post_type='link' if is_link else 'text',
+                    created_at=created_at, author_id=author_id, community_id=community_id,
+                )
+
+        with explicit_timestamps(Post):
+            self._insert(Post, build())
+
+        self.post_weights = self._popularity(count)
+        if self.tag_ids:
+            content_type = ContentType.objects.get_for_model(Post)
+            self._insert(TaggedItem, (
+                TaggedItem(content_type=content_type, object_id=pk, tag_id=tag_id)
+                for pk in post_ids
+                for tag_id in set(self._pick(self.tag_ids, self.tag_weights, self.random.randint(0, max_tags)))
+            ))
+
+    def comments(self, count, max_depth=8, root_share=0.3):
+        """
+        Comment trees: every comment either starts a thread or answers an
+        earlier comment on the same post, most often one of the latest so
+        that conversations run deep.
+        """
+        next_id = self._next_id(Comment)
+        next_tree_id = (Comment.objects.aggregate(last=Max('tree_id'))['last'] or 0) + 1
+        post_ids = list(self.post_rows)
+        per_post = Counter(self._pick(post_ids, self.post_weights, count))
+
+        def build():
+            nonlocal next_id, next_tree_id
+            for post_id in post_ids:
+                nodes = []
+                roots = []
+                children = {}
+                created_at = self.post_rows[post_id][1]
+                for _ in range(per_post[post_id]):
+                    created_at = self._timestamp(after=created_at)
+                    candidates = [node for node in nodes[-5:] if node.level_hint < max_depth]
+                    if not candidates or self.random.random() < root_share:
+                        parent = None
+                    elif self.random.random() < 0.7:
+                        parent = self.random.choice(candidates)
+                    else:
+                        parent = self.random.choice(nodes)
+                        if parent.level_hint >= max_depth:
+                            parent = None
+                    node = Comment(
+                        id=next_id, post_id=post_id, parent_id=parent.pk if parent else None,
+                        author_id=self._pick(self.user_ids, self.user_weights)[0],
+                        content=self._text(3, 80), created_at=created_at,
+                    )
+                    node.level_hint = parent.level_hint + 1 if parent else 0
+                    next_id += 1
+                    nodes.append(node)
+                    if parent:
+                        children.setdefault(parent.pk, []).append(node)
+                    else:
+                        roots.append(node)
+                    self.comment_rows[node.pk] = (post_id, node.parent_id, node.author_id, created_at)
+                for root in roots:
+                    _number_tree(root, children, next_tree_id)
+                    next_tree_id += 1
+                yield from nodes
+
+        with explicit_timestamps(Comment):
+            self._insert(Comment, build())
+
+    def votes(self, count, post_share=0.4, upvote_share=0.75):
+        """Votes concentrate on popular targets; a user votes on a target at most once"""
+        def build(targets, cum_weights, total, field):
+            ids = list(targets)
+            tallies = Counter(self._pick(ids, cum_weights, total))
+            for target_id in ids:
+                voters = self.random.sample(self.user_ids, min(tallies[target_id], len(self.user_ids)))
+                author_id, created_at = targets[target_id][-2:]
+                for user_id in voters:
+                    if user_id == author_id:
+                        continue
+                    yield Vote(
+                        user_id=user_id, value=1 if self.random.random() < upvote_share else -1,
+                        created_at=self._timestamp(after=created_at), **{field: target_id},
+                    )
+
+        post_votes = int(count * post_share) if self.comment_rows else count
+        self._insert(Vote, build(self.post_rows, self.post_weights, post_votes, 'post_id'))
+        if self.comment_rows:
+            comment_weights = self._popularity(len(self.comment_rows))
+            self._insert(Vote, build(self.comment_rows, comment_weights, count - post_votes, 'comment_id'))
+
+    def notifications(self, count, read_share=0.7):
+        """Reply, mention and vote notifications about generated comments"""
+        comment_ids = list(self.comment_rows)
+        if not comment_ids:
+            return
+
+        def build():
+            for comment_id in self.random.choices(comment_ids, k=count):
+                post_id, parent_id, sender_id, created_at = self.comment_rows[comment_id]
+                kind = self.random.choice(('reply', 'mention', 'vote'))
+                if kind == 'reply':
+                    recipient_id = self.comment_rows[parent_id][2] if parent_id else self.post_rows[post_id][0]
+                    text = f'user{sender_id} replied to your comment'
+                elif kind == 'mention':
+                    recipient_id = self.random.choice(self.user_ids)
+                    text = f'user{sender_id} mentioned you in a comment'
+                else:
+                    # The voter sends it to the comment's author
+                    recipient_id, sender_id = sender_id, self.random.choice(self.user_ids)
+                    text = f'user{sender_id} upvoted your comment'
+                if recipient_id == sender_id:
+                    continue
+                yield Notification(
+                    recipient_id=recipient_id, sender_id=sender_id, notification_type=kind,
+                    post_id=post_id, comment_id=comment_id, text=text,
+                    created_at=self._timestamp(after=created_at),
+                    is_read=self.random.random() < read_share,
+                )
+
+        self._insert(Notification, build())
+
+    def finish(self):
+        """Move sequences past the explicit ids and drop cached queries of the filled tables"""
+        models = [User, Community, Tag, Post, Comment]
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), models):
+                cursor.execute(sql)
+        for model in models + [Profile, Vote, Notification]:
+            invalidate_model_cache(model)
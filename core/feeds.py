@@ -0,0 +1,345 @@
+"""
+Materialized post feeds.
+
+The first FEED_LENGTH post ids of the 'new', 'hot' and 'top' feeds, for the
+whole site and for each community, are kept in sorted sets: Redis sorted
+sets in production, a process-local store in development and tests. A page
+of a feed is then a range read from the set and one ``in_bulk`` query for
+the posts on it, instead of an ordered scan of the post indexes.
+
+The sets are kept up to date incrementally: new posts are added, deleted
+posts removed and posts re-scored as votes come in, once the transaction
+commits. A feed missing from the store, because it was never read, was
+evicted or was invalidated with ``invalidate_feeds`` after a bulk change, is
+rebuilt from the database on its next read. Pages past the end of a full set
+continue from the database with keyset pagination, and cursors are the same
+as those of ``core.pagination``, so a reader never notices the switch.
+
+The other feed sorts, and every feed when FEED_STORE is unset, are served
+with keyset pagination on the post indexes as before.
+"""
+import functools
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Post
+from .pagination import CursorPage, InvalidCursor, decode_cursor, encode_cursor, keyset_filter, paginate_by_cursor
+from .ranking import feed_ordering
+
+
+MATERIALIZED_SORTS = ('new', 'hot', 'top')
+
+# Post field each materialized feed is sorted on
+SCORE_FIELDS = {'new': 'created_at', 'hot': 'hot_score', 'top': 'top_score'}
+
+
+def feed_length():
+    return getattr(settings, 'FEED_LENGTH', 1000)
+
+
+def _key(sort, community_id=None):
+    return f'feed:{sort}:{"all" if community_id is None else community_id}'
+
+
+def _score(sort, value):
+    # Creation times are stored as POSIX timestamps
+    return value.timestamp() if sort == 'new' else float(value)
+
+
+class FeedStore:
+    """
+    Sorted sets of post ids, highest score first and ids descending between
+    equal scores, the order of ``feed_ordering``
+    """
+
+    def is_built(self, key):
+        """Whether the set was built and can be read"""
+        raise NotImplementedError
+
+    def replace(self, key, entries):
+        """Replace the set with ``{post_id: score}`` and mark it built"""
+        raise NotImplementedError
+
+    def upsert(self, keys, post_id, score):
+        """Add or re-score a post in each set, keeping the FEED_LENGTH best"""
+        raise NotImplementedError
+
+    def upsert_many(self, post_id, scores):
+        """
+        Add or re-score a post in many sets, with a score for each as
+        ``{key: score}``. Sets that were not built are left alone.
+        """
+        raise NotImplementedError
+
+    def remove(self, keys, post_id):
+        """Remove a post from each set"""
+        raise NotImplementedError
+
+    def delete(self, keys):
+        """Forget sets, so that they are rebuilt on their next read"""
+        raise NotImplementedError
+
+    def length(self, key):
+        raise NotImplementedError
+
+    def page(self, key, after, count):
+        """
+        Up to ``count`` ``(post_id, score)`` pairs following the
+        ``(score, post_id)`` position ``after``, or from the top
+        """
+        raise NotImplementedError
+
+    def clear(self):
+        """Forget every set, so that each is rebuilt on its next read"""
+        raise NotImplementedError
+
+
+class MemoryFeedStore(FeedStore):
+    """A store local to the process, for development and tests"""
+
+    def __init__(self):
+        self.sets = {}
+
+    def is_built(self, key):
+        return key in self.sets
+
+    def replace(self, key, entries):
+        self.sets[key] = dict(entries)
+
+    def upsert(self, keys, post_id, score):
+        for key in keys:
+            entries = self.sets.get(key)
+            if entries is None:
+                # Built with the post on its first read
+                continue
+            entries[post_id] = score
+            if len(entries) > feed_length():
+                del entries[min(entries, key=lambda pk: (entries[pk], pk))]
+
+    def upsert_many(self, post_id, scores):
+        for key, score in scores.items():
+            self.upsert([key], post_id, score)
+
+    def remove(self, keys, post_id):
+        for key in keys:
+            self.sets.get(key, {}).pop(post_id, None)
+
+    def delete(self, keys):
+        for key in keys:
+            self.sets.pop(key, None)
+
+    def length(self, key):
+        return len(self.sets.get(key, ()))
+
+    def page(self, key, after, count):
+        entries = sorted(self.sets.get(key, {}).items(), key=lambda entry: (entry[1], entry[0]), reverse=True)
+        if after is not None:
+            entries = [(pk, score) for pk, score in entries if (score, pk) < after]
+        return entries[:count]
+
+    def clear(self):
+        self.sets.clear()
+
+
+class RedisFeedStore(FeedStore):
+    """
+    Redis sorted sets. Members are zero-padded ids, so that Redis's reverse
+    lexicographic order between equal scores is descending id order.
+    """
+
+    def __init__(self, url):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+
+    @staticmethod
+    def _member(post_id):
+        return f'{post_id:012d}'
+
+    def is_built(self, key):
+        return bool(self.client.exists(f'{key}:built'))
+
+    def replace(self, key, entries):
+        with self.client.pipeline() as pipe:
+            pipe.delete(key)
+            if entries:
+                pipe.zadd(key, {self._member(pk): score for pk, score in entries.items()})
+            pipe.set(f'{key}:built', 1)
+            pipe.execute()
+
+    def upsert(self, keys, post_id, score):
+        with self.client.pipeline() as pipe:
+            for key in keys:
+                pipe.zadd(key, {self._member(post_id): score})
+                pipe.zremrangebyrank(key, 0, -feed_length() - 1)
+            pipe.execute()
+
+    def upsert_many(self, post_id, scores, chunk_size=1000):
+        keys = list(scores)
+        for start in range(0, len(keys), chunk_size):
+            chunk = keys[start:start + chunk_size]
+            with self.client.pipeline() as pipe:
+                for key in chunk:
+                    pipe.exists(f'{key}:built')
+                built = [key for key, exists in zip(chunk, pipe.execute()) if exists]
+                for key in built:
+                    pipe.zadd(key, {self._member(post_id): scores[key]})
+                    pipe.zremrangebyrank(key, 0, -feed_length() - 1)
+                pipe.execute()
+
+    def remove(self, keys, post_id):
+        with self.client.pipeline() as pipe:
+            for key in keys:
+                pipe.zrem(key, self._member(post_id))
+            pipe.execute()
+
+    def delete(self, keys):
+        keys = list(keys)
+        if keys:
+            self.client.delete(*keys, *(f'{key}:built' for key in keys))
+
+    def length(self, key):
+        return self.client.zcard(key)
+
+    def page(self, key, after, count):
+        start = 0
+        if after is not None:
+            score, post_id = after
+            with self.client.pipeline() as pipe:
+                pipe.zrevrank(key, self._member(post_id))
+                pipe.zscore(key, self._member(post_id))
+                rank, stored = pipe.execute()
+            if rank is not None and stored == score:
+                start = rank + 1
+            else:
+                # The post was re-scored or removed since the cursor was
+                # made: continue below its old score
+                start = self.client.zcount(key, f'({score}', '+inf')
+        rows = self.client.zrevrange(key, start, start + count - 1, withscores=True)
+        return [(int(member), score) for member, score in rows]
+
+    def clear(self):
+        keys = list(self.client.scan_iter('feed:*'))
+        if keys:
+            self.client.delete(*keys)
+
+
+@functools.lru_cache(maxsize=None)
+def _open_store(name, url):
+    if name == 'redis':
+        return RedisFeedStore(url)
+    if name == 'memory':
+        return MemoryFeedStore()
+    return None
+
+
+def get_store():
+    """The configured FEED_STORE, or None when feeds are not materialized"""
+    return _open_store(getattr(settings, 'FEED_STORE', ''), getattr(settings, 'FEED_REDIS_URL', ''))
+
+
+def invalidate_feeds():
+    """Drop every materialized feed, e.g. after scores were changed in bulk"""
+    store = get_store()
+    if store is not None:
+        store.clear()
+
+
+# Incremental updates
+
+def _keys(sort, community_id):
+    return [_key(sort), _key(sort, community_id)]
+
+
+def update_post(post):
+    """Add or re-score a post in its feeds once the transaction commits"""
+    store = get_store()
+    if store is None:
+        return
+    scores = {sort: _score(sort, getattr(post, field)) for sort, field in SCORE_FIELDS.items()}
+    community_id = post.community_id
+
+    def apply():
+        for sort, score in scores.items():
+            store.upsert(_keys(sort, community_id), post.pk, score)
+
+    transaction.on_commit(apply)
+
+
+def remove_post(post):
+    """Remove a deleted post from its feeds once the transaction commits"""
+    store = get_store()
+    if store is None:
+        return
+    post_id, community_id = post.pk, post.community_id
+
+    def apply():
+        for sort in SCORE_FIELDS:
+            store.remove(_keys(sort, community_id), post_id)
+
+    transaction.on_commit(apply)
+
+
+# Reading
+
+def _build(store, key, sort, community_id):
+    posts = Post.objects.order_by(*feed_ordering(sort))
+    if community_id is not None:
+        posts = posts.filter(community_id=community_id)
+    rows = posts.values_list('pk', SCORE_FIELDS[sort])[:feed_length()]
+    store.replace(key, {pk: _score(sort, value) for pk, value in rows})
+
+
+def feed_entries(store, sort, community_id=None, after=None, count=10):
+    """
+    Up to ``count`` ``(post_id, score)`` pairs of a materialized feed after
+    the ``(score, post_id)`` position ``after``, building the feed first if
+    it is not in the store
+    """
+    key = _key(sort, community_id)
+    if not store.is_built(key):
+        _build(store, key, sort, community_id)
+    return store.page(key, after, count)
+
+
+def feed_page(queryset, sort, community_id=None, cursor=None, per_page=10):
+    """
+    Return a ``CursorPage`` of the posts of ``queryset`` in a feed of the
+    whole site or of one community. ``queryset`` carries the
+    select_related() and prefetch_related() the page needs.
+    """
+    ordering = feed_ordering(sort)
+    if community_id is not None:
+        queryset = queryset.filter(community_id=community_id)
+    store = get_store()
+    if store is None or sort not in MATERIALIZED_SORTS:
+        return paginate_by_cursor(queryset, ordering, cursor=cursor, per_page=per_page)
+
+    after = None
+    if cursor:
+        try:
+            after_values = decode_cursor(cursor, Post, ordering)
+            after = (_score(sort, after_values[0]), int(after_values[1]))
+        except (InvalidCursor, TypeError, ValueError, AttributeError):
+            cursor = None
+
+    key = _key(sort, community_id)
+    entries = feed_entries(store, sort, community_id, after, per_page + 1)
+    posts = queryset.in_bulk([pk for pk, _ in entries])
+    rows = [posts[pk] for pk, _ in entries if pk in posts]
+
+    if len(entries) <= per_page and store.length(key) >= feed_length():
+        # The set holds only the head of the feed; the rest is read from the
+        # post indexes, after the last post shown
+        rest = queryset.order_by(*ordering)
+        if rows:
+            rest = rest.filter(keyset_filter(ordering, [getattr(rows[-1], field.lstrip('-')) for field in ordering]))
+        elif after is not None:
+            rest = rest.filter(keyset_filter(ordering, after_values))
+        rows += list(rest[:per_page + 1 - len(rows)])
+
+    object_list = rows[:per_page]
+    has_next = object_list and (len(rows) > per_page or len(entries) > per_page)
+    next_cursor = encode_cursor(object_list[-1], ordering) if has_next else None
+    return CursorPage(object_list, cursor, next_cursor)
@@ -1,11 +1,13 @@
 import django_filters
 from django import forms
-from django.db.models import Q, Count
+from django.db.models import F
 from django.utils import timezone
 from datetime import timedelta
 from taggit.models import Tag
 
 from .models import Post, Community
+from .ranking import feed_ordering
+from .search import filter_queryset as filter_by_search
 
 class PostFilter(django_filters.FilterSet):
     """
@@ -21,7 +23,10 @@ class PostFilter(django_filters.FilterSet):
     
     SORT_CHOICES = (
         ('recent', 'Most Recent'),
+        ('hot', 'Hot'),
         ('popular', 'Most Popular'),
+        ('controversial', 'Controversial'),
+        ('rising', 'Rising'),
         ('comments', 'Most Comments'),
         ('oldest', 'Oldest'),
     )
@@ -83,18 +88,12 @@ class PostFilter(django_filters.FilterSet):
         fields = ['search', 'community', 'tags', 'post_type', 'period', 'min_votes', 'sort']
     
     def filter_search(self, queryset, name, value):
-        """Custom filter to search in title, content, and author username"""
+        """Custom filter to search in title, content, tags, community and author"""
         if not value:
             return queryset
         
-        # Search in multiple fields using Q objects
-        return queryset.filter(
-            Q(title__icontains=value) | 
-            Q(content__icontains=value) | 
-            Q(author__username__icontains=value) |
-            Q(community__name__icontains=value) |
-            Q(tags__name__icontains=value)
-        ).distinct()
+        # The full-text index covers all of these fields, no joins needed
+        return filter_by_search(queryset, value, 'post')
     
     def filter_tags(self, queryset, name, value):
         """Custom filter to filter by multiple tags (AND logic)"""
@@ -132,9 +131,9 @@ class PostFilter(django_filters.FilterSet):
         if value is None:
             return queryset
         
-        # Annotate with vote count and filter
+        # Use the denormalized vote counters instead of aggregating votes
         return queryset.annotate(
-            total_votes=Count('votes__value')
+            total_votes=F('upvote_count') + F('downvote_count')
         ).filter(total_votes__gte=value)
     
     def filter_sort(self, queryset, name, value):
@@ -142,9 +141,11 @@ class PostFilter(django_filters.FilterSet):
         if value == 'recent':
             return queryset.order_by('-created_at')
         elif value == 'popular':
-            return queryset.annotate(vote_sum=Count('votes__value')).order_by('-vote_sum')
+            return queryset.order_by(*feed_ordering('top'))
+        elif value in ('hot', 'controversial', 'rising'):
+            return queryset.order_by(*feed_ordering(value))
         elif value == 'comments':
-            return queryset.annotate(comment_count=Count('comments')).order_by('-comment_count')
+            return queryset.order_by('-comment_count')
         elif value == 'oldest':
             return queryset.order_by('created_at')
         
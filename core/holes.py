@@ -0,0 +1,188 @@
+"""
+Holes: the parts of shared, cached HTML that depend on the viewer.
+
+Renderings cached for many viewers (comment thread fragments, whole pages)
+hold a placeholder wherever their markup depends on the viewer: their votes,
+the CSRF token, the user menu, whether they may delete a post or are a member
+of a community. ``fill`` renders the holes of a document for one request.
+Each kind of hole gets all of its placeholders in the document at once, so
+the viewer's votes on a page of posts take a single query however many
+buttons there are. Placeholders are delimited by NUL characters, which form
+and API input never contains.
+
+Templates mark holes with ``{% hole name arg... %}``. The tag renders the
+hole in place, except while a page shell is rendered (``rendering_shell``),
+when it leaves the placeholder for ``fill``.
+"""
+import contextlib
+import re
+
+from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
+from django.utils.html import conditional_escape
+from django.utils.safestring import mark_safe
+
+from .models import Community, Vote
+
+
+_PLACEHOLDER = re.compile('\x00(?P<name>[a-z_]+)(?P<args>(?::[^\x00:]*)*)\x00')
+
+# name -> renderer(request, calls), returning {args: html} for a list of
+# argument tuples; arguments are always strings
+HOLES = {}
+
+
+def register(name):
+    """Register the renderer of a kind of hole"""
+    def decorator(renderer):
+        HOLES[name] = renderer
+        return renderer
+    return decorator
+
+
+def placeholder(name, *args):
+    """The placeholder of a hole, filled in by ``fill``"""
+    return mark_safe(f'\x00{name}{"".join(f":{arg}" for arg in args)}\x00')
+
+
+def _args(match):
+    return tuple(match['args'].split(':')[1:])
+
+
+def is_shell(request):
+    return getattr(request, 'page_shell', False)
+
+
+@contextlib.contextmanager
+def rendering_shell(request):
+    """Leave the holes of everything rendered for ``request`` as placeholders"""
+    request.page_shell = True
+    try:
+        yield
+    finally:
+        del request.page_shell
+
+
+def render_hole(request, name, *args):
+    """Render one hole for the viewer, or its placeholder while a shell is rendered"""
+    if is_shell(request):
+        return placeholder(name, *args)
+    args = tuple(str(arg) for arg in args)
+    return mark_safe(HOLES[name](request, [args])[args])
+
+
+def fill_many(documents, request):
+    """Render every hole of several documents for the viewer of ``request``"""
+    if is_shell(request):
+        return [mark_safe(html) for html in documents]
+    calls = {}
+    for html in documents:
+        for match in _PLACEHOLDER.finditer(html):
+            # Anything else that looks like a placeholder is not ours to fill
+            if match['name'] in HOLES:
+                calls.setdefault(match['name'], set()).add(_args(match))
+    rendered = {name: HOLES[name](request, list(args)) for name, args in calls.items()}
+
+    def substitute(match):
+        if match['name'] not in rendered:
+            return ''
+        return rendered[match['name']][_args(match)]
+
+    return [mark_safe(_PLACEHOLDER.sub(substitute, html)) for html in documents]
+
+
+def fill(html, request):
+    """Render every hole of ``html`` for the viewer of ``request``"""
+    return fill_many([html], request)[0]
+
+
+# Holes
+
+@register('csrf_token')
+def csrf_token(request, calls):
+    return dict.fromkeys(calls, get_token(request))
+
+
+@register('path')
+def path(request, calls):
+    return dict.fromkeys(calls, conditional_escape(request.path))
+
+
+def _viewer_votes(user, field, ids):
+    if not user.is_authenticated or not ids:
+        return {}
+    return dict(
+        Vote.objects.filter(user=user, **{f'{field}_id__in': ids})
+        .values_list(f'{field}_id', 'value')
+    )
+
+
+def _vote_classes(votes, calls, active):
+    return {
+        (object_id, value): active if votes.get(int(object_id)) == int(value) else ''
+        for object_id, value in calls
+    }
+
+
+@register('comment_vote')
+def comment_vote(request, calls):
+    """Class of a comment's vote button; args: comment id, button value"""
+    votes = _viewer_votes(request.user, 'comment', {int(object_id) for object_id, _ in calls})
+    return _vote_classes(votes, calls, 'active')
+
+
+@register('post_vote')
+def post_vote(request, calls):
+    """Class of a post's vote button; args: post id, button value"""
+    votes = _viewer_votes(request.user, 'post', {int(object_id) for object_id, _ in calls})
+    return _vote_classes(votes, calls, 'voted active')
+
+
+@register('user_menu')
+def user_menu(request, calls):
+    """The notification and message counts and account menu of the navbar"""
+    from .context_processors import notification_count, user_profile
+
+    context = {'user': request.user}
+    if request.user.is_authenticated:
+        context.update(notification_count(request), **user_profile(request))
+        context['csrf_token'] = get_token(request)
+    return dict.fromkeys(calls, render_to_string('core/includes/holes/user_menu.html', context))
+
+
+@register('comment_as')
+def comment_as(request, calls):
+    """Avatar and name of the viewer above the comment form"""
+    from .context_processors import user_profile
+
+    context = {'user': request.user, **user_profile(request)}
+    return dict.fromkeys(calls, render_to_string('core/includes/holes/comment_as.html', context))
+
+
+@register('post_delete')
+def post_delete(request, calls):
+    """Delete button for the author of a post; args: post id, author id, style"""
+    return {
+        (post_id, author_id, style): render_to_string(
+            'core/includes/holes/post_delete.html', {'post_id': post_id, 'style': style}
+        ) if author_id == str(request.user.pk) else ''
+        for post_id, author_id, style in calls
+    }
+
+
+@register('membership')
+def membership(request, calls):
+    """Join, leave and create buttons of a community page; args: community id, part"""
+    joined = set()
+    if request.user.is_authenticated:
+        joined = set(
+            Community.members.through.objects
+            .filter(user_id=request.user.pk, community_id__in={int(community_id) for community_id, _ in calls})
+            .values_list('community_id', flat=True)
+        )
+    return {
+        (community_id, part): render_to_string('core/includes/holes/membership.html', {
+            'community_id': community_id, 'part': part, 'is_member': int(community_id) in joined,
+        })
+        for community_id, part in calls
+    }
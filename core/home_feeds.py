@@ -0,0 +1,193 @@
+"""
+Personalized home feeds.
+
+A logged-in user's home feed holds the newest posts of the communities they
+joined, with posts tagged with their interests ranked as if they were
+HOME_FEED_INTEREST_BOOST seconds newer per matching tag (up to
+MAX_BOOSTED_TAGS tags).
+
+Most communities are fanned out on write: once a new post is committed, the
+notification worker (see core.notifications) adds it with its score for
+each member to their home feed, a sorted set in the feed store of
+core.feeds. Communities with more than HOME_FEED_FANOUT_LIMIT members would
+make that write too large; they are merged in on read instead, from their
+materialized 'new' feed. A page therefore costs a read of the user's set,
+one of each large community they belong to and the ``in_bulk`` query for
+the posts, however many communities they joined. Posts merged in on read
+are not boosted, so that pages stay in one consistent order.
+
+A home feed is built from the database on its first read and only feeds
+that were built receive fanned out posts, so users who do not come back
+cost nothing. Joining or leaving a community and changing interests drop
+the user's feed, to be rebuilt on their next visit. Like the other feeds
+it holds the FEED_LENGTH best posts; older ones are on the community pages.
+
+Without a FEED_STORE the home feed is read from the post indexes, newest
+first and without boosts.
+"""
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from taggit.models import TaggedItem
+
+from .feeds import feed_entries, feed_length, get_store
+from .models import Community, Post, Profile
+from .pagination import CursorPage, InvalidCursor, decode_cursor, encode_cursor, paginate_by_cursor
+
+
+# Posts are ordered by their score for the viewer, set as ``home_score``
+ORDERING = ('-home_score', '-id')
+
+# Matching interest tags beyond this many add nothing
+MAX_BOOSTED_TAGS = 3
+
+
+def fanout_limit():
+    return getattr(settings, 'HOME_FEED_FANOUT_LIMIT', 10000)
+
+
+def _key(user_id):
+    return f'feed:home:{user_id}'
+
+
+def _score(created_at, matches):
+    boost = getattr(settings, 'HOME_FEED_INTEREST_BOOST', 6 * 60 * 60)
+    return created_at.timestamp() + boost * min(matches, MAX_BOOSTED_TAGS)
+
+
+def _post_tags(post_ids):
+    tags = defaultdict(set)
+    rows = TaggedItem.objects.filter(
+        content_type=ContentType.objects.get_for_model(Post), object_id__in=post_ids,
+    ).values_list('object_id', 'tag_id')
+    for post_id, tag_id in rows:
+        tags[post_id].add(tag_id)
+    return tags
+
+
+# Writing
+
+def fan_out_posts(post_ids):
+    """
+    Add new posts to the built home feeds of the members of their
+    communities, except for communities merged in on read
+    """
+    store = get_store()
+    if store is None or not post_ids:
+        return
+    posts = list(
+        Post.objects.filter(pk__in=post_ids, community__member_count__lte=fanout_limit())
+        .values_list('pk', 'community_id', 'created_at')
+    )
+    if not posts:
+        return
+    community_ids = {community_id for _, community_id, _ in posts}
+    tags = _post_tags([pk for pk, _, _ in posts])
+
+    # Only the interests matching a tag of the batch matter
+    interests = defaultdict(set)
+    all_tags = set().union(*tags.values())
+    if all_tags:
+        rows = Profile.objects.filter(
+            user__communities__in=community_ids, interests__id__in=all_tags,
+        ).values_list('user_id', 'interests__id')
+        for user_id, tag_id in rows:
+            interests[user_id].add(tag_id)
+
+    members = defaultdict(list)
+    rows = Community.members.through.objects.filter(community_id__in=community_ids)\
+        .values_list('community_id', 'user_id')
+    for community_id, user_id in rows.iterator():
+        members[community_id].append(user_id)
+
+    for post_id, community_id, created_at in posts:
+        store.upsert_many(post_id, {
+            _key(user_id): _score(created_at, len(tags[post_id] & interests[user_id]))
+            for user_id in members[community_id]
+        })
+
+
+def invalidate_home_feeds(user_ids):
+    """Drop users' home feeds once the transaction commits, e.g. after they joined a community"""
+    store = get_store()
+    if store is None:
+        return
+    keys = [_key(user_id) for user_id in set(user_ids)]
+    transaction.on_commit(lambda: store.delete(keys))
+
+
+# Reading
+
+def _build(store, user):
+    posts = Post.objects.filter(
+        community__in=Community.objects.filter(members=user, member_count__lte=fanout_limit()).values('pk'),
+    ).order_by('-created_at', '-id')
+    rows = list(posts.values_list('pk', 'created_at')[:feed_length()])
+
+    interest_ids = [
+        tag_id for tag_id in Profile.objects.filter(user=user).values_list('interests__id', flat=True)
+        if tag_id is not None
+    ]
+    matches = Counter()
+    if rows and interest_ids:
+        matches.update(
+            TaggedItem.objects.filter(
+                content_type=ContentType.objects.get_for_model(Post),
+                object_id__in=[pk for pk, _ in rows], tag_id__in=interest_ids,
+            ).values_list('object_id', flat=True)
+        )
+    store.replace(_key(user.pk), {pk: _score(created_at, matches[pk]) for pk, created_at in rows})
+
+
+def home_feed_page(user, queryset, cursor=None, per_page=10):
+    """
+    Return a ``CursorPage`` of a user's home feed, or None when they have not
+    joined any community. ``queryset`` carries the select_related() and
+    prefetch_related() the page needs.
+    """
+    store = get_store()
+    if store is None:
+        page = paginate_by_cursor(
+            queryset.filter(community__members=user), ('-created_at', '-id'), cursor=cursor, per_page=per_page,
+        )
+        if not page and not cursor and not user.communities.exists():
+            return None
+        return page
+
+    after = None
+    if cursor:
+        try:
+            score, post_id = decode_cursor(cursor, Post, ORDERING)
+            after = (float(score), int(post_id))
+        except (InvalidCursor, TypeError, ValueError):
+            cursor = None
+
+    key = _key(user.pk)
+    if not store.is_built(key):
+        _build(store, user)
+    entries = store.page(key, after, per_page + 1)
+    large = Community.objects.filter(members=user, member_count__gt=fanout_limit()).values_list('pk', flat=True)
+    for community_id in large:
+        entries += feed_entries(store, 'new', community_id, after, per_page + 1)
+    if not entries and not cursor and not user.communities.exists():
+        return None
+
+    # A community may have grown past the limit after its posts were fanned out
+    scores = {}
+    for post_id, score in entries:
+        scores[post_id] = max(score, scores.get(post_id, score))
+    ranked = sorted(scores.items(), key=lambda entry: (entry[1], entry[0]), reverse=True)[:per_page + 1]
+
+    posts = queryset.in_bulk([pk for pk, _ in ranked])
+    rows = []
+    for post_id, score in ranked:
+        if post_id in posts:
+            posts[post_id].home_score = score
+            rows.append(posts[post_id])
+
+    object_list = rows[:per_page]
+    has_next = object_list and len(ranked) > per_page
+    next_cursor = encode_cursor(object_list[-1], ORDERING) if has_next else None
+    return CursorPage(object_list, cursor, next_cursor)
@@ -0,0 +1,108 @@
+"""
+Incremental karma tracking.
+
+Karma is kept up to date by applying deltas to Profile.karma as votes, posts
+and comments change, instead of recounting a user's whole history. The
+``recompute_karma`` management command rebuilds it from scratch with a few
+grouped aggregate queries.
+
+Karma rules:
+    - 1 point per upvote and -1 per downvote on a user's posts and comments
+    - 2 points per post created
+    - 1 point per comment created
+    - Karma of users who joined within NEW_USER_GRACE_DAYS never goes below zero
+"""
+from django.contrib.auth.models import User
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Profile, Post, Comment, Vote
+from .caching import invalidated_update
+
+
+POST_KARMA = 2
+COMMENT_KARMA = 1
+
+# New users never drop below zero karma during their first days
+NEW_USER_GRACE_DAYS = 30
+
+
+def _add_karma(profiles, delta):
+    if delta >= 0:
+        invalidated_update(profiles, karma=F('karma') + delta)
+        return
+    # Losses stop at zero for users still in their grace period
+    grace_start = timezone.now() - timezone.timedelta(days=NEW_USER_GRACE_DAYS)
+    invalidated_update(profiles.filter(user__date_joined__gt=grace_start), karma=Greatest(F('karma') + delta, 0))
+    invalidated_update(profiles.exclude(user__date_joined__gt=grace_start), karma=F('karma') + delta)
+
+
+def adjust_karma(user_id, delta):
+    """Atomically add delta to a user's karma"""
+    if delta and user_id:
+        _add_karma(Profile.objects.filter(user_id=user_id), delta)
+
+
+def adjust_karma_many(deltas):
+    """
+    Add ``{user_id: delta}`` to several users' karma, with one update per
+    distinct delta
+    """
+    users_by_delta = {}
+    for user_id, delta in deltas.items():
+        if delta and user_id:
+            users_by_delta.setdefault(delta, []).append(user_id)
+    for delta, user_ids in users_by_delta.items():
+        _add_karma(Profile.objects.filter(user_id__in=user_ids), delta)
+
+
+def vote_karma_delta(old_value, new_value):
+    """Return the karma change for the author when a vote goes from old to new"""
+    return (new_value or 0) - (old_value or 0)
+
+
+def compute_karma(user_ids=None):
+    """
+    Compute karma from scratch with grouped aggregates.
+
+    Returns a dictionary mapping user ids to karma. Pass ``user_ids`` to
+    restrict the computation to some users; users without any content are
+    included with zero karma.
+    """
+    users = User.objects.all()
+    posts = Post.objects.all()
+    comments = Comment.objects.all()
+    post_votes = Vote.objects.filter(post__isnull=False)
+    comment_votes = Vote.objects.filter(comment__isnull=False)
+
+    if user_ids is not None:
+        users = users.filter(id__in=user_ids)
+        posts = posts.filter(author_id__in=user_ids)
+        comments = comments.filter(author_id__in=user_ids)
+        post_votes = post_votes.filter(post__author_id__in=user_ids)
+        comment_votes = comment_votes.filter(comment__author_id__in=user_ids)
+
+    karma = {}
+    joined = dict(users.values_list('id', 'date_joined'))
+    for user_id in joined:
+        karma[user_id] = 0
+
+    aggregates = [
+        (posts.values('author_id').annotate(total=Count('id') * POST_KARMA), 'author_id'),
+        (comments.values('author_id').annotate(total=Count('id') * COMMENT_KARMA), 'author_id'),
+        (post_votes.values('post__author_id').annotate(total=Sum('value')), 'post__author_id'),
+        (comment_votes.values('comment__author_id').annotate(total=Sum('value')), 'comment__author_id'),
+    ]
+    for rows, key in aggregates:
+        for row in rows.order_by():
+            if row[key] in karma:
+                karma[row[key]] += row['total'] or 0
+
+    # Ensure karma is never negative for new users
+    grace_start = timezone.now() - timezone.timedelta(days=NEW_USER_GRACE_DAYS)
+    for user_id, value in karma.items():
+        if value < 0 and joined[user_id] > grace_start:
+            karma[user_id] = 0
+
+    return karma
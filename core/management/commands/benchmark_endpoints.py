@@ -0,0 +1,72 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from core.benchmarks import ENDPOINT_BUDGETS, BenchmarkError, run_benchmarks
+from core.models import Post
+
+
+class Command(BaseCommand):
+    help = (
+        'Benchmarks the main pages and API list endpoints against the current database, e.g. one '
+        'filled by generate_dataset, and fails when an endpoint exceeds its query-count, p95 latency '
+        'or allocation budget'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--endpoint', choices=list(ENDPOINT_BUDGETS), action='append',
+            help='Only benchmark this endpoint (repeatable)'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='Number of timed requests per endpoint (default: 20)'
+        )
+        parser.add_argument(
+            '--user',
+            help='Username to request the endpoints as (default: the author of the busiest post)'
+        )
+        parser.add_argument(
+            '--queries-only', action='store_true',
+            help='Only enforce query budgets, e.g. on shared machines where timings are noisy'
+        )
+        parser.add_argument(
+            '--report',
+            help='Also write the measurements to this JSON file'
+        )
+
+    def handle(self, *args, **options):
+        if not Post.objects.exists():
+            raise CommandError('The database has no posts; populate it with generate_dataset first')
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f'No user named {options["user"]}')
+
+        try:
+            results = run_benchmarks(options['endpoint'], options['repeat'], user)
+        except BenchmarkError as e:
+            raise CommandError(str(e)) from e
+
+        failures = []
+        self.stdout.write(f'{"endpoint":<20} {"queries":>7} {"p50 ms":>8} {"p95 ms":>8} {"peak KiB":>9}')
+        for result in results:
+            exceeded = result.regressions(ENDPOINT_BUDGETS[result.name], latency=not options['queries_only'])
+            line = (
+                f'{result.name:<20} {result.queries:>7} {result.p50:>8.1f} {result.p95:>8.1f} '
+                f'{result.peak_kb:>9.0f}'
+            )
+            if exceeded:
+                failures.append(f'{result.name}: {", ".join(exceeded)}')
+                line = self.style.ERROR(f'{line}  over budget')
+            self.stdout.write(line)
+
+        if options['report']:
+            with open(options['report'], 'w') as report:
+                json.dump({result.name: result.as_dict() for result in results}, report, indent=2)
+
+        if failures:
+            raise CommandError('Endpoints over budget:\n' + '\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS(f'{len(results)} endpoints within budget'))
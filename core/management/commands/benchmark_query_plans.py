@@ -0,0 +1,117 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from core.models import Community, Post, Comment, Vote, Notification
+
+# Indexes added for the hot queries below, see migration 0020
+HOT_QUERY_INDEXES = [
+    'post_new_idx',
+    'post_community_new_idx',
+    'post_author_new_idx',
+    'comment_post_parent_idx',
+    'comment_tree_idx',
+    'comment_author_new_idx',
+    'vote_post_value_idx',
+    'vote_comment_value_idx',
+    'notification_unread_idx',
+]
+
+
+def hot_queries():
+    """
+    The hot querysets by name, run against the busiest rows of the
+    database: the largest community, the most commented post and so on
+    """
+    community_id = Community.objects.order_by('-post_count').values_list('pk', flat=True).first()
+    post_id = Post.objects.order_by('-comment_count').values_list('pk', flat=True).first()
+    comment_id = Comment.objects.order_by('-upvote_count').values_list('pk', flat=True).first()
+    author_id = Post.objects.order_by('-id').values_list('author_id', flat=True).first()
+    recipient_id = Notification.objects.order_by('-id').values_list('recipient_id', flat=True).first()
+    if post_id is None:
+        raise CommandError('The database has no posts; populate it with generate_dataset first')
+
+    return {
+        'new feed': Post.objects.order_by('-created_at', '-id')[:25],
+        'community feed': Post.objects.filter(community_id=community_id).order_by('-created_at', '-id')[:25],
+        'author posts': Post.objects.filter(author_id=author_id).order_by('-created_at', '-id')[:25],
+        'root comments': Comment.objects.filter(post_id=post_id, parent=None)
+                                        .order_by('created_at').values_list('tree_id', flat=True)[:50],
+        'comment trees': Comment.objects.filter(post_id=post_id).order_by('tree_id', 'lft'),
+        'author comments': Comment.objects.filter(author_id=author_id).order_by('-created_at')[:25],
+        'post vote tally': Vote.objects.filter(post_id=post_id).values('value').annotate(n=Count('id')).order_by(),
+        'comment vote tally': Vote.objects.filter(comment_id=comment_id).values('value').annotate(n=Count('id')).order_by(),
+        'unread notifications': Notification.objects.filter(recipient_id=recipient_id, is_read=False)
+                                                    .order_by('-created_at')[:25],
+        'notification list': Notification.objects.filter(recipient_id=recipient_id).order_by('-created_at', '-id')[:25],
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Shows the query plans and timings of the hot queries without and with the indexes of '
+        'migration 0020. The indexes are dropped inside a transaction that is rolled back, which '
+        'locks the tables meanwhile: run it against a benchmark database, not production'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='Number of timed runs of each query (default: 20)'
+        )
+        parser.add_argument(
+            '--analyze', action='store_true',
+            help='Use EXPLAIN ANALYZE on PostgreSQL'
+        )
+        parser.add_argument(
+            '--after-only', action='store_true',
+            help='Only show plans with the indexes in place'
+        )
+
+    def measure(self, queries, options):
+        """Return {name: (median milliseconds, plan)}"""
+        explain = {'analyze': True} if options['analyze'] and connection.vendor == 'postgresql' else {}
+        results = {}
+        for name, queryset in queries.items():
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                list(queryset.all())
+                timings.append((time.perf_counter() - started) * 1000)
+            results[name] = (statistics.median(timings), queryset.explain(**explain))
+        return results
+
+    def handle(self, *args, **options):
+        queries = hot_queries()
+        existing = set()
+        with connection.cursor() as cursor:
+            for model in (Post, Comment, Vote, Notification):
+                existing |= set(connection.introspection.get_constraints(cursor, model._meta.db_table))
+        missing = [name for name in HOT_QUERY_INDEXES if name not in existing]
+        if missing:
+            raise CommandError(f'Missing indexes {", ".join(missing)}; run migrate first')
+
+        before = None
+        if not options['after_only']:
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    for name in HOT_QUERY_INDEXES:
+                        cursor.execute(f'DROP INDEX {connection.ops.quote_name(name)}')
+                before = self.measure(queries, options)
+                transaction.set_rollback(True)
+        after = self.measure(queries, options)
+
+        for name, (after_ms, after_plan) in after.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            if before:
+                before_ms, before_plan = before[name]
+                self.stdout.write(f'  without indexes: {before_ms:.2f} ms')
+                for line in before_plan.splitlines():
+                    self.stdout.write(f'    {line}')
+            self.stdout.write(f'  with indexes: {after_ms:.2f} ms')
+            for line in after_plan.splitlines():
+                self.stdout.write(f'    {line}')
+
+        self.stdout.write(self.style.SUCCESS(f'Benchmarked {len(after)} queries'))
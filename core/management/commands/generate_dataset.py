@@ -0,0 +1,84 @@
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from core.dataset import DATASET_END, DatasetGenerator
+
+
+class Command(BaseCommand):
+    help = (
+        'Fills the database with a deterministic synthetic dataset of users, communities, posts, '
+        'comment trees, votes, tags and notifications for load testing, then recomputes counters, '
+        'rankings and karma'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+        parser.add_argument('--users', type=int, default=2000, help='Number of users (default: 2000)')
+        parser.add_argument('--communities', type=int, default=50, help='Number of communities (default: 50)')
+        parser.add_argument('--tags', type=int, default=300, help='Number of tags (default: 300)')
+        parser.add_argument('--posts', type=int, default=20000, help='Number of posts (default: 20000)')
+        parser.add_argument('--comments', type=int, default=100000, help='Number of comments (default: 100000)')
+        parser.add_argument(
+            '--votes', type=int, default=300000,
+            help='Number of votes; votes by a post or comment author on their own content are skipped '
+                 '(default: 300000)'
+        )
+        parser.add_argument(
+            '--notifications', type=int, default=50000, help='Number of notifications (default: 50000)'
+        )
+        parser.add_argument(
+            '--max-depth', type=int, default=8,
+            help='Deepest level of a reply in a comment tree (default: 8)'
+        )
+        parser.add_argument(
+            '--end', type=datetime.fromisoformat, default=DATASET_END,
+            help=f'Date the generated activity ends at (default: {DATASET_END.date()})'
+        )
+        parser.add_argument('--days', type=int, default=365, help='Days of activity (default: 365)')
+        parser.add_argument(
+            '--batch-size', type=int, default=5000, help='Number of rows per insert (default: 5000)'
+        )
+
+    def handle(self, *args, **options):
+        for name in ('users', 'communities', 'posts'):
+            if options[name] < 1:
+                raise CommandError(f'--{name} must be at least 1')
+        end = options['end']
+        if end.tzinfo is None:
+            end = end.replace(tzinfo=dt_timezone.utc)
+
+        started = time.monotonic()
+        generator = DatasetGenerator(
+            seed=options['seed'], batch_size=options['batch_size'], end=end, days=options['days'],
+            log=self.stdout.write,
+        )
+        steps = [
+            ('users', generator.users, [options['users']]),
+            ('communities', generator.communities, [options['communities']]),
+            ('tags', generator.tags, [options['tags']]),
+            ('posts', generator.posts, [options['posts']]),
+            ('comments', generator.comments, [options['comments'], options['max_depth']]),
+            ('votes', generator.votes, [options['votes']]),
+            ('notifications', generator.notifications, [options['notifications']]),
+        ]
+        for name, step, arguments in steps:
+            self.stdout.write(f'Generating {name}...')
+            step(*arguments)
+        generator.finish()
+
+        # Bulk inserts skip the signals that keep these up to date
+        self.stdout.write('Recomputing counters, rankings and karma...')
+        for command, command_options in [
+            ('reconcile_counters', {}),
+            ('reconcile_vote_counts', {}),
+            ('refresh_rankings', {'all': True}),
+            ('recompute_karma', {}),
+        ]:
+            call_command(command, stdout=self.stdout, **command_options)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated dataset with seed {options["seed"]} in {time.monotonic() - started:.1f}s; '
+            'run rebuild_search_index to make it searchable'
+        ))
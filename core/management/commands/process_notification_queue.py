@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+from core.notifications import process_notification_queue
+
+
+class Command(BaseCommand):
+    help = 'Delivers the queued reply and mention notifications of new posts and comments in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Number of queued posts and comments handled per transaction (default: 500)'
+        )
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='Keep running and poll for new tasks instead of exiting when the queue is empty'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=2.0,
+            help='Seconds to wait between polls of an empty queue with --loop (default: 2)'
+        )
+
+    def handle(self, *args, **options):
+        total = 0
+        while True:
+            processed = process_notification_queue(options['batch_size'])
+            total += processed
+            if processed:
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f'Delivered notifications for {total} queued posts and comments'))
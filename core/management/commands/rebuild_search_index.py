@@ -1,18 +1,127 @@
+import os
+import time
+
 from django.core.management.base import BaseCommand, CommandError
 from django.core.management import call_command
-from watson import search as watson
+from django.db import connection
 from core.search_adapters import register_search_adapters
+from core.search import SEARCH_MODELS
+from core.search_rebuild import (
+    current_rebuild, discard_rebuild, finish_rebuild, pending_chunks, plan_chunks, run_chunks, start_rebuild,
+)
+from core.models import SearchRebuildChunk
+
+# Seconds between progress lines
+REPORT_INTERVAL = 5
+
 
 class Command(BaseCommand):
-    help = 'Rebuilds the Watson search index with proper adapters'
+    help = (
+        'Rebuilds the full-text search index in parallel pk-range chunks, resuming an interrupted '
+        'rebuild, then the Watson search index'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--kind', choices=list(SEARCH_MODELS), action='append',
+            help='Only rebuild the full-text index for this kind of object (repeatable). '
+                 'Entries are replaced in place instead of through a shadow table'
+        )
+        parser.add_argument(
+            '--workers', type=int,
+            help='Number of worker processes (default: up to 4, 1 on SQLite)'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help='Number of objects per chunk (default: 1000)'
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Discard an interrupted rebuild instead of resuming it'
+        )
+        parser.add_argument(
+            '--skip-watson', action='store_true',
+            help='Do not rebuild the Watson index'
+        )
 
     def handle(self, *args, **options):
-        self.stdout.write('Rebuilding search index...')
-        
-        # First, register our custom search adapters
-        register_search_adapters()
-        
-        # Then rebuild the index using Watson's built-in command
-        call_command('buildwatson')
-        
+        workers = options['workers']
+        if workers is None:
+            # SQLite serializes writers, so more processes would only wait
+            workers = 1 if connection.vendor == 'sqlite' else min(4, os.cpu_count() or 1)
+        chunk_size = options['chunk_size']
+
+        if options['restart']:
+            discard_rebuild()
+        rebuild = current_rebuild()
+        if rebuild:
+            table, kinds = rebuild
+            if options['kind'] and set(options['kind']) != set(kinds):
+                raise CommandError(
+                    f'A rebuild of {", ".join(kinds)} is in progress; run without --kind to resume it '
+                    'or with --restart to discard it'
+                )
+            chunks = SearchRebuildChunk.objects.filter(table_name=table)
+            self.stdout.write(
+                f'Resuming rebuild into {table}: '
+                f'{chunks.filter(completed_at__isnull=False).count()} of {chunks.count()} chunks done'
+            )
+        else:
+            kinds = options['kind'] or list(SEARCH_MODELS)
+            table = start_rebuild(kinds, chunk_size)
+            self.stdout.write(f'Rebuilding {", ".join(kinds)} into {table} with {workers} worker(s)...')
+
+        progress = Progress(self.stdout)
+        try:
+            run_chunks(pending_chunks(), workers, progress)
+            # Objects created while the rebuild ran
+            run_chunks([chunk.pk for chunk in plan_chunks(table, kinds, chunk_size)], workers, progress)
+        except (Exception, KeyboardInterrupt) as e:
+            raise CommandError(f'Rebuild stopped ({e!r}); run the command again to resume it') from e
+        progress.summary()
+
+        finish_rebuild(table, kinds)
+        self.stdout.write(self.style.SUCCESS('Full-text search index rebuilt'))
+
+        if not options['skip_watson']:
+            self.stdout.write('Rebuilding Watson search index...')
+
+            # First, register our custom search adapters
+            register_search_adapters()
+
+            # Then rebuild the index using Watson's built-in command
+            call_command('buildwatson')
+
         self.stdout.write(self.style.SUCCESS('Search index rebuilt successfully'))
+
+
+class Progress:
+    """Counts completed chunks and reports throughput every REPORT_INTERVAL seconds"""
+
+    def __init__(self, stdout):
+        self.stdout = stdout
+        self.started = self.reported = time.monotonic()
+        self.chunks = 0
+        self.by_kind = {}
+
+    def rate(self, count):
+        return count / max(time.monotonic() - self.started, 1e-6)
+
+    def __call__(self, kind, entries):
+        self.chunks += 1
+        self.by_kind[kind] = self.by_kind.get(kind, 0) + entries
+        if time.monotonic() - self.reported >= REPORT_INTERVAL:
+            self.reported = time.monotonic()
+            total = sum(self.by_kind.values())
+            remaining = SearchRebuildChunk.objects.filter(completed_at__isnull=True).count()
+            self.stdout.write(
+                f'  {self.chunks} chunks, {total} objects, {self.rate(total):.0f} objects/s, '
+                f'{remaining} chunks left'
+            )
+
+    def summary(self):
+        for kind, count in self.by_kind.items():
+            self.stdout.write(f'  {kind}: {count} objects')
+        total = sum(self.by_kind.values())
+        elapsed = time.monotonic() - self.started
+        self.stdout.write(f'Indexed {total} objects in {elapsed:.1f}s ({self.rate(total):.0f} objects/s)')
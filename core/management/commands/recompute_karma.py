@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from core.models import Profile
+from core.karma import compute_karma
+from core.caching import invalidate_model_cache
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the karma of every profile from posts, comments and votes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of profiles written per query (default: 1000)'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('Computing karma...')
+
+        # A handful of grouped aggregate queries cover every user at once
+        karma = compute_karma()
+
+        with transaction.atomic():
+            changed = []
+            for profile in Profile.objects.only('id', 'user_id', 'karma').iterator():
+                value = karma.get(profile.user_id, 0)
+                if profile.karma != value:
+                    profile.karma = value
+                    changed.append(profile)
+
+            Profile.objects.bulk_update(changed, ['karma'], batch_size=options['batch_size'])
+        
+        # bulk_update() bypasses the query cache invalidation
+        invalidate_model_cache(Profile)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Recomputed karma for {len(karma)} users, {len(changed)} profiles updated'
+        ))
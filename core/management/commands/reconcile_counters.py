@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from core.models import Post, Comment, Community
+from core.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = 'Repairs drift in the denormalized comment, post and member counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help='Number of rows updated per query (default: 1000)'
+        )
+
+    def handle(self, *args, **options):
+        fixed = reconcile_counters(Post, Comment, Community, chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Fixed {fixed} drifted counters'))
@@ -0,0 +1,88 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q
+from core.models import Post, Comment, Vote
+from core.caching import invalidate_model_cache
+
+
+class Command(BaseCommand):
+    help = 'Repairs drift in the denormalized upvote/downvote counters of posts and comments'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model', choices=['post', 'comment', 'all'], default='all',
+            help='Which counters to reconcile (default: all)'
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=1000,
+            help='Number of rows checked per transaction (default: 1000)'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Report drifted rows without fixing them'
+        )
+
+    def handle(self, *args, **options):
+        targets = {
+            'post': (Post, 'post_id'),
+            'comment': (Comment, 'comment_id'),
+        }
+        if options['model'] != 'all':
+            targets = {options['model']: targets[options['model']]}
+
+        for name, (model, vote_field) in targets.items():
+            checked, fixed = self.reconcile(model, vote_field, options['chunk_size'], options['dry_run'])
+            verb = 'would fix' if options['dry_run'] else 'fixed'
+            self.stdout.write(self.style.SUCCESS(
+                f'Checked {checked} {name}s, {verb} {fixed} drifted counters'
+            ))
+
+    def reconcile(self, model, vote_field, chunk_size, dry_run):
+        """Walk the table in primary key ranges and repair each chunk in one transaction"""
+        checked = 0
+        fixed = 0
+        last_pk = 0
+
+        while True:
+            with transaction.atomic():
+                rows = list(
+                    model.objects.filter(pk__gt=last_pk)
+                    .order_by('pk')
+                    .select_for_update()
+                    .only('pk', 'upvote_count', 'downvote_count')[:chunk_size]
+                )
+                if not rows:
+                    break
+                last_pk = rows[-1].pk
+
+                # One grouped query gives the real counts for the whole chunk
+                counts = {
+                    row[vote_field]: row
+                    for row in Vote.objects.filter(**{
+                        f'{vote_field}__gte': rows[0].pk,
+                        f'{vote_field}__lte': last_pk,
+                    }).values(vote_field).annotate(
+                        upvotes=Count('id', filter=Q(value=1)),
+                        downvotes=Count('id', filter=Q(value=-1)),
+                    )
+                }
+
+                drifted = []
+                for obj in rows:
+                    actual = counts.get(obj.pk, {'upvotes': 0, 'downvotes': 0})
+                    if (obj.upvote_count, obj.downvote_count) != (actual['upvotes'], actual['downvotes']):
+                        obj.upvote_count = actual['upvotes']
+                        obj.downvote_count = actual['downvotes']
+                        drifted.append(obj)
+
+                if drifted and not dry_run:
+                    model.objects.bulk_update(drifted, ['upvote_count', 'downvote_count'])
+
+                checked += len(rows)
+                fixed += len(drifted)
+
+        # bulk_update() bypasses the query cache invalidation
+        if fixed and not dry_run:
+            invalidate_model_cache(model)
+
+        return checked, fixed
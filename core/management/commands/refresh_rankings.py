@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+from core.models import Post
+from core.ranking import compute_scores, RANKING_FIELDS, RISING_WINDOW_HOURS
+from core.caching import invalidate_model_cache
+from core.feeds import invalidate_feeds
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the precomputed feed ranking scores of posts'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Recompute every post instead of only those in the rising window'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of posts updated per query (default: 1000)'
+        )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        batch_size = options['batch_size']
+        cutoff = now - timezone.timedelta(hours=RISING_WINDOW_HOURS)
+
+        posts = Post.objects.all()
+        if not options['all']:
+            # Only rising scores change with time; the other scores are kept
+            # up to date as votes come in. Old posts still holding a rising
+            # score are included so it drops back to zero.
+            posts = posts.filter(Q(created_at__gte=cutoff) | ~Q(rising_score=0))
+
+        updated = 0
+        batch = []
+        fields = ['id', 'upvote_count', 'downvote_count', 'created_at'] + RANKING_FIELDS
+        for post in posts.only(*fields).order_by().iterator(chunk_size=batch_size):
+            for field, value in compute_scores(post.upvote_count, post.downvote_count, post.created_at, now).items():
+                setattr(post, field, value)
+            batch.append(post)
+            if len(batch) >= batch_size:
+                Post.objects.bulk_update(batch, RANKING_FIELDS)
+                updated += len(batch)
+                batch = []
+
+        if batch:
+            Post.objects.bulk_update(batch, RANKING_FIELDS)
+            updated += len(batch)
+
+        # bulk_update() bypasses the query cache invalidation and the
+        # materialized feeds, which are rebuilt on their next read
+        invalidate_model_cache(Post)
+        if options['all']:
+            invalidate_feeds()
+        self.stdout.write(self.style.SUCCESS(f'Refreshed ranking scores for {updated} posts'))
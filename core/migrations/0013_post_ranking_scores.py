@@ -0,0 +1,116 @@
+from datetime import datetime, timezone
+from math import log10
+
+from django.db import migrations, models
+
+
+# A frozen copy of the scoring in core.ranking as of this migration, so later
+# changes to the live formula do not change what the backfill computes
+HOT_EPOCH = datetime(2005, 12, 8, 7, 46, 43, tzinfo=timezone.utc)
+HOT_DECAY_SECONDS = 45000
+RISING_WINDOW_HOURS = 48
+RISING_GRAVITY = 1.5
+
+RANKING_FIELDS = ['hot_score', 'top_score', 'controversy_score', 'rising_score']
+
+
+def compute_scores(upvotes, downvotes, created_at, now):
+    score = upvotes - downvotes
+    sign = 1 if score > 0 else -1 if score < 0 else 0
+    seconds = (created_at - HOT_EPOCH).total_seconds()
+    hot = round(sign * log10(max(abs(score), 1)) + seconds / HOT_DECAY_SECONDS, 7)
+
+    controversy = 0.0
+    if upvotes > 0 and downvotes > 0:
+        balance = downvotes / upvotes if upvotes > downvotes else upvotes / downvotes
+        controversy = (upvotes + downvotes) ** balance
+
+    rising = 0.0
+    age_hours = max((now - created_at).total_seconds() / 3600, 0)
+    if age_hours <= RISING_WINDOW_HOURS:
+        rising = score / (age_hours + 2) ** RISING_GRAVITY
+
+    return {
+        'hot_score': hot,
+        'top_score': score,
+        'controversy_score': controversy,
+        'rising_score': rising,
+    }
+
+
+def backfill_scores(apps, schema_editor):
+    Post = apps.get_model('core', 'Post')
+    now = datetime.now(timezone.utc)
+    batch = []
+    for post in Post.objects.only('id', 'upvote_count', 'downvote_count', 'created_at').iterator(chunk_size=1000):
+        for field, value in compute_scores(post.upvote_count, post.downvote_count, post.created_at, now).items():
+            setattr(post, field, value)
+        batch.append(post)
+        if len(batch) >= 1000:
+            Post.objects.bulk_update(batch, RANKING_FIELDS)
+            batch = []
+    if batch:
+        Post.objects.bulk_update(batch, RANKING_FIELDS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_remove_payment_community_alter_payment_description_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='hot_score',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='top_score',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='controversy_score',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='rising_score',
+            field=models.FloatField(default=0),
+        ),
+        migrations.RunPython(backfill_scores, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-hot_score', '-id'], name='post_hot_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-top_score', '-id'], name='post_top_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-controversy_score', '-id'], name='post_controversy_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-rising_score', '-id'], name='post_rising_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['community', '-hot_score', '-id'], name='post_community_hot_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['community', '-top_score', '-id'], name='post_community_top_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['community', '-controversy_score', '-id'], name='post_community_contro_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['community', '-rising_score', '-id'], name='post_community_rising_idx'),
+        ),
+    ]
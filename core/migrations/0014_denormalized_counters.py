@@ -0,0 +1,37 @@
+from django.db import migrations, models
+
+
+def backfill_counters(apps, schema_editor):
+    from core.counters import reconcile_counters
+
+    reconcile_counters(
+        apps.get_model('core', 'Post'),
+        apps.get_model('core', 'Comment'),
+        apps.get_model('core', 'Community'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_post_ranking_scores'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='community',
+            name='member_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='community',
+            name='post_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
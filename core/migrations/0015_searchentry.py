@@ -0,0 +1,41 @@
+from django.db import migrations, models
+
+
+def create_fulltext_index(apps, schema_editor):
+    from core.search_backends import get_backend
+
+    get_backend(schema_editor.connection).create_index()
+
+
+def drop_fulltext_index(apps, schema_editor):
+    from core.search_backends import get_backend
+
+    get_backend(schema_editor.connection).drop_index()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_denormalized_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('post', 'Post'), ('comment', 'Comment'), ('community', 'Community'), ('user', 'User')], max_length=10)),
+                ('object_id', models.BigIntegerField()),
+                ('title', models.TextField(blank=True)),
+                ('meta', models.TextField(blank=True)),
+                ('body', models.TextField(blank=True)),
+                ('community_id', models.BigIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['kind', 'community_id', 'created_at'], name='search_entry_filter_idx')],
+                'constraints': [models.UniqueConstraint(fields=('kind', 'object_id'), name='unique_search_entry')],
+            },
+        ),
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+    ]
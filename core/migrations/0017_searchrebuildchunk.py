@@ -0,0 +1,26 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_searchindexupdate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchRebuildChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('table_name', models.CharField(max_length=63)),
+                ('kind', models.CharField(choices=[('post', 'Post'), ('comment', 'Comment'), ('community', 'Community'), ('user', 'User')], max_length=10)),
+                ('after_pk', models.BigIntegerField()),
+                ('last_pk', models.BigIntegerField()),
+                ('indexed', models.PositiveIntegerField(default=0)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+    ]
@@ -1,13 +1,16 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.urls import reverse
-from django.db.models.signals import post_save
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_save, post_delete, m2m_changed
 from django.dispatch import receiver
 from django.utils import timezone
 from django_countries.fields import CountryField
 from taggit.managers import TaggableManager
 from mptt.models import MPTTModel, TreeForeignKey
 from payments.models import BasePayment
+from .caching import invalidated_update
 import re
 
 class Profile(models.Model):
@@ -33,6 +36,10 @@ class Profile(models.Model):
     avatar = models.ImageField(upload_to=avatar_upload_path, blank=True, null=True)
     display_name = models.CharField(max_length=50, blank=True)
     
+    # Fields a profile is saved with; karma only changes through F() updates
+    # (see core.karma), which writing back a loaded value would undo
+    EDITABLE_FIELDS = ['bio', 'country', 'website', 'avatar', 'display_name']
+    
     # User interests as tags
     interests = TaggableManager(blank=True, verbose_name="Interests", 
                                help_text="A comma-separated list of topics you're interested in")
@@ -41,37 +48,14 @@ class Profile(models.Model):
         return f'{self.user.username} Profile'
         
     def update_karma(self):
-        """Calculate and update karma based on post and comment votes"""
-        # Get points from posts (1 point per upvote, -1 per downvote)
-        post_upvotes = sum([
-            post.votes.filter(value=1).count() for post in self.user.posts.all()
-        ])
-        post_downvotes = sum([
-            post.votes.filter(value=-1).count() for post in self.user.posts.all()
-        ])
-        
-        # Get points from comments (1 point per upvote, -1 per downvote)
-        comment_upvotes = sum([
-            comment.votes.filter(value=1).count() for comment in self.user.comments.all()
-        ])
-        comment_downvotes = sum([
-            comment.votes.filter(value=-1).count() for comment in self.user.comments.all()
-        ])
-        
-        # Post creation bonus (2 points per post)
-        post_creation_karma = self.user.posts.count() * 2
-        
-        # Comment creation bonus (1 point per comment)
-        comment_creation_karma = self.user.comments.count() * 1
-        
-        # Calculate total karma
-        self.karma = (post_upvotes - post_downvotes) + (comment_upvotes - comment_downvotes) + post_creation_karma + comment_creation_karma
+        """
+        Recalculate karma from scratch based on post and comment votes.
+        Karma is normally kept up to date incrementally; see core.karma.
+        """
+        from .karma import compute_karma
         
-        # Ensure karma is never negative for new users
-        if self.karma < 0 and self.user.date_joined.date() > (timezone.now().date() - timezone.timedelta(days=30)):
-            self.karma = 0
-            
-        self.save()
+        self.karma = compute_karma([self.user_id]).get(self.user_id, 0)
+        self.save(update_fields=['karma'])
         
     def get_reputation_level(self):
         """Return the user's reputation level based on karma"""
@@ -115,13 +99,16 @@ def create_user_profile(sender, instance, created, **kwargs):
 
 @receiver(post_save, sender=User)
 def save_user_profile(sender, instance, **kwargs):
-    instance.profile.save()
+    instance.profile.save(update_fields=Profile.EDITABLE_FIELDS)
 
 class Community(models.Model):
     name = models.CharField(max_length=50, unique=True)
     description = models.TextField(max_length=500)
     members = models.ManyToManyField(User, related_name='communities')
     created_at = models.DateTimeField(auto_now_add=True)
+    # Denormalized counters, maintained by signals below
+    member_count = models.PositiveIntegerField(default=0)
+    post_count = models.PositiveIntegerField(default=0)
     
     def __str__(self):
         return self.name
@@ -149,10 +136,27 @@ class Post(models.Model):
     # Denormalized vote counts (Reddit-style)
     upvote_count = models.PositiveIntegerField(default=0)
     downvote_count = models.PositiveIntegerField(default=0)
+    # Precomputed feed ranking scores, see core.ranking
+    hot_score = models.FloatField(default=0)
+    top_score = models.IntegerField(default=0)
+    controversy_score = models.FloatField(default=0)
+    rising_score = models.FloatField(default=0)
+    # Denormalized comment counter, maintained by signals below
+    comment_count = models.PositiveIntegerField(default=0)
     
     def __str__(self):
         return self.title
     
+    def save(self, *args, **kwargs):
+        # New posts start with the scores of an unvoted post
+        if self._state.adding:
+            from .ranking import compute_scores
+            if self.created_at is None:
+                self.created_at = timezone.now()
+            for field, value in compute_scores(self.upvote_count, self.downvote_count, self.created_at).items():
+                setattr(self, field, value)
+        super().save(*args, **kwargs)
+    
     def get_absolute_url(self):
         return reverse('post_detail', kwargs={'pk': self.pk})
     
@@ -162,13 +166,24 @@ class Post(models.Model):
         Reddit-style vote count using denormalized fields
         """
         return self.upvote_count - self.downvote_count
-        
-    @property
-    def comment_count(self):
-        return self.comments.count()
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Feed orderings, globally and per community
+            models.Index(fields=['-hot_score', '-id'], name='post_hot_idx'),
+            models.Index(fields=['-top_score', '-id'], name='post_top_idx'),
+            models.Index(fields=['-controversy_score', '-id'], name='post_controversy_idx'),
+            models.Index(fields=['-rising_score', '-id'], name='post_rising_idx'),
+            models.Index(fields=['community', '-hot_score', '-id'], name='post_community_hot_idx'),
+            models.Index(fields=['community', '-top_score', '-id'], name='post_community_top_idx'),
+            models.Index(fields=['community', '-controversy_score', '-id'], name='post_community_contro_idx'),
+            models.Index(fields=['community', '-rising_score', '-id'], name='post_community_rising_idx'),
+            # Newest first, globally, per community and per author
+            models.Index(fields=['-created_at', '-id'], name='post_new_idx'),
+            models.Index(fields=['community', '-created_at', '-id'], name='post_community_new_idx'),
+            models.Index(fields=['author', '-created_at', '-id'], name='post_author_new_idx'),
+        ]
 
 class Comment(MPTTModel):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comments')
@@ -195,6 +210,90 @@ class Comment(MPTTModel):
     
     class Meta:
         ordering = ['tree_id', 'lft']
+        indexes = [
+            # Root comments of a post in thread order, and replies to a comment
+            models.Index(fields=['post', 'parent', 'created_at'], name='comment_post_parent_idx'),
+            # Whole trees and subtrees as tree_id/lft range scans
+            models.Index(fields=['tree_id', 'lft'], name='comment_tree_idx'),
+            models.Index(fields=['author', '-created_at'], name='comment_author_new_idx'),
+        ]
+
+# Keep author karma up to date as content is created and deleted
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=Comment)
+def add_content_karma(sender, instance, created, **kwargs):
+    if created and not kwargs.get('raw'):
+        from .karma import adjust_karma, POST_KARMA, COMMENT_KARMA
+        adjust_karma(instance.author_id, POST_KARMA if sender is Post else COMMENT_KARMA)
+
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=Comment)
+def remove_content_karma(sender, instance, **kwargs):
+    from .karma import adjust_karma, POST_KARMA, COMMENT_KARMA
+    # Votes are removed by the cascade, so their karma goes with the content
+    creation_karma = POST_KARMA if sender is Post else COMMENT_KARMA
+    adjust_karma(instance.author_id, -(creation_karma + instance.vote_count))
+
+# Keep denormalized post, comment and member counters up to date
+def _adjust_counter(model, pk, field, delta):
+    if delta and pk:
+        invalidated_update(model.objects.filter(pk=pk), **{field: Greatest(F(field) + delta, 0)})
+
+@receiver(post_save, sender=Post)
+def add_post_count(sender, instance, created, **kwargs):
+    if created and not kwargs.get('raw'):
+        _adjust_counter(Community, instance.community_id, 'post_count', 1)
+
+@receiver(post_delete, sender=Post)
+def remove_post_count(sender, instance, **kwargs):
+    _adjust_counter(Community, instance.community_id, 'post_count', -1)
+
+@receiver(post_save, sender=Comment)
+def add_comment_count(sender, instance, created, **kwargs):
+    if created and not kwargs.get('raw'):
+        _adjust_counter(Post, instance.post_id, 'comment_count', 1)
+
+@receiver(post_delete, sender=Comment)
+def remove_comment_count(sender, instance, **kwargs):
+    _adjust_counter(Post, instance.post_id, 'comment_count', -1)
+
+@receiver(m2m_changed, sender=Community.members.through)
+def update_member_count(sender, instance, action, reverse, pk_set, **kwargs):
+    through = Community.members.through
+    own_field, other_field = ('user_id', 'community_id') if reverse else ('community_id', 'user_id')
+    
+    # Removals and clears report the requested ids, not the rows that
+    # actually existed, so record the real memberships beforehand
+    if action in ('pre_remove', 'pre_clear'):
+        existing = through.objects.filter(**{own_field: instance.pk})
+        if action == 'pre_remove':
+            existing = existing.filter(**{f'{other_field}__in': pk_set})
+        instance._removed_membership_ids = set(existing.values_list(other_field, flat=True))
+        return
+    
+    if action == 'post_add':
+        delta, pk_set = 1, pk_set or set()
+    elif action in ('post_remove', 'post_clear'):
+        delta, pk_set = -1, instance.__dict__.pop('_removed_membership_ids', set())
+    else:
+        return
+    
+    if not pk_set:
+        return
+    # Member counts are shown on the community list and pages
+    from .page_cache import invalidate_pages
+    invalidate_pages('communities', *(f'community:{pk}' for pk in (pk_set if reverse else [instance.pk])))
+    # Home feeds are built from the communities a user joined
+    from .home_feeds import invalidate_home_feeds
+    invalidate_home_feeds([instance.pk] if reverse else pk_set)
+    if reverse:
+        # user.communities.add(...): pk_set holds community ids
+        invalidated_update(
+            Community.objects.filter(pk__in=pk_set),
+            member_count=Greatest(F('member_count') + delta, 0),
+        )
+    else:
+        _adjust_counter(Community, instance.pk, 'member_count', delta * len(pk_set))
 
 class Vote(models.Model):
     VOTE_CHOICES = [
@@ -212,94 +311,69 @@ class Vote(models.Model):
         target = self.post if self.post else self.comment
         return f'{self.get_value_display()} by {self.user.username} on {target}'
     
-    def save(self, *args, **kwargs):
+    @property
+    def target(self):
+        """The post or comment this vote was cast on"""
+        return self.post if self.post_id else self.comment
+    
+    def _update_target_counts(self, old_value, new_value):
         """
-        Reddit-style vote processing:
-        When a vote is saved or updated, immediately update the denormalized count
-        on the target object (post or comment)
+        Atomically apply a vote transition to the target's counters and
+        the target author's karma.
+        
+        The database row is updated with F() expressions so concurrent votes
+        never overwrite each other; a cached target instance is kept in step.
         """
-        # Check if this is a new vote being created
-        is_new = self.pk is None
+        from .voting import count_deltas, update_vote_counts
+        from .karma import adjust_karma, vote_karma_delta
         
-        # If updating an existing vote, store the old value
-        old_value = None
-        if not is_new:
-            try:
-                old_vote = Vote.objects.get(pk=self.pk)
-                old_value = old_vote.value
-            except Vote.DoesNotExist:
-                pass
-                
-        # Call the parent save method to save the vote itself
-        super().save(*args, **kwargs)
+        if self.post_id:
+            model, target_id, cached = Post, self.post_id, Vote.post.is_cached(self)
+        elif self.comment_id:
+            model, target_id, cached = Comment, self.comment_id, Vote.comment.is_cached(self)
+        else:
+            return
         
-        # Update denormalized counts on the target
-        if self.post:
-            if is_new:
-                # New vote
-                if self.value == 1:
-                    self.post.upvote_count += 1
-                else:
-                    self.post.downvote_count += 1
-            elif old_value != self.value:
-                # Changed vote (e.g., upvote -> downvote)
-                if old_value == 1 and self.value == -1:
-                    # Ensure positive integer fields don't go negative
-                    self.post.upvote_count = max(0, self.post.upvote_count - 1)
-                    self.post.downvote_count += 1
-                elif old_value == -1 and self.value == 1:
-                    # Ensure positive integer fields don't go negative
-                    self.post.downvote_count = max(0, self.post.downvote_count - 1)
-                    self.post.upvote_count += 1
-            
-            self.post.save(update_fields=['upvote_count', 'downvote_count'])
+        upvotes, downvotes = count_deltas(old_value, new_value)
+        update_vote_counts(model, target_id, upvotes, downvotes)
+        adjust_karma(self.target.author_id, vote_karma_delta(old_value, new_value))
+        if model is Post:
+            from .ranking import refresh_post_scores
+            refresh_post_scores(target_id)
+        
+        if cached:
+            target = self.target
+            target.upvote_count = max(0, target.upvote_count + upvotes)
+            target.downvote_count = max(0, target.downvote_count + downvotes)
+    
+    def save(self, *args, **kwargs):
+        """
+        Reddit-style vote processing:
+        When a vote is saved or updated, update the denormalized count
+        on the target object (post or comment) in the same transaction.
+        Views should prefer core.voting.cast_vote, which avoids the extra read.
+        """
+        with transaction.atomic():
+            # If updating an existing vote, fetch the old value
+            old_value = None
+            if self.pk is not None:
+                old_value = Vote.objects.filter(pk=self.pk).values_list('value', flat=True).first()
             
-        elif self.comment:
-            if is_new:
-                # New vote
-                if self.value == 1:
-                    self.comment.upvote_count += 1
-                else:
-                    self.comment.downvote_count += 1
-            elif old_value != self.value:
-                # Changed vote (e.g., upvote -> downvote)
-                if old_value == 1 and self.value == -1:
-                    # Ensure positive integer fields don't go negative
-                    self.comment.upvote_count = max(0, self.comment.upvote_count - 1)
-                    self.comment.downvote_count += 1
-                elif old_value == -1 and self.value == 1:
-                    # Ensure positive integer fields don't go negative
-                    self.comment.downvote_count = max(0, self.comment.downvote_count - 1)
-                    self.comment.upvote_count += 1
+            # Call the parent save method to save the vote itself
+            super().save(*args, **kwargs)
             
-            self.comment.save(update_fields=['upvote_count', 'downvote_count'])
+            # Update denormalized counts on the target
+            if old_value != self.value:
+                self._update_target_counts(old_value, self.value)
     
     def delete(self, *args, **kwargs):
         """
         When a vote is deleted, update the denormalized counts on the target
         """
-        # Store references before deletion
-        post = self.post
-        comment = self.comment
-        value = self.value
-        
-        # Call the parent delete method
-        super().delete(*args, **kwargs)
-        
-        # Update denormalized counts
-        if post:
-            if value == 1:
-                post.upvote_count = max(0, post.upvote_count - 1)  # Ensure non-negative
-            else:
-                post.downvote_count = max(0, post.downvote_count - 1)
-            post.save(update_fields=['upvote_count', 'downvote_count'])
-            
-        elif comment:
-            if value == 1:
-                comment.upvote_count = max(0, comment.upvote_count - 1)
-            else:
-                comment.downvote_count = max(0, comment.downvote_count - 1)
-            comment.save(update_fields=['upvote_count', 'downvote_count'])
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            self._update_target_counts(self.value, None)
+        return result
     
     class Meta:
         # Ensure a user can only vote once on a post or comment
@@ -307,6 +381,11 @@ class Vote(models.Model):
             models.UniqueConstraint(fields=['user', 'post'], name='unique_post_vote', condition=models.Q(post__isnull=False)),
             models.UniqueConstraint(fields=['user', 'comment'], name='unique_comment_vote', condition=models.Q(comment__isnull=False)),
         ]
+        indexes = [
+            # Vote tallies by value; each covers only the votes on one kind of target
+            models.Index(fields=['post', 'value'], name='vote_post_value_idx', condition=models.Q(post__isnull=False)),
+            models.Index(fields=['comment', 'value'], name='vote_comment_value_idx', condition=models.Q(comment__isnull=False)),
+        ]
 
 class Notification(models.Model):
     """Model for storing user notifications"""
@@ -322,11 +401,19 @@ class Notification(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, null=True, blank=True)
     comment = models.ForeignKey(Comment, on_delete=models.CASCADE, null=True, blank=True)
     text = models.CharField(max_length=255)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # A vote rollup starts at the upvote that opened it (see core.notifications)
+    created_at = models.DateTimeField(default=timezone.now)
     is_read = models.BooleanField(default=False)
+    # Number of users a rolled-up vote notification stands for
+    count = models.PositiveIntegerField(default=1)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['recipient', '-created_at', '-id'], name='notification_recipient_idx'),
+            # Unread counts and vote rollup lookups; read rows are left out
+            models.Index(fields=['recipient', '-created_at'], name='notification_unread_idx', condition=models.Q(is_read=False)),
+        ]
         
     def __str__(self):
         return f'Notification for {self.recipient.username}: {self.text}'
@@ -336,11 +423,14 @@ class Notification(models.Model):
         self.save()
         
     @classmethod
-    def create_reply_notification(cls, comment):
-        """Create notification when a user replies to another user's post or comment"""
+    def build_reply_notification(cls, comment):
+        """
+        Return an unsaved notification for the author of the comment or post
+        a comment replies to, or None when there is nobody else to notify
+        """
         # Skip notification if user is replying to their own content
         if comment.parent and comment.parent.author != comment.author:
-            notification = cls.objects.create(
+            return cls(
                 recipient=comment.parent.author,
                 sender=comment.author,
                 notification_type='reply',
@@ -348,9 +438,8 @@ class Notification(models.Model):
                 comment=comment,
                 text=f"{comment.author.username} replied to your comment on '{comment.post.title}'"
             )
-            return notification
         elif comment.post.author != comment.author:
-            notification = cls.objects.create(
+            return cls(
                 recipient=comment.post.author,
                 sender=comment.author,
                 notification_type='reply',
@@ -358,86 +447,139 @@ class Notification(models.Model):
                 comment=comment,
                 text=f"{comment.author.username} commented on your post '{comment.post.title}'"
             )
-            return notification
         return None
     
+    @classmethod
+    def create_reply_notification(cls, comment):
+        """Create notification when a user replies to another user's post or comment"""
+        notification = cls.build_reply_notification(comment)
+        if notification:
+            notification.save()
+        return notification
+    
+    @staticmethod
+    def mentioned_usernames(content):
+        """Usernames @mentioned in some text, each once, in order of appearance"""
+        return list(dict.fromkeys(re.findall(r'@(\w+)', content or '')))
+    
+    @classmethod
+    def build_mention_notification(cls, mentioned_user, user, post=None, comment=None):
+        """Return an unsaved notification for a user mentioned in a post or comment"""
+        if comment:
+            return cls(
+                recipient=mentioned_user,
+                sender=user,
+                notification_type='mention',
+                post=comment.post,
+                comment=comment,
+                text=f"{user.username} mentioned you in a comment on '{comment.post.title}'"
+            )
+        return cls(
+            recipient=mentioned_user,
+            sender=user,
+            notification_type='mention',
+            post=post,
+            text=f"{user.username} mentioned you in post '{post.title}'"
+        )
+    
     @classmethod
     def create_mention_notifications(cls, user, content, post=None, comment=None):
         """Parse content for @mentions and create notifications"""
-        # Regular expression to find mentions (@username)
-        mentions = re.findall(r'@(\w+)', content)
-        created_notifications = []
+        from .notifications import invalidate_unread_count
         
-        for username in mentions:
-            try:
-                mentioned_user = User.objects.get(username=username)
-                # Skip self-mentions
-                if mentioned_user == user:
-                    continue
-                    
-                if post:
-                    notification = cls.objects.create(
-                        recipient=mentioned_user,
-                        sender=user,
-                        notification_type='mention',
-                        post=post,
-                        text=f"{user.username} mentioned you in post '{post.title}'"
-                    )
-                elif comment:
-                    notification = cls.objects.create(
-                        recipient=mentioned_user,
-                        sender=user,
-                        notification_type='mention',
-                        post=comment.post,
-                        comment=comment,
-                        text=f"{user.username} mentioned you in a comment on '{comment.post.title}'"
-                    )
-                created_notifications.append(notification)
-            except User.DoesNotExist:
-                # User mentioned doesn't exist, skip
-                continue
-                
+        # All mentioned users are loaded at once; names without a user are skipped
+        mentioned_users = User.objects.filter(
+            username__in=cls.mentioned_usernames(content)
+        ).exclude(pk=user.pk)
+        created_notifications = cls.objects.bulk_create([
+            cls.build_mention_notification(mentioned_user, user, post, comment)
+            for mentioned_user in mentioned_users
+        ])
+        # bulk_create() sends no post_save signals
+        invalidate_unread_count(*[notification.recipient_id for notification in created_notifications])
         return created_notifications
         
     @classmethod
     def create_vote_notification(cls, vote):
         """Create notification when a user receives an upvote on their post or comment"""
+        from .notifications import notify_upvote
+        
         # Only notify for upvotes (value=1), not downvotes
         if vote.value != 1:
             return None
-            
-        if vote.post:
-            # This is a post vote
-            # Don't notify if user is voting on their own post
-            if vote.user == vote.post.author:
-                return None
-                
-            notification = cls.objects.create(
-                recipient=vote.post.author,
-                sender=vote.user,
-                notification_type='vote',
-                post=vote.post,
-                text=f"{vote.user.username} upvoted your post '{vote.post.title}'"
-            )
-            return notification
-            
-        elif vote.comment:
-            # This is a comment vote
-            # Don't notify if user is voting on their own comment
-            if vote.user == vote.comment.author:
-                return None
-                
-            notification = cls.objects.create(
-                recipient=vote.comment.author,
-                sender=vote.user,
-                notification_type='vote',
-                post=vote.comment.post,
-                comment=vote.comment,
-                text=f"{vote.user.username} upvoted your comment on '{vote.comment.post.title}'"
-            )
-            return notification
-            
-        return None
+        return notify_upvote(vote.user, vote.post or vote.comment)
+
+# Keep the cached unread notification counts in step with the table
+@receiver(post_save, sender=Notification)
+@receiver(post_delete, sender=Notification)
+def invalidate_notification_count(sender, instance, **kwargs):
+    from .notifications import invalidate_unread_count
+    invalidate_unread_count(instance.recipient_id)
+
+# Reply and mention notifications of new content are delivered by the
+# notification worker
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=Comment)
+def queue_content_notifications(sender, instance, created, **kwargs):
+    if created:
+        from .notifications import queue_notifications
+        queue_notifications('post' if sender is Post else 'comment', instance.pk)
+
+# Cached renderings of comment threads are keyed on their tree's version
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_fragments(sender, instance, **kwargs):
+    if not kwargs.get('raw'):
+        from .comment_fragments import invalidate_trees
+        invalidate_trees([instance.tree_id])
+
+# Cached pages are keyed on the versions of the feed, community list,
+# community and post they show
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_pages(sender, instance, **kwargs):
+    if not kwargs.get('raw'):
+        from .page_cache import invalidate_pages
+        invalidate_pages('feed', f'community:{instance.community_id}', f'post:{instance.pk}')
+
+# Materialized feeds are updated as posts come and go, see core.feeds
+@receiver(post_save, sender=Post)
+def add_post_to_feeds(sender, instance, created, **kwargs):
+    if created and not kwargs.get('raw'):
+        from .feeds import update_post
+        update_post(instance)
+
+@receiver(post_delete, sender=Post)
+def remove_post_from_feeds(sender, instance, **kwargs):
+    from .feeds import remove_post
+    remove_post(instance)
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_comment_pages(sender, instance, **kwargs):
+    if not kwargs.get('raw'):
+        from .page_cache import invalidate_pages
+        invalidate_pages(f'post:{instance.post_id}')
+
+@receiver(post_save, sender=Community)
+@receiver(post_delete, sender=Community)
+def invalidate_community_pages(sender, instance, **kwargs):
+    if not kwargs.get('raw'):
+        from .page_cache import invalidate_pages
+        invalidate_pages('communities', f'community:{instance.pk}')
+
+@receiver(m2m_changed, sender=Profile.interests.through)
+def invalidate_interest_home_feed(sender, instance, action, **kwargs):
+    # Interests boost posts in the home feed
+    if isinstance(instance, Profile) and action in ('post_add', 'post_remove', 'post_clear'):
+        from .home_feeds import invalidate_home_feeds
+        invalidate_home_feeds([instance.user_id])
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def invalidate_post_tag_pages(sender, instance, action, **kwargs):
+    # Tags are shown wherever the post is
+    if isinstance(instance, Post) and action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_post_pages(Post, instance)
 
 class Payment(BasePayment):
     DONATION_LEVELS = [
@@ -480,3 +622,122 @@ class Payment(BasePayment):
     
     class Meta:
         ordering = ['-created_at']
+
+class SearchEntry(models.Model):
+    """
+    One document of the full-text search index, see core.search.
+    The inverted index itself is added by the database-specific backend.
+    """
+    KIND_CHOICES = [
+        ('post', 'Post'),
+        ('comment', 'Comment'),
+        ('community', 'Community'),
+        ('user', 'User'),
+    ]
+    
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    title = models.TextField(blank=True)
+    meta = models.TextField(blank=True)
+    body = models.TextField(blank=True)
+    # Filter columns, matched in the same query as the full-text index
+    community_id = models.BigIntegerField(null=True, blank=True)
+    created_at = models.DateTimeField()
+    
+    def __str__(self):
+        return f'{self.kind} {self.object_id}'
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='unique_search_entry'),
+        ]
+        indexes = [
+            models.Index(fields=['kind', 'community_id', 'created_at'], name='search_entry_filter_idx'),
+        ]
+
+class NotificationTask(models.Model):
+    """
+    A new post or comment whose reply and mention notifications are still to
+    be delivered by the notification worker, see core.notifications.
+    """
+    KIND_CHOICES = [
+        ('post', 'Post'),
+        ('comment', 'Comment'),
+    ]
+    
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    queued_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f'{self.kind} {self.object_id}'
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='unique_notification_task'),
+        ]
+
+class SearchIndexUpdate(models.Model):
+    """
+    An object whose search index entries must be refreshed by the search
+    worker. The unique constraint coalesces repeated updates of an object.
+    """
+    kind = models.CharField(max_length=10, choices=SearchEntry.KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    queued_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f'{self.kind} {self.object_id}'
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='unique_search_index_update'),
+        ]
+
+class SearchRebuildChunk(models.Model):
+    """
+    A pk range of one kind of object in a search index rebuild. Rows are the
+    rebuild's checkpoint: an interrupted rebuild resumes with the chunks that
+    have no completed_at, see core.search_rebuild.
+    """
+    table_name = models.CharField(max_length=63)
+    kind = models.CharField(max_length=10, choices=SearchEntry.KIND_CHOICES)
+    # The chunk covers after_pk < pk <= last_pk
+    after_pk = models.BigIntegerField()
+    last_pk = models.BigIntegerField()
+    indexed = models.PositiveIntegerField(default=0)
+    completed_at = models.DateTimeField(null=True, blank=True)
+    
+    def __str__(self):
+        return f'{self.kind} ({self.after_pk}, {self.last_pk}]'
+    
+    class Meta:
+        ordering = ['id']
+
+# Queue search index updates for the searchable models; the search worker
+# rebuilds or removes their entries in batches
+@receiver(post_save, sender=Post)
+@receiver(post_save, sender=Comment)
+@receiver(post_save, sender=Community)
+@receiver(post_delete, sender=Post)
+@receiver(post_delete, sender=Comment)
+@receiver(post_delete, sender=Community)
+@receiver(post_delete, sender=User)
+def queue_search_entry(sender, instance, **kwargs):
+    if not kwargs.get('raw'):
+        from .search import queue_index_update, kind_for_model
+        queue_index_update(kind_for_model(sender), [instance.pk])
+
+@receiver(post_save, sender=Profile)
+def queue_user_search_entry(sender, instance, **kwargs):
+    # Users are indexed with their profile, which is saved with every user
+    if not kwargs.get('raw'):
+        from .search import queue_index_update
+        queue_index_update('user', [instance.user_id])
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def queue_post_tags(sender, instance, action, **kwargs):
+    # Tags are part of the indexed text of posts
+    if isinstance(instance, Post) and action in ('post_add', 'post_remove', 'post_clear'):
+        from .search import queue_index_update
+        queue_index_update('post', [instance.pk])
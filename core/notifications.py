@@ -0,0 +1,188 @@
+"""
+Notification delivery and per-user cached unread notification counts.
+
+The count shown in the navigation bar is read from the shared cache instead
+of running a COUNT query on every page. Signals in core.models drop a user's
+cached count whenever one of their notifications is created, read or
+deleted; code that changes notifications with ``QuerySet.update()`` or
+``bulk_create()`` must call ``invalidate_unread_count`` itself because no
+signal fires.
+
+Reply and mention notifications of new posts and comments are not created
+in the request. A signal queues a NotificationTask once the transaction
+commits and the ``process_notification_queue`` worker delivers queued tasks
+in batches: the mentioned usernames of a whole batch are resolved with one
+query and its notifications written with one ``bulk_create``. Each recipient
+gets at most one notification per post or comment, however often they are
+mentioned in it. The worker also fans new posts out to home feeds, see
+core.home_feeds.
+
+Upvotes are rolled up: all upvotes of a post or comment within
+VOTE_ROLLUP_WINDOW update one unread notification ("X and 212 others upvoted
+your post") instead of adding a row each. The count is that of the users
+whose upvote still stands and was cast since the notification started, read
+from the Vote rows, so taking an upvote back and casting it again does not
+count the voter twice.
+"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .home_feeds import fan_out_posts
+from .models import Notification, NotificationTask, Post, Comment
+
+
+UNREAD_COUNT_TIMEOUT = 60 * 60 * 24
+
+# Upvotes of a target are added to its unread vote notification while that
+# notification is younger than this
+VOTE_ROLLUP_WINDOW = timezone.timedelta(days=1)
+
+
+def _unread_key(user_id):
+    return f'notifications:unread:{user_id}'
+
+
+def unread_count(user_id):
+    """Return the number of unread notifications of a user"""
+    count = cache.get(_unread_key(user_id))
+    if count is None:
+        count = Notification.objects.filter(recipient_id=user_id, is_read=False).count()
+        cache.set(_unread_key(user_id), count, UNREAD_COUNT_TIMEOUT)
+    return count
+
+
+def invalidate_unread_count(*user_ids):
+    """Forget the cached unread counts of the given users"""
+    cache.delete_many([_unread_key(user_id) for user_id in user_ids])
+
+
+def deliver_notifications(post_ids=(), comment_ids=()):
+    """
+    Create the reply and mention notifications of new posts and comments with
+    a fixed number of queries. Returns the number of notifications created.
+    """
+    posts = Post.objects.filter(pk__in=post_ids).select_related('author')
+    comments = Comment.objects.filter(pk__in=comment_ids).select_related('author', 'post__author', 'parent__author')
+    sources = [(post.author, post.content, post, None) for post in posts]
+    sources += [(comment.author, comment.content, None, comment) for comment in comments]
+
+    usernames = {username for _, content, _, _ in sources for username in Notification.mentioned_usernames(content)}
+    users = User.objects.in_bulk(usernames, field_name='username') if usernames else {}
+
+    notifications = []
+    for author, content, post, comment in sources:
+        # One notification per recipient and post or comment
+        notified = {author.pk}
+        if comment is not None:
+            reply = Notification.build_reply_notification(comment)
+            if reply:
+                notifications.append(reply)
+                notified.add(reply.recipient_id)
+        for username in Notification.mentioned_usernames(content):
+            mentioned_user = users.get(username)
+            if mentioned_user is None or mentioned_user.pk in notified:
+                continue
+            notified.add(mentioned_user.pk)
+            notifications.append(Notification.build_mention_notification(mentioned_user, author, post, comment))
+
+    Notification.objects.bulk_create(notifications)
+    recipient_ids = {notification.recipient_id for notification in notifications}
+    transaction.on_commit(lambda: invalidate_unread_count(*recipient_ids))
+    return len(notifications)
+
+
+def _deliver(post_ids=(), comment_ids=()):
+    deliver_notifications(post_ids=post_ids, comment_ids=comment_ids)
+    # New posts reach the home feeds of their readers in the same pass
+    fan_out_posts(post_ids)
+
+
+def queue_notifications(kind, object_id):
+    """
+    Schedule delivery of the notifications of a new post or comment once the
+    current transaction commits. With ``NOTIFICATIONS_ASYNC`` off they are
+    delivered right after the commit instead of by the worker.
+    """
+    if not getattr(settings, 'NOTIFICATIONS_ASYNC', True):
+        ids = {'post_ids' if kind == 'post' else 'comment_ids': [object_id]}
+        transaction.on_commit(lambda: _deliver(**ids))
+        return
+    task = NotificationTask(kind=kind, object_id=object_id)
+    transaction.on_commit(lambda: NotificationTask.objects.bulk_create([task], ignore_conflicts=True))
+
+
+def process_notification_queue(batch_size=500):
+    """
+    Deliver the notifications of one batch of queued posts and comments and
+    return how many tasks it covered. Concurrent workers skip each other's
+    locked rows.
+    """
+    with transaction.atomic():
+        batch = list(
+            NotificationTask.objects.select_for_update(skip_locked=True)
+            .order_by('id').values_list('id', 'kind', 'object_id')[:batch_size]
+        )
+        if not batch:
+            return 0
+        NotificationTask.objects.filter(id__in=[row[0] for row in batch]).delete()
+        _deliver(
+            post_ids=[object_id for _, kind, object_id in batch if kind == 'post'],
+            comment_ids=[object_id for _, kind, object_id in batch if kind == 'comment'],
+        )
+    
+    return len(batch)
+
+
+def upvote_text(voter, count, target):
+    """Text of a vote notification standing for ``count`` voters"""
+    if isinstance(target, Post):
+        what = f"your post '{target.title}'"
+    else:
+        what = f"your comment on '{target.post.title}'"
+    if count == 1:
+        text = f'{voter.username} upvoted {what}'
+    else:
+        others = count - 1
+        text = f'{voter.username} and {others} other{"s" if others > 1 else ""} upvoted {what}'
+    # Long titles must not overflow the text column
+    return text[:255]
+
+
+def notify_upvote(voter, target):
+    """
+    Tell the author of a post or comment about an upvote. Within
+    VOTE_ROLLUP_WINDOW the unread vote notification of the target is updated
+    in place. Returns the notification, or None for votes on one's own content.
+    """
+    if voter.pk == target.author_id:
+        return None
+    if isinstance(target, Post):
+        post, comment = target, None
+    else:
+        post, comment = target.post, target
+    upvotes = target.votes.filter(value=1).exclude(user_id=target.author_id)
+
+    with transaction.atomic():
+        # Locking the target serializes concurrent upvotes of it, including
+        # the first ones, which find no notification row to lock
+        list(type(target).objects.select_for_update().filter(pk=target.pk).values_list('pk', flat=True))
+        notification = Notification.objects.filter(
+            recipient_id=target.author_id, notification_type='vote', is_read=False,
+            post=post, comment=comment, created_at__gte=timezone.now() - VOTE_ROLLUP_WINDOW,
+        ).order_by('-created_at').first()
+        if notification is None:
+            # A rollup starts with the upvote that opens it; earlier ones
+            # were reported before
+            started = upvotes.filter(user=voter).values_list('created_at', flat=True).first()
+            notification = Notification(
+                recipient_id=target.author_id, notification_type='vote',
+                post=post, comment=comment, created_at=started or timezone.now(),
+            )
+        notification.count = max(upvotes.filter(created_at__gte=notification.created_at).count(), 1)
+        notification.sender = voter
+        notification.text = upvote_text(voter, notification.count, target)
+        notification.save()
+    return notification
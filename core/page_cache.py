@@ -0,0 +1,109 @@
+"""
+Shared cache of whole pages.
+
+The home feed, the community list and the community and post pages look the
+same to every viewer apart from a few holes (see core.holes). Their views
+render a shell with the holes left as placeholders, which is cached and then
+served to every viewer with their own holes filled in: their votes, unread
+counts, membership and account menu. Logged-in and logged-out viewers see
+different markup around the holes, so each gets a shell of their own.
+
+Shells are keyed on the URL and the versions of the tags the page depends on:
+'feed', 'communities', 'community:<id>' and 'post:<id>'. Writes start new
+versions of the tags they affect with ``invalidate_pages`` and the shells
+stored under the old ones simply expire. New, edited and deleted posts and
+communities reach the lists right away; vote and comment counters in them
+may lag by up to PAGE_CACHE_TIMEOUT seconds.
+
+Requests with flash messages pending are rendered without the cache.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+
+from .holes import fill, rendering_shell
+
+
+def _version_key(tag):
+    return f'page:version:{tag}'
+
+
+def page_versions(tags):
+    """Return the current versions of page tags, in order"""
+    keys = [_version_key(tag) for tag in tags]
+    values = cache.get_many(keys)
+    for key in keys:
+        if key not in values:
+            # Starting from the clock means an evicted version never comes
+            # back with a value older shells were stored under
+            cache.add(key, time.time_ns(), None)
+            values[key] = cache.get(key)
+    return [values[key] for key in keys]
+
+
+def _bump(tags):
+    for tag in tags:
+        try:
+            cache.incr(_version_key(tag))
+        except ValueError:
+            cache.add(_version_key(tag), time.time_ns(), None)
+
+
+def invalidate_pages(*tags):
+    """
+    Start new versions of page tags, now and again once the transaction
+    commits: a page rendered from uncommitted rows in between is never read.
+    """
+    tags = set(tags)
+    _bump(tags)
+    transaction.on_commit(lambda: _bump(tags))
+
+
+def _page_key(request, tags):
+    digest = hashlib.sha1(f'{request.get_host()}\0{request.get_full_path()}'.encode()).hexdigest()
+    versions = '-'.join(map(str, page_versions(tags)))
+    return f'page:{int(request.user.is_authenticated)}:{versions}:{digest}'
+
+
+def cached_page(*tags, unless=None):
+    """
+    Serve a view's GET requests from the page cache. ``tags`` are formatted
+    with the view's keyword arguments, e.g. ``@cached_page('post:{pk}')``.
+    Requests for which ``unless(request)`` is true are never cached, for
+    pages that differ per viewer beyond their holes.
+
+    The view always renders a shell and has its holes filled in afterwards,
+    so it reads the same whether or not PAGE_CACHE_ENABLED is set.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+
+            key = None
+            cacheable = unless is None or not unless(request)
+            if cacheable and getattr(settings, 'PAGE_CACHE_ENABLED', False) and not len(get_messages(request)):
+                key = _page_key(request, [tag.format(**kwargs) for tag in tags])
+                shell = cache.get(key)
+                if shell is not None:
+                    return HttpResponse(fill(shell, request))
+
+            with rendering_shell(request):
+                response = view(request, *args, **kwargs)
+            if response.streaming or not response.get('Content-Type', '').startswith('text/html'):
+                return response
+
+            shell = response.content.decode(response.charset)
+            if key is not None and response.status_code == 200:
+                cache.set(key, shell, getattr(settings, 'PAGE_CACHE_TIMEOUT', 60))
+            response.content = fill(shell, request)
+            return response
+        return wrapper
+    return decorator
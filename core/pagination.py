@@ -0,0 +1,144 @@
+"""
+Keyset (cursor) pagination.
+
+Instead of ``OFFSET n`` and a ``COUNT(*)``, each page is fetched with a
+``WHERE (key) < (last key seen)`` condition on an indexed ordering such as
+``(created_at, id)`` or ``(hot_score, id)``. Every page costs the same,
+however deep it is, and no total count is ever computed.
+"""
+import base64
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+class InvalidCursor(ValueError):
+    """Raised when a cursor cannot be decoded for the requested ordering"""
+
+
+def _field_name(ordering_field):
+    return ordering_field.lstrip('-')
+
+
+def _serialize(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def _deserialize(model, field_name, value):
+    try:
+        field = model._meta.get_field(field_name)
+    except FieldDoesNotExist:
+        return value
+    if field.get_internal_type() == 'DateTimeField':
+        parsed = parse_datetime(value) if isinstance(value, str) else None
+        if parsed is None:
+            raise InvalidCursor(f'Invalid datetime in cursor: {value!r}')
+        return parsed
+    # Values of the wrong type would only fail once they reach the database
+    if not isinstance(value, (int, float, str)):
+        raise InvalidCursor(f'Invalid {field_name} in cursor: {value!r}')
+    try:
+        return field.to_python(value)
+    except ValidationError as e:
+        raise InvalidCursor(f'Invalid {field_name} in cursor: {value!r}') from e
+
+
+def encode_cursor(obj, ordering):
+    """Encode the ordering key of an object as an opaque URL-safe cursor"""
+    values = [_serialize(getattr(obj, _field_name(field))) for field in ordering]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+
+def decode_cursor(cursor, model, ordering):
+    """Decode a cursor produced by ``encode_cursor`` for the same ordering"""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (ValueError, UnicodeError) as e:
+        raise InvalidCursor('Malformed cursor') from e
+
+    if not isinstance(values, list) or len(values) != len(ordering):
+        raise InvalidCursor('Cursor does not match the ordering')
+
+    return [_deserialize(model, _field_name(field), value) for field, value in zip(ordering, values)]
+
+
+def keyset_filter(ordering, values):
+    """
+    Build the Q object selecting rows strictly after ``values`` in ``ordering``.
+
+    For ``('-hot_score', '-id')`` this is
+    ``hot_score < v0 OR (hot_score = v0 AND id < v1)``.
+    """
+    condition = Q()
+    equal = Q()
+    for field, value in zip(ordering, values):
+        name = _field_name(field)
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        condition |= equal & Q(**{f'{name}__{lookup}': value})
+        equal &= Q(**{name: value})
+    return condition
+
+
+class CursorPage:
+    """
+    A page of results from keyset pagination.
+
+    Attributes:
+        object_list: The objects on this page
+        cursor: The cursor this page was requested with (None for the first page)
+        next_cursor: Cursor for the following page, or None on the last page
+    """
+
+    def __init__(self, object_list, cursor, next_cursor):
+        self.object_list = object_list
+        self.cursor = cursor
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+
+def paginate_by_cursor(queryset, ordering, cursor=None, per_page=10):
+    """
+    Return a ``CursorPage`` of ``queryset`` ordered by ``ordering``.
+
+    ``ordering`` must end in a unique field (normally ``id``) so the key is
+    total. A malformed cursor falls back to the first page.
+    """
+    ordering = tuple(ordering)
+    queryset = queryset.order_by(*ordering)
+
+    if cursor:
+        try:
+            values = decode_cursor(cursor, queryset.model, ordering)
+            queryset = queryset.filter(keyset_filter(ordering, values))
+        except InvalidCursor:
+            cursor = None
+
+    # Fetch one extra row to know whether there is a next page
+    rows = list(queryset[:per_page + 1])
+    object_list = rows[:per_page]
+    next_cursor = encode_cursor(object_list[-1], ordering) if len(rows) > per_page else None
+
+    return CursorPage(object_list, cursor, next_cursor)
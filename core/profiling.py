@@ -0,0 +1,399 @@
+"""
+Always-on request profiling with a small, fixed overhead.
+
+ProfilingMiddleware times every request and, through a database execute
+wrapper, each query it runs. Measurements are aggregated in memory per view
+and per query shape into log-scale latency histograms, so memory use does
+not grow with traffic. A fraction of requests is also watched by a sampling
+profiler: one background thread that records the stack of each watched
+request thread every few milliseconds, counted as collapsed stacks (the input
+format of flame graph tools).
+
+Every PROFILING_FLUSH_INTERVAL seconds a process writes its aggregates to a
+gzipped JSON file in PROFILING_DIR and starts over. Files older than
+PROFILING_RETENTION_DAYS, or past PROFILING_MAX_BYTES in total, are deleted
+at the same time. The admin profiling page merges the files with the live
+aggregates of the process serving it.
+"""
+import atexit
+import bisect
+import gzip
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+
+# Upper bounds of the latency histogram buckets in milliseconds, from 0.25 ms
+# to about 46 s in steps of √2; slower requests fall in a last, open bucket
+BUCKETS = [0.25 * 2 ** (i / 2) for i in range(36)]
+
+# Stacks are cut off at this many frames from the top
+MAX_STACK_DEPTH = 64
+
+# Query shapes are truncated to this many characters
+MAX_QUERY_LENGTH = 2000
+
+FILE_SUFFIX = '.json.gz'
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class Histogram:
+    """Counts of durations per bucket of BUCKETS"""
+
+    def __init__(self, counts=None):
+        self.counts = counts or [0] * (len(BUCKETS) + 1)
+
+    def add(self, ms):
+        self.counts[bisect.bisect_left(BUCKETS, ms)] += 1
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+
+    def percentile(self, pct):
+        """Upper bound of the bucket holding the given percentile"""
+        total = sum(self.counts)
+        if not total:
+            return 0.0
+        rank = pct / 100 * total
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return BUCKETS[index] if index < len(BUCKETS) else float('inf')
+        return BUCKETS[-1]
+
+
+class Aggregate:
+    """
+    Durations of the requests to one view, or of the runs of one query.
+
+    Attributes:
+        count: Number of requests or runs
+        total_ms, max_ms: Total and longest duration
+        queries, sql_ms: Queries run by the requests and their total duration
+            (views only)
+    """
+
+    def __init__(self, count=0, total_ms=0.0, max_ms=0.0, histogram=None, queries=0, sql_ms=0.0):
+        self.count = count
+        self.total_ms = total_ms
+        self.max_ms = max_ms
+        self.histogram = Histogram(histogram)
+        self.queries = queries
+        self.sql_ms = sql_ms
+
+    def add(self, ms, queries=0, sql_ms=0.0):
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        self.histogram.add(ms)
+        self.queries += queries
+        self.sql_ms += sql_ms
+
+    def merge(self, other):
+        self.count += other.count
+        self.total_ms += other.total_ms
+        self.max_ms = max(self.max_ms, other.max_ms)
+        self.histogram.merge(other.histogram)
+        self.queries += other.queries
+        self.sql_ms += other.sql_ms
+
+    @property
+    def mean_ms(self):
+        return self.total_ms / self.count if self.count else 0.0
+
+    def to_list(self):
+        return [self.count, self.total_ms, self.max_ms, self.histogram.counts, self.queries, self.sql_ms]
+
+
+class Profile:
+    """Aggregated measurements per view, per query shape and per sampled stack"""
+
+    def __init__(self, started=None):
+        self.started = started or time.time()
+        self.views = {}
+        self.queries = {}
+        self.stacks = {}  # view -> Counter of collapsed stacks
+
+    def record(self, view, ms, queries, stacks=None):
+        """Add one request; ``queries`` is a list of (shape, milliseconds)"""
+        self.views.setdefault(view, Aggregate()).add(ms, len(queries), sum(q_ms for _, q_ms in queries))
+        for shape, q_ms in queries:
+            self.queries.setdefault(shape, Aggregate()).add(q_ms)
+        if stacks:
+            self.stacks.setdefault(view, Counter()).update(stacks)
+
+    def merge(self, other):
+        self.started = min(self.started, other.started)
+        for name, aggregate in other.views.items():
+            self.views.setdefault(name, Aggregate()).merge(aggregate)
+        for shape, aggregate in other.queries.items():
+            self.queries.setdefault(shape, Aggregate()).merge(aggregate)
+        for name, stacks in other.stacks.items():
+            self.stacks.setdefault(name, Counter()).update(stacks)
+
+    def to_dict(self):
+        return {
+            'started': self.started,
+            'views': {name: aggregate.to_list() for name, aggregate in self.views.items()},
+            'queries': {shape: aggregate.to_list() for shape, aggregate in self.queries.items()},
+            'stacks': {name: dict(stacks) for name, stacks in self.stacks.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        profile = cls(data['started'])
+        profile.views = {name: Aggregate(*values) for name, values in data['views'].items()}
+        profile.queries = {shape: Aggregate(*values) for shape, values in data['queries'].items()}
+        profile.stacks = {name: Counter(stacks) for name, stacks in data['stacks'].items()}
+        return profile
+
+
+_IN_LIST = re.compile(r'\((?:\s*%s\s*,)+\s*%s\s*\)')
+_REPEATED_GROUP = re.compile(r'(\([^()]*\))(?:\s*,\s*\1)+')
+_WHITESPACE = re.compile(r'\s+')
+
+
+def query_shape(sql):
+    """SQL with variable-length IN lists and VALUES rows collapsed"""
+    sql = _WHITESPACE.sub(' ', sql).strip()
+    sql = _IN_LIST.sub('(%s, ...)', sql)
+    sql = _REPEATED_GROUP.sub(r'\1, ...', sql)
+    return sql[:MAX_QUERY_LENGTH]
+
+
+def collapse_stack(frame):
+    """A frame's stack as 'module:function' entries from the outermost, joined by ';'"""
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        code = frame.f_code
+        names.append(f'{frame.f_globals.get("__name__", code.co_filename)}:{code.co_name}')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class StackSampler:
+    """
+    A daemon thread that counts the stacks of the watched threads every
+    ``interval`` seconds. It is started on the first watch in a process, so
+    each forked server worker gets its own.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.watched = {}  # thread id -> Counter of collapsed stacks
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def watch(self, ident):
+        with self.lock:
+            self.watched[ident] = Counter()
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='stack-sampler', daemon=True)
+                self.thread.start()
+
+    def unwatch(self, ident):
+        with self.lock:
+            return self.watched.pop(ident, Counter())
+
+    def sample(self):
+        frames = sys._current_frames()
+        with self.lock:
+            for ident, stacks in self.watched.items():
+                frame = frames.get(ident)
+                if frame is not None:
+                    stacks[collapse_stack(frame)] += 1
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            self.sample()
+
+
+_lock = threading.Lock()
+_profile = Profile()
+_last_flush = time.monotonic()
+_sampler = StackSampler(_setting('PROFILING_SAMPLE_INTERVAL', 0.005))
+
+
+def snapshot():
+    """A copy of this process's aggregates since the last flush"""
+    with _lock:
+        return Profile.from_dict(_profile.to_dict())
+
+
+def flush():
+    """Write this process's aggregates to PROFILING_DIR, start over and apply retention"""
+    global _profile, _last_flush
+    with _lock:
+        profile, _profile = _profile, Profile()
+        _last_flush = time.monotonic()
+    if profile.views:
+        directory = _setting('PROFILING_DIR', 'profiles')
+        os.makedirs(directory, exist_ok=True)
+        name = f'{time.strftime("%Y%m%dT%H%M%S", time.gmtime(profile.started))}-{os.getpid()}{FILE_SUFFIX}'
+        path = os.path.join(directory, name)
+        with gzip.open(f'{path}.tmp', 'wt', encoding='utf-8') as out:
+            json.dump(profile.to_dict(), out, separators=(',', ':'))
+        # Readers never see a partly written file
+        os.replace(f'{path}.tmp', path)
+    apply_retention()
+
+
+def _profile_files(directory):
+    try:
+        entries = [entry for entry in os.scandir(directory) if entry.name.endswith(FILE_SUFFIX)]
+    except FileNotFoundError:
+        return []
+    return sorted(entries, key=lambda entry: entry.stat().st_mtime, reverse=True)
+
+
+def apply_retention():
+    """Delete profile files past the retention age, then the oldest past the size cap"""
+    cutoff = time.time() - _setting('PROFILING_RETENTION_DAYS', 7) * 24 * 60 * 60
+    max_bytes = _setting('PROFILING_MAX_BYTES', 100 * 1024 * 1024)
+    kept = 0
+    removed = 0
+    for entry in _profile_files(_setting('PROFILING_DIR', 'profiles')):
+        stat = entry.stat()
+        if stat.st_mtime < cutoff or kept + stat.st_size > max_bytes:
+            try:
+                os.remove(entry.path)
+                removed += 1
+            except FileNotFoundError:
+                pass  # Another process got there first
+        else:
+            kept += stat.st_size
+    return removed
+
+
+def load_profile(since=None, include_live=True):
+    """
+    Merge the profile files written since the ``since`` timestamp, and the
+    live aggregates of this process, into one Profile
+    """
+    merged = Profile()
+    for entry in _profile_files(_setting('PROFILING_DIR', 'profiles')):
+        if since is not None and entry.stat().st_mtime < since:
+            continue
+        try:
+            with gzip.open(entry.path, 'rt', encoding='utf-8') as data:
+                merged.merge(Profile.from_dict(json.load(data)))
+        except (OSError, ValueError, KeyError):
+            continue  # Deleted by retention meanwhile, or damaged
+    if include_live:
+        merged.merge(snapshot())
+    return merged
+
+
+def _view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return '<unresolved>'
+    return match.view_name or match._func_path
+
+
+class ProfilingMiddleware:
+    """
+    Records the duration and queries of every request into the process's
+    aggregates, with stack samples for PROFILING_SAMPLE_RATE of them.
+    Place it first in MIDDLEWARE so that it times the whole stack.
+    """
+
+    def __init__(self, get_response):
+        if not _setting('PROFILING_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = _setting('PROFILING_SAMPLE_RATE', 0.01)
+        self.flush_interval = _setting('PROFILING_FLUSH_INTERVAL', 60)
+        atexit.register(flush)
+
+    def __call__(self, request):
+        queries = []
+
+        def record_query(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                queries.append((sql, (time.perf_counter() - started) * 1000))
+
+        sampled = random.random() < self.sample_rate
+        ident = threading.get_ident()
+        if sampled:
+            _sampler.watch(ident)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(record_query))
+                response = self.get_response(request)
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            stacks = _sampler.unwatch(ident) if sampled else None
+
+        shapes = [(query_shape(sql), ms) for sql, ms in queries]
+        with _lock:
+            _profile.record(_view_name(request), elapsed, shapes, stacks)
+            due = time.monotonic() - _last_flush >= self.flush_interval
+        if due:
+            flush()
+        return response
+
+
+# Orderings of the slow views report
+VIEW_ORDERINGS = {
+    'p95': lambda aggregate: aggregate.histogram.percentile(95),
+    'total': lambda aggregate: aggregate.total_ms,
+    'count': lambda aggregate: aggregate.count,
+    'queries': lambda aggregate: aggregate.queries / aggregate.count,
+}
+
+
+def top_views(profile, limit=20, order='p95'):
+    """The ``limit`` slowest views of a profile as report rows"""
+    ranked = sorted(profile.views.items(), key=lambda item: VIEW_ORDERINGS[order](item[1]), reverse=True)
+    return [
+        {
+            'name': name,
+            'count': aggregate.count,
+            'mean_ms': aggregate.mean_ms,
+            'p50_ms': aggregate.histogram.percentile(50),
+            'p95_ms': aggregate.histogram.percentile(95),
+            'p99_ms': aggregate.histogram.percentile(99),
+            'max_ms': aggregate.max_ms,
+            'queries': aggregate.queries / aggregate.count,
+            'sql_share': aggregate.sql_ms / aggregate.total_ms if aggregate.total_ms else 0.0,
+            'sampled': sum(profile.stacks.get(name, {}).values()),
+        }
+        for name, aggregate in ranked[:limit]
+    ]
+
+
+def top_queries(profile, limit=20):
+    """The ``limit`` query shapes with the most total time as report rows"""
+    ranked = sorted(profile.queries.items(), key=lambda item: item[1].total_ms, reverse=True)
+    return [
+        {
+            'sql': shape,
+            'count': aggregate.count,
+            'total_ms': aggregate.total_ms,
+            'mean_ms': aggregate.mean_ms,
+            'p95_ms': aggregate.histogram.percentile(95),
+            'max_ms': aggregate.max_ms,
+        }
+        for shape, aggregate in ranked[:limit]
+    ]
@@ -0,0 +1,125 @@
+"""
+Precomputed ranking scores for post feeds.
+
+Each post stores its hot, top, controversial and rising scores so feeds can be
+served from a (community, score) index instead of aggregating votes on every
+request. Scores are updated whenever a post's vote counters change, along
+with the materialized feeds of core.feeds, and the time-dependent rising
+score is refreshed by the ``refresh_rankings`` command.
+"""
+from datetime import datetime, timezone as dt_timezone
+from math import log10
+
+from django.utils import timezone
+
+from .caching import invalidate_model_cache, invalidated_update
+
+
+# Reddit's epoch offset keeps hot scores in a comfortable float range
+HOT_EPOCH = datetime(2005, 12, 8, 7, 46, 43, tzinfo=dt_timezone.utc)
+# Seconds of age that are worth one order of magnitude of votes
+HOT_DECAY_SECONDS = 45000
+
+# Posts older than this no longer compete in the rising feed
+RISING_WINDOW_HOURS = 48
+RISING_GRAVITY = 1.5
+
+RANKING_FIELDS = ['hot_score', 'top_score', 'controversy_score', 'rising_score']
+
+# Feed sort names mapped to orderings backed by the post indexes
+FEED_ORDERINGS = {
+    'new': ('-created_at', '-id'),
+    'hot': ('-hot_score', '-id'),
+    'top': ('-top_score', '-id'),
+    'controversial': ('-controversy_score', '-id'),
+    'rising': ('-rising_score', '-id'),
+}
+DEFAULT_FEED_SORT = 'new'
+
+
+def hot_score(upvotes, downvotes, created_at):
+    """Vote score on a log scale plus a bonus that grows with post time"""
+    score = upvotes - downvotes
+    order = log10(max(abs(score), 1))
+    sign = 1 if score > 0 else -1 if score < 0 else 0
+    seconds = (created_at - HOT_EPOCH).total_seconds()
+    return round(sign * order + seconds / HOT_DECAY_SECONDS, 7)
+
+
+def controversy_score(upvotes, downvotes):
+    """High when a post has many votes that are split evenly"""
+    if upvotes <= 0 or downvotes <= 0:
+        return 0.0
+    magnitude = upvotes + downvotes
+    balance = downvotes / upvotes if upvotes > downvotes else upvotes / downvotes
+    return magnitude ** balance
+
+
+def rising_score(upvotes, downvotes, created_at, now=None):
+    """Score per hour of age, for recent posts only"""
+    now = now or timezone.now()
+    age_hours = max((now - created_at).total_seconds() / 3600, 0)
+    if age_hours > RISING_WINDOW_HOURS:
+        return 0.0
+    return (upvotes - downvotes) / (age_hours + 2) ** RISING_GRAVITY
+
+
+def compute_scores(upvotes, downvotes, created_at, now=None):
+    """Return a dictionary of all ranking fields for the given counters"""
+    return {
+        'hot_score': hot_score(upvotes, downvotes, created_at),
+        'top_score': upvotes - downvotes,
+        'controversy_score': controversy_score(upvotes, downvotes),
+        'rising_score': rising_score(upvotes, downvotes, created_at, now),
+    }
+
+
+def update_post_scores(post, now=None):
+    """Recompute the scores of a post from its in-memory counters and save them"""
+    scores = compute_scores(post.upvote_count, post.downvote_count, post.created_at, now)
+    for field, value in scores.items():
+        setattr(post, field, value)
+    invalidated_update(type(post).objects.filter(pk=post.pk), **scores)
+
+    from .feeds import update_post
+    update_post(post)
+
+
+def update_many_post_scores(posts, now=None):
+    """
+    Recompute the scores of several posts from their in-memory counters and
+    save them with one bulk_update()
+    """
+    if not posts:
+        return
+    for post in posts:
+        for field, value in compute_scores(post.upvote_count, post.downvote_count, post.created_at, now).items():
+            setattr(post, field, value)
+    model = type(posts[0])
+    model.objects.bulk_update(posts, RANKING_FIELDS)
+    # bulk_update() bypasses the query cache invalidation
+    invalidate_model_cache(model)
+
+    from .feeds import update_post
+    for post in posts:
+        update_post(post)
+
+
+def refresh_post_scores(post_id, now=None):
+    """Recompute the scores of a post from the counters stored in the database"""
+    from .models import Post
+
+    from .feeds import update_post
+
+    row = Post.objects.filter(pk=post_id)\
+        .values_list('upvote_count', 'downvote_count', 'created_at', 'community_id').first()
+    if row is not None:
+        upvotes, downvotes, created_at, community_id = row
+        scores = compute_scores(upvotes, downvotes, created_at, now=now)
+        invalidated_update(Post.objects.filter(pk=post_id), **scores)
+        update_post(Post(pk=post_id, created_at=created_at, community_id=community_id, **scores))
+
+
+def feed_ordering(sort):
+    """Return the order_by() arguments for a feed sort, falling back to 'new'"""
+    return FEED_ORDERINGS.get(sort, FEED_ORDERINGS[DEFAULT_FEED_SORT])
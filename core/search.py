@@ -0,0 +1,383 @@
+"""
+Full-text search over posts, comments, communities and users.
+
+Every searchable object has one SearchEntry row holding its indexed text and
+the columns results can be filtered by. The database-specific inverted index
+over them is maintained by the backend in core.search_backends.
+
+Saves and deletes don't touch the index inside the request. Signals in
+core.models queue a SearchIndexUpdate row once the transaction commits, and
+the ``process_search_queue`` worker applies queued updates in batches,
+refreshing both this index and watson's. The queue holds one row per object,
+so an object saved many times before the worker runs is reindexed once.
+
+Searching returns hydrated model instances, loaded with one query per kind
+of result, carrying ``search_rank`` and ``search_snippet`` attributes.
+``cached_search`` caches the ids and snippets of results in the shared cache
+and only runs the hydration query for repeated searches.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.db.models import F
+from django.db.models.expressions import RawSQL
+from django.utils import timezone
+
+from .models import Post, Comment, Community, SearchEntry, SearchIndexUpdate
+from .search_backends import get_backend, ENTRY_TABLE
+
+
+# Maximum number of results returned per kind of object
+SEARCH_LIMIT = 50
+
+# Cached hits expire after this long even without index changes, which
+# bounds how stale sorts by vote and comment counts can get
+SEARCH_CACHE_TIMEOUT = 5 * 60
+
+TIME_RANGES = {
+    'day': timezone.timedelta(days=1),
+    'week': timezone.timedelta(weeks=1),
+    'month': timezone.timedelta(days=30),
+    'year': timezone.timedelta(days=365),
+}
+
+# Columns written to index tables, in insertion order
+ENTRY_COLUMNS = ('kind', 'object_id', 'title', 'meta', 'body', 'community_id', 'created_at')
+
+SEARCH_MODELS = {
+    'post': Post,
+    'comment': Comment,
+    'community': Community,
+    'user': User,
+}
+
+# Sorts that are answered by the index itself
+INDEX_ORDERS = ('relevance', 'newest', 'oldest')
+
+# Sorts by columns of the searched table; the index supplies the matching ids
+MODEL_ORDERINGS = {
+    'post': {
+        'most_votes': ('-top_score', '-id'),
+        'most_comments': ('-comment_count', '-id'),
+    },
+    'comment': {
+        'most_votes': ((F('upvote_count') - F('downvote_count')).desc(), '-id'),
+    },
+    'community': {
+        'most_members': ('-member_count', '-id'),
+    },
+    'user': {
+        'most_karma': ('-profile__karma', '-id'),
+    },
+}
+
+
+def kind_for_model(model):
+    for kind, search_model in SEARCH_MODELS.items():
+        if issubclass(model, search_model):
+            return kind
+    raise ValueError(f'{model.__name__} is not searchable')
+
+
+# Document builders. Each one loads all the objects it is given and their
+# related data with a fixed number of queries and returns unsaved entries.
+
+def _post_entries(ids):
+    posts = Post.objects.filter(pk__in=ids).select_related('author', 'community').prefetch_related('tags')
+    for post in posts:
+        tags = ' '.join(tag.name for tag in post.tags.all())
+        yield SearchEntry(
+            kind='post', object_id=post.pk, title=post.title,
+            meta=f'{tags} {post.community.name} {post.author.username}',
+            body=post.content or post.url or '',
+            community_id=post.community_id, created_at=post.created_at,
+        )
+
+
+def _comment_entries(ids):
+    comments = Comment.objects.filter(pk__in=ids).select_related('author', 'post')
+    for comment in comments:
+        yield SearchEntry(
+            kind='comment', object_id=comment.pk, title='',
+            meta=f'{comment.post.title} {comment.author.username}',
+            body=comment.content,
+            community_id=comment.post.community_id, created_at=comment.created_at,
+        )
+
+
+def _community_entries(ids):
+    for community in Community.objects.filter(pk__in=ids):
+        yield SearchEntry(
+            kind='community', object_id=community.pk, title=community.name,
+            meta='', body=community.description,
+            community_id=community.pk, created_at=community.created_at,
+        )
+
+
+def _user_entries(ids):
+    for user in User.objects.filter(pk__in=ids).select_related('profile'):
+        profile = getattr(user, 'profile', None)
+        yield SearchEntry(
+            kind='user', object_id=user.pk, title=user.username,
+            meta=profile.display_name if profile else '',
+            body=profile.bio if profile else '',
+            created_at=user.date_joined,
+        )
+
+
+ENTRY_BUILDERS = {
+    'post': _post_entries,
+    'comment': _comment_entries,
+    'community': _community_entries,
+    'user': _user_entries,
+}
+
+
+def build_entries(kind, ids):
+    """Return unsaved SearchEntry objects for the given objects of a kind"""
+    return list(ENTRY_BUILDERS[kind](ids))
+
+
+def _placeholders(values):
+    return ', '.join(['%s'] * len(values))
+
+
+def remove_objects(kind, ids, table=ENTRY_TABLE):
+    """Remove objects from the search index"""
+    ids = list(ids)
+    if not ids:
+        return
+    if table == ENTRY_TABLE:
+        community_ids = SearchEntry.objects.filter(kind=kind, object_id__in=ids).values_list('community_id', flat=True)
+        _invalidate_on_commit(kind, community_ids.distinct())
+    with transaction.atomic():
+        get_backend().entries_removing(kind, ids, table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {table} WHERE kind = %s AND object_id IN ({_placeholders(ids)})',
+                [kind] + ids,
+            )
+
+
+def write_entries(kind, entries, table=ENTRY_TABLE):
+    """Insert built entries of one kind into an index table"""
+    if not entries:
+        return
+    rows = [
+        (entry.kind, entry.object_id, entry.title, entry.meta, entry.body, entry.community_id,
+         connection.ops.adapt_datetimefield_value(entry.created_at))
+        for entry in entries
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {table} ({", ".join(ENTRY_COLUMNS)}) VALUES ({_placeholders(ENTRY_COLUMNS)})',
+            rows,
+        )
+    get_backend().entries_added(kind, [entry.object_id for entry in entries], table)
+    if table == ENTRY_TABLE:
+        _invalidate_on_commit(kind, {entry.community_id for entry in entries})
+
+
+def index_objects(kind, ids, table=ENTRY_TABLE):
+    """(Re)index objects; ids of objects that no longer exist are removed"""
+    ids = list(ids)
+    if not ids:
+        return
+    entries = build_entries(kind, ids)
+    with transaction.atomic():
+        remove_objects(kind, ids, table)
+        write_entries(kind, entries, table)
+
+
+def apply_index_updates(kind, ids):
+    """Refresh the full-text and watson index entries of some objects now"""
+    from .search_adapters import update_watson_index
+    from .search_rebuild import shadow_tables
+
+    index_objects(kind, ids)
+    # A rebuild in progress must not miss changes to chunks it has done
+    for table in shadow_tables():
+        index_objects(kind, ids, table)
+    update_watson_index(kind, ids)
+
+
+def queue_index_update(kind, ids):
+    """
+    Schedule a refresh of the index entries of some objects once the current
+    transaction commits. With ``SEARCH_INDEX_ASYNC`` off the refresh runs
+    right after the commit instead of in the worker.
+    """
+    ids = list(ids)
+    if not ids:
+        return
+    if not getattr(settings, 'SEARCH_INDEX_ASYNC', True):
+        transaction.on_commit(lambda: apply_index_updates(kind, ids))
+        return
+    updates = [SearchIndexUpdate(kind=kind, object_id=object_id) for object_id in ids]
+    # Objects already waiting in the queue are not queued twice
+    transaction.on_commit(lambda: SearchIndexUpdate.objects.bulk_create(updates, ignore_conflicts=True))
+
+
+def process_index_queue(batch_size=500):
+    """
+    Apply one batch of queued index updates and return how many objects it
+    covered. Concurrent workers skip each other's locked rows.
+    """
+    with transaction.atomic():
+        batch = list(
+            SearchIndexUpdate.objects.select_for_update(skip_locked=True)
+            .order_by('id').values_list('id', 'kind', 'object_id')[:batch_size]
+        )
+        if not batch:
+            return 0
+        # Deleting first lets an object changed while we work be queued again
+        SearchIndexUpdate.objects.filter(id__in=[row[0] for row in batch]).delete()
+        
+        ids_by_kind = {}
+        for _, kind, object_id in batch:
+            ids_by_kind.setdefault(kind, []).append(object_id)
+        for kind, ids in ids_by_kind.items():
+            apply_index_updates(kind, ids)
+    
+    return len(batch)
+
+
+def _hydration_queryset(kind):
+    """The queryset search results of a kind are loaded from"""
+    if kind == 'post':
+        return Post.objects.select_related('author', 'community').prefetch_related('tags')
+    if kind == 'comment':
+        return Comment.objects.select_related('author', 'post')
+    if kind == 'user':
+        return User.objects.select_related('profile')
+    return SEARCH_MODELS[kind].objects.all()
+
+
+def search_hits(query, kind, community_id=None, since=None, sort='relevance', limit=SEARCH_LIMIT):
+    """
+    Return ``(object_id, rank, snippet)`` tuples of the best matches of one
+    kind, without loading the objects.
+
+    ``community_id`` and ``since`` restrict results to a community and to
+    objects created after a datetime; both are applied inside the index
+    query. ``sort`` is 'relevance', 'newest', 'oldest' or one of the
+    per-kind sorts in MODEL_ORDERINGS.
+    """
+    backend = get_backend()
+    model_ordering = MODEL_ORDERINGS[kind].get(sort)
+
+    if model_ordering is None:
+        order = sort if sort in INDEX_ORDERS else 'relevance'
+        return backend.search(query, kind, community_id, since, order, limit)
+
+    # Let the database order the full match set by the model column
+    sql, params = backend.match_sql(query, kind, community_id, since)
+    ids = list(
+        SEARCH_MODELS[kind].objects.filter(pk__in=RawSQL(sql, params))
+        .order_by(*model_ordering).values_list('pk', flat=True)[:limit]
+    )
+    snippets = backend.snippets(query, kind, ids)
+    return [(pk, None, snippets.get(pk, '')) for pk in ids]
+
+
+def hydrate(kind, hits):
+    """
+    Load the objects of search hits with one query, in hit order, setting
+    their ``search_rank`` and ``search_snippet`` attributes
+    """
+    objects = _hydration_queryset(kind).in_bulk([object_id for object_id, _, _ in hits])
+    results = []
+    for object_id, rank, snippet in hits:
+        # Objects deleted since they were indexed are skipped
+        obj = objects.get(object_id)
+        if obj is not None:
+            obj.search_rank = rank
+            obj.search_snippet = snippet
+            results.append(obj)
+    return results
+
+
+def search(query, kind, community_id=None, since=None, sort='relevance', limit=SEARCH_LIMIT):
+    """Search one kind of object, see search_hits(). Returns a list of model instances."""
+    return hydrate(kind, search_hits(query, kind, community_id, since, sort, limit))
+
+
+# Cached searches. Hits are cached under the generations of their scope: the
+# whole index, and the kind either overall or within the community searched.
+# Index changes start new generations of the scopes they touch once they
+# commit, so cached hits are never read again after the content they were
+# computed from changed; older entries simply expire.
+
+def normalize_query(query):
+    """Queries differing only in case and whitespace match the same documents"""
+    return ' '.join(query.lower().split())
+
+
+def _generation_key(kind=None, community_id=None):
+    if kind is None:
+        return 'search:generation'
+    if community_id is None:
+        return f'search:generation:{kind}'
+    return f'search:generation:{kind}:{community_id}'
+
+
+def _generations(keys):
+    values = cache.get_many(keys)
+    for key in keys:
+        if key not in values:
+            # Starting from the clock means an evicted generation never
+            # comes back with a value older entries were stored under
+            cache.add(key, time.time_ns(), None)
+            values[key] = cache.get(key)
+    return [values[key] for key in keys]
+
+
+def invalidate_search_cache(kind=None, community_ids=()):
+    """
+    Start new generations for a kind, overall and in the given communities,
+    or for the whole index when no kind is given
+    """
+    keys = [_generation_key(kind)]
+    if kind is not None:
+        keys += [_generation_key(kind, community_id) for community_id in set(community_ids) if community_id is not None]
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), None)
+
+
+def _invalidate_on_commit(kind, community_ids):
+    community_ids = list(community_ids)
+    transaction.on_commit(lambda: invalidate_search_cache(kind, community_ids))
+
+
+def cached_search(query, kind, community_id=None, time_range=None, sort='relevance', limit=SEARCH_LIMIT):
+    """
+    search() through the shared cache. ``time_range`` is a key of TIME_RANGES
+    instead of a datetime, so that equal searches share a cache entry.
+    """
+    query = normalize_query(query)
+    if not query:
+        return []
+    generations = _generations([_generation_key(), _generation_key(kind, community_id)])
+    digest = hashlib.sha1(f'{query}\0{sort}\0{time_range}\0{limit}'.encode()).hexdigest()
+    key = f'search:hits:{kind}:{community_id}:{"-".join(map(str, generations))}:{digest}'
+
+    hits = cache.get(key)
+    if hits is None:
+        since = timezone.now() - TIME_RANGES[time_range] if time_range in TIME_RANGES else None
+        hits = search_hits(query, kind, community_id, since, sort, limit)
+        cache.set(key, hits, SEARCH_CACHE_TIMEOUT)
+    return hydrate(kind, hits)
+
+
+def filter_queryset(queryset, query, kind='post'):
+    """Restrict a queryset of a searchable model to the objects matching a query"""
+    sql, params = get_backend().match_sql(query, kind)
+    return queryset.filter(pk__in=RawSQL(sql, params))
+
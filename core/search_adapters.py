@@ -1,4 +1,14 @@
+"""
+Watson search adapters.
+
+Watson does not update its index on save: register_search_adapters()
+disconnects its post_save receivers and the search worker refreshes entries
+in batches through update_watson_index(), see core.search. Each adapter's
+get_live_queryset() loads the related data its methods use, so indexing a
+batch costs a fixed number of queries instead of several per object.
+"""
 from django.contrib.auth.models import User
+from django.db.models.signals import post_save
 from django.utils.html import mark_safe
 from django.urls import reverse
 from watson import search as watson
@@ -7,6 +17,9 @@ from .models import Post, Community, Comment, Profile
 
 
 class PostSearchAdapter(watson.SearchAdapter):
+    def get_live_queryset(self):
+        return self.model._default_manager.all().select_related('author', 'community').prefetch_related('tags')
+    
     def get_title(self, obj):
         return obj.title
     
@@ -40,6 +53,9 @@ class CommunitySearchAdapter(watson.SearchAdapter):
 
 
 class CommentSearchAdapter(watson.SearchAdapter):
+    def get_live_queryset(self):
+        return self.model._default_manager.all().select_related('author', 'post')
+    
     def get_title(self, obj):
         return f"Comment on: {obj.post.title}"
     
@@ -66,6 +82,9 @@ class UserSearchAdapter(watson.SearchAdapter):
 
 
 class ProfileSearchAdapter(watson.SearchAdapter):
+    def get_live_queryset(self):
+        return self.model._default_manager.all().select_related('user').prefetch_related('interests')
+    
     def get_title(self, obj):
         return f"Profile: {obj.user.username}"
     
@@ -83,6 +102,33 @@ class ProfileSearchAdapter(watson.SearchAdapter):
         return reverse('profile', kwargs={'username': obj.user.username})
 
 
+# Watson models refreshed for each kind of queued index update, with the
+# field that holds the queued object id
+WATSON_MODELS = {
+    'post': [(Post, 'pk')],
+    'comment': [(Comment, 'pk')],
+    'community': [(Community, 'pk')],
+    'user': [(User, 'pk'), (Profile, 'user_id')],
+}
+
+
+def update_watson_index(kind, ids):
+    """
+    Refresh watson's entries for a batch of objects.
+    Entries of deleted objects are removed by watson's own pre_delete receiver.
+    """
+    engine = watson.default_search_engine
+    for model, field in WATSON_MODELS[kind]:
+        if not engine.is_registered(model):
+            continue
+        # Watson's base adapter returns None, meaning every object is live
+        queryset = engine.get_adapter(model).get_live_queryset()
+        if queryset is None:
+            queryset = model._default_manager.all()
+        for obj in queryset.filter(**{f'{field}__in': ids}):
+            engine.update_obj_index(obj)
+
+
 def register_search_adapters():
     """
     Register all search adapters with watson
@@ -119,3 +165,7 @@ def register_search_adapters():
     watson.register(Comment, CommentSearchAdapter)
     watson.register(User, UserSearchAdapter)
     watson.register(Profile, ProfileSearchAdapter)
+    
+    # Index updates are queued and applied in batches by the search worker
+    for model in (Post, Community, Comment, User, Profile):
+        post_save.disconnect(watson.default_search_engine._post_save_receiver, sender=model)
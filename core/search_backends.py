@@ -0,0 +1,402 @@
+"""
+Database-specific full-text search backends for core.search.
+
+Documents live in the ``core_searchentry`` table (the SearchEntry model).
+Each backend adds its own inverted index next to it:
+
+- PostgreSQL: a generated ``tsvector`` column with a GIN index, queried with
+  ``websearch_to_tsquery``, ranked with ``ts_rank_cd`` and highlighted with
+  ``ts_headline``.
+- SQLite: an FTS5 table whose rowids are SearchEntry ids, ranked with
+  ``bm25`` and highlighted with ``snippet``.
+- Anything else: case-insensitive matching on the SearchEntry table, which
+  is still a single-table query without joins.
+
+Filters on kind, community and creation time are part of the same SQL
+statement as the index lookup, so the database never materializes matches
+that are filtered out afterwards.
+
+PostgreSQL and SQLite can also build a complete copy of the index in a
+shadow table and swap it in for the live one in a single transaction, see
+core.search_rebuild.
+"""
+import re
+
+from django.db import connections, transaction, DEFAULT_DB_ALIAS
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+
+ENTRY_TABLE = 'core_searchentry'
+SHADOW_TABLE = f'{ENTRY_TABLE}_shadow'
+SEARCH_CONFIG = 'english'
+
+# Private-use characters delimit matches in snippets; they survive HTML
+# escaping and are replaced with <mark> tags afterwards
+MARK_START = '\ue000'
+MARK_END = '\ue001'
+
+SNIPPET_WORDS = 20
+
+
+def highlight(snippet):
+    """Escape a raw snippet and turn its match markers into <mark> tags"""
+    if not snippet:
+        return ''
+    html = escape(snippet).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
+    return mark_safe(html)
+
+
+class SearchBackend:
+    """
+    Base class of the full-text backends.
+
+    ``search`` returns ``(object_id, rank, snippet)`` tuples of one kind of
+    document, best first. ``match_sql`` returns SQL selecting the matching
+    object ids, for use as a subquery when results are ordered by columns of
+    the original table.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def _filters(self, kind, community_id=None, since=None, alias='e'):
+        clauses = [f'{alias}.kind = %s']
+        params = [kind]
+        if community_id is not None:
+            clauses.append(f'{alias}.community_id = %s')
+            params.append(community_id)
+        if since is not None:
+            clauses.append(f'{alias}.created_at >= %s')
+            params.append(since)
+        return clauses, params
+
+    def _order_by(self, order, alias='e'):
+        if order == 'newest':
+            return f'{alias}.created_at DESC, {alias}.id DESC'
+        if order == 'oldest':
+            return f'{alias}.created_at ASC, {alias}.id ASC'
+        return f'score DESC, {alias}.id DESC'
+
+    def _fetch(self, sql, params):
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def search(self, query, kind, community_id=None, since=None, order='relevance', limit=50):
+        raise NotImplementedError
+
+    def match_sql(self, query, kind, community_id=None, since=None):
+        raise NotImplementedError
+
+    def snippets(self, query, kind, object_ids):
+        """Return a dictionary of highlighted snippets for the given objects"""
+        raise NotImplementedError
+
+    # Index maintenance. SearchEntry rows are written by core.search; these
+    # hooks keep any side index in step with them.
+
+    def entries_added(self, kind, object_ids, table=ENTRY_TABLE):
+        pass
+
+    def entries_removing(self, kind, object_ids, table=ENTRY_TABLE):
+        pass
+
+    def create_index(self, table=ENTRY_TABLE):
+        pass
+
+    def drop_index(self, table=ENTRY_TABLE):
+        pass
+
+    # Shadow tables. A shadow has the columns, constraints and side index of
+    # the live table under names of its own, and takes over the canonical
+    # names when it is swapped in.
+
+    supports_shadow = False
+
+    def create_shadow(self, shadow=SHADOW_TABLE):
+        raise NotImplementedError
+
+    def swap_shadow(self, shadow=SHADOW_TABLE):
+        """Replace the live table with the shadow in one transaction"""
+        raise NotImplementedError
+
+    def drop_shadow(self, shadow=SHADOW_TABLE):
+        self.drop_index(shadow)
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {shadow}')
+
+
+class PostgresSearchBackend(SearchBackend):
+    # Title matches weigh most, then tags/community/author, then the body
+    DOCUMENT = (
+        "setweight(to_tsvector('{config}', coalesce(title, '')), 'A') || "
+        "setweight(to_tsvector('{config}', coalesce(meta, '')), 'B') || "
+        "setweight(to_tsvector('{config}', coalesce(body, '')), 'C')"
+    ).format(config=SEARCH_CONFIG)
+
+    HEADLINE_OPTIONS = (
+        f'StartSel={MARK_START}, StopSel={MARK_END}, '
+        f'MaxWords={SNIPPET_WORDS}, MinWords=5, MaxFragments=2, FragmentDelimiter=" … "'
+    )
+
+    def _matches(self, query, kind, community_id, since):
+        clauses, params = self._filters(kind, community_id, since)
+        sql = (
+            f'FROM {ENTRY_TABLE} e, websearch_to_tsquery(%s::regconfig, %s) q '
+            f'WHERE e.document @@ q AND {" AND ".join(clauses)}'
+        )
+        return sql, [SEARCH_CONFIG, query] + params
+
+    def search(self, query, kind, community_id=None, since=None, order='relevance', limit=50):
+        matches, params = self._matches(query, kind, community_id, since)
+        # ts_headline is expensive, so it only runs on the rows that survive
+        # the LIMIT of the inner query
+        sql = (
+            'SELECT hits.object_id, hits.score, '
+            f'ts_headline(%s::regconfig, coalesce(nullif(hits.body, \'\'), hits.title), hits.q, %s) '
+            'FROM ('
+            f'SELECT e.id, e.object_id, e.title, e.body, e.created_at, q, ts_rank_cd(e.document, q) AS score '
+            f'{matches} ORDER BY {self._order_by(order)} LIMIT %s'
+            f') hits ORDER BY {self._order_by(order, "hits")}'
+        )
+        rows = self._fetch(sql, [SEARCH_CONFIG, self.HEADLINE_OPTIONS] + params + [limit])
+        return [(object_id, rank, highlight(snippet)) for object_id, rank, snippet in rows]
+
+    def match_sql(self, query, kind, community_id=None, since=None):
+        matches, params = self._matches(query, kind, community_id, since)
+        return f'SELECT e.object_id {matches}', params
+
+    def snippets(self, query, kind, object_ids):
+        if not object_ids:
+            return {}
+        sql = (
+            f'SELECT e.object_id, ts_headline(%s::regconfig, coalesce(nullif(e.body, \'\'), e.title), '
+            f'websearch_to_tsquery(%s::regconfig, %s), %s) FROM {ENTRY_TABLE} e '
+            'WHERE e.kind = %s AND e.object_id = ANY(%s)'
+        )
+        rows = self._fetch(sql, [
+            SEARCH_CONFIG, SEARCH_CONFIG, query, self.HEADLINE_OPTIONS, kind, list(object_ids)
+        ])
+        return {object_id: highlight(snippet) for object_id, snippet in rows}
+
+    def create_index(self, table=ENTRY_TABLE):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'ALTER TABLE {table} ADD COLUMN document tsvector '
+                f'GENERATED ALWAYS AS ({self.DOCUMENT}) STORED'
+            )
+            cursor.execute(f'CREATE INDEX {table}_document_gin ON {table} USING GIN (document)')
+
+    def drop_index(self, table=ENTRY_TABLE):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'ALTER TABLE {table} DROP COLUMN IF EXISTS document')
+
+    supports_shadow = True
+
+    def create_shadow(self, shadow=SHADOW_TABLE):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {shadow}')
+            # Copies the columns, including the generated document, and gives
+            # the shadow an identity sequence of its own
+            cursor.execute(
+                f'CREATE TABLE {shadow} (LIKE {ENTRY_TABLE} '
+                'INCLUDING DEFAULTS INCLUDING IDENTITY INCLUDING GENERATED)'
+            )
+            cursor.execute(
+                f'ALTER TABLE {shadow} ADD CONSTRAINT {shadow}_pkey PRIMARY KEY (id), '
+                f'ADD CONSTRAINT {shadow}_unique UNIQUE (kind, object_id)'
+            )
+            cursor.execute(f'CREATE INDEX {shadow}_filter_idx ON {shadow} (kind, community_id, created_at)')
+            cursor.execute(f'CREATE INDEX {shadow}_document_gin ON {shadow} USING GIN (document)')
+
+    def swap_shadow(self, shadow=SHADOW_TABLE):
+        with transaction.atomic(using=self.connection.alias), self.connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE {ENTRY_TABLE}')
+            cursor.execute(f'ALTER TABLE {shadow} RENAME TO {ENTRY_TABLE}')
+            # Names the migrations know the live table's objects by
+            cursor.execute(f'ALTER TABLE {ENTRY_TABLE} RENAME CONSTRAINT {shadow}_pkey TO {ENTRY_TABLE}_pkey')
+            cursor.execute(f'ALTER TABLE {ENTRY_TABLE} RENAME CONSTRAINT {shadow}_unique TO unique_search_entry')
+            cursor.execute(f'ALTER INDEX {shadow}_filter_idx RENAME TO search_entry_filter_idx')
+            cursor.execute(f'ALTER INDEX {shadow}_document_gin RENAME TO {ENTRY_TABLE}_document_gin')
+
+    def drop_shadow(self, shadow=SHADOW_TABLE):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {shadow}')
+
+
+class SQLiteSearchBackend(SearchBackend):
+    # bm25 weights of the title, meta and body columns
+    WEIGHTS = (10.0, 4.0, 1.0)
+
+    @staticmethod
+    def fts_table(table=ENTRY_TABLE):
+        return f'{table}_fts'
+
+    @staticmethod
+    def match_expression(query):
+        """
+        Turn free text into an FTS5 query: every word must match and the last
+        one may be a prefix. Quoting the words keeps FTS5 syntax characters
+        in user input from being interpreted.
+        """
+        words = re.findall(r'\w+', query.lower())
+        if not words:
+            return None
+        terms = [f'"{word}"' for word in words]
+        terms[-1] += '*'
+        return ' '.join(terms)
+
+    def _matches(self, expression, kind, community_id, since):
+        fts = self.fts_table()
+        clauses, params = self._filters(kind, community_id, since)
+        sql = (
+            f'FROM {fts} JOIN {ENTRY_TABLE} e ON e.id = {fts}.rowid '
+            f'WHERE {fts} MATCH %s AND {" AND ".join(clauses)}'
+        )
+        return sql, [expression] + params
+
+    def search(self, query, kind, community_id=None, since=None, order='relevance', limit=50):
+        expression = self.match_expression(query)
+        if expression is None:
+            return []
+        fts = self.fts_table()
+        matches, params = self._matches(expression, kind, community_id, since)
+        weights = ', '.join(str(weight) for weight in self.WEIGHTS)
+        sql = (
+            f'SELECT e.object_id, -bm25({fts}, {weights}) AS score, '
+            f'snippet({fts}, -1, %s, %s, \'…\', {SNIPPET_WORDS}) '
+            f'{matches} ORDER BY {self._order_by(order)} LIMIT %s'
+        )
+        rows = self._fetch(sql, [MARK_START, MARK_END] + params + [limit])
+        return [(object_id, rank, highlight(snippet)) for object_id, rank, snippet in rows]
+
+    def match_sql(self, query, kind, community_id=None, since=None):
+        expression = self.match_expression(query)
+        if expression is None:
+            return 'SELECT NULL WHERE 0', []
+        matches, params = self._matches(expression, kind, community_id, since)
+        return f'SELECT e.object_id {matches}', params
+
+    def snippets(self, query, kind, object_ids):
+        expression = self.match_expression(query)
+        if expression is None or not object_ids:
+            return {}
+        fts = self.fts_table()
+        placeholders = ', '.join(['%s'] * len(object_ids))
+        sql = (
+            f'SELECT e.object_id, snippet({fts}, -1, %s, %s, \'…\', {SNIPPET_WORDS}) '
+            f'FROM {fts} JOIN {ENTRY_TABLE} e ON e.id = {fts}.rowid '
+            f'WHERE {fts} MATCH %s AND e.kind = %s AND e.object_id IN ({placeholders})'
+        )
+        rows = self._fetch(sql, [MARK_START, MARK_END, expression, kind] + list(object_ids))
+        return {object_id: highlight(snippet) for object_id, snippet in rows}
+
+    def _entry_ids_sql(self, kind, object_ids, table):
+        placeholders = ', '.join(['%s'] * len(object_ids))
+        return (
+            f'SELECT id FROM {table} WHERE kind = %s AND object_id IN ({placeholders})',
+            [kind] + list(object_ids),
+        )
+
+    def entries_added(self, kind, object_ids, table=ENTRY_TABLE):
+        if not object_ids:
+            return
+        ids_sql, params = self._entry_ids_sql(kind, object_ids, table)
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {self.fts_table(table)} (rowid, title, meta, body) '
+                f'SELECT id, title, meta, body FROM {table} WHERE id IN ({ids_sql})',
+                params,
+            )
+
+    def entries_removing(self, kind, object_ids, table=ENTRY_TABLE):
+        if not object_ids:
+            return
+        ids_sql, params = self._entry_ids_sql(kind, object_ids, table)
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.fts_table(table)} WHERE rowid IN ({ids_sql})', params)
+
+    def create_index(self, table=ENTRY_TABLE):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE {self.fts_table(table)} USING fts5('
+                "title, meta, body, tokenize = 'porter unicode61 remove_diacritics 2')"
+            )
+
+    def drop_index(self, table=ENTRY_TABLE):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {self.fts_table(table)}')
+
+    supports_shadow = True
+
+    def create_shadow(self, shadow=SHADOW_TABLE):
+        self.drop_shadow(shadow)
+        with self.connection.cursor() as cursor:
+            # Same DDL as the SearchEntry migration; constraint names are
+            # local to a table in SQLite, index names are not
+            cursor.execute(
+                f'CREATE TABLE {shadow} ('
+                'id integer NOT NULL PRIMARY KEY AUTOINCREMENT, kind varchar(10) NOT NULL, '
+                'object_id bigint NOT NULL, title text NOT NULL, meta text NOT NULL, body text NOT NULL, '
+                'community_id bigint NULL, created_at datetime NOT NULL, '
+                'CONSTRAINT unique_search_entry UNIQUE (kind, object_id))'
+            )
+            cursor.execute(f'CREATE INDEX {shadow}_filter_idx ON {shadow} (kind, community_id, created_at)')
+        self.create_index(shadow)
+
+    def swap_shadow(self, shadow=SHADOW_TABLE):
+        with transaction.atomic(using=self.connection.alias), self.connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE {self.fts_table()}')
+            cursor.execute(f'DROP TABLE {ENTRY_TABLE}')
+            cursor.execute(f'ALTER TABLE {shadow} RENAME TO {ENTRY_TABLE}')
+            cursor.execute(f'ALTER TABLE {self.fts_table(shadow)} RENAME TO {self.fts_table()}')
+            # SQLite cannot rename indexes
+            cursor.execute(f'DROP INDEX {shadow}_filter_idx')
+            cursor.execute(f'CREATE INDEX search_entry_filter_idx ON {ENTRY_TABLE} (kind, community_id, created_at)')
+
+
+class BasicSearchBackend(SearchBackend):
+    """Fallback without an inverted index for other databases"""
+
+    def _queryset(self, query, kind, community_id, since):
+        from django.db.models import Q
+        from .models import SearchEntry
+
+        entries = SearchEntry.objects.using(self.connection.alias).filter(kind=kind)
+        if community_id is not None:
+            entries = entries.filter(community_id=community_id)
+        if since is not None:
+            entries = entries.filter(created_at__gte=since)
+        for word in re.findall(r'\w+', query):
+            entries = entries.filter(
+                Q(title__icontains=word) | Q(meta__icontains=word) | Q(body__icontains=word)
+            )
+        return entries
+
+    def search(self, query, kind, community_id=None, since=None, order='relevance', limit=50):
+        entries = self._queryset(query, kind, community_id, since)
+        entries = entries.order_by('created_at', 'id') if order == 'oldest' else entries.order_by('-created_at', '-id')
+        return [
+            (object_id, 0, escape(body[:200]))
+            for object_id, body in entries.values_list('object_id', 'body')[:limit]
+        ]
+
+    def match_sql(self, query, kind, community_id=None, since=None):
+        entries = self._queryset(query, kind, community_id, since)
+        return entries.values('object_id').query.sql_with_params()
+
+    def snippets(self, query, kind, object_ids):
+        return {}
+
+
+BACKENDS = {
+    'postgresql': PostgresSearchBackend,
+    'sqlite': SQLiteSearchBackend,
+}
+
+
+def get_backend(connection=None):
+    """Return the search backend for a database connection (default: 'default')"""
+    connection = connection or connections[DEFAULT_DB_ALIAS]
+    return BACKENDS.get(connection.vendor, BasicSearchBackend)(connection)
@@ -0,0 +1,157 @@
+"""
+Parallel, resumable rebuilds of the full-text search index.
+
+A rebuild splits every kind of object into pk ranges, stored as
+SearchRebuildChunk rows, and indexes the chunks in a pool of worker
+processes. A chunk's entries are written and the chunk is marked complete in
+one transaction, so a rebuild that crashed or was interrupted resumes with
+the chunks that are left.
+
+A full rebuild writes into a shadow table while searches keep using the live
+one, and swaps it in once every chunk is done. The search worker applies
+queued updates to the shadow too, so changes made during the rebuild survive
+the swap. Rebuilding only some kinds, or on a database whose backend has no
+shadow tables, replaces the live entries chunk by chunk instead.
+"""
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import django
+from django.db import connection, connections, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import SearchRebuildChunk
+from .search import SEARCH_MODELS, build_entries, invalidate_search_cache, remove_objects, write_entries
+from .search_backends import get_backend, ENTRY_TABLE, SHADOW_TABLE
+
+
+def shadow_tables():
+    """Shadow tables of the rebuild in progress, if any"""
+    return list(
+        SearchRebuildChunk.objects.exclude(table_name=ENTRY_TABLE).order_by()
+        .values_list('table_name', flat=True).distinct()
+    )
+
+
+def current_rebuild():
+    """Return ``(table, kinds)`` of the rebuild in progress, or None"""
+    rows = list(SearchRebuildChunk.objects.order_by().values_list('table_name', 'kind').distinct())
+    if not rows:
+        return None
+    return rows[0][0], sorted({kind for _, kind in rows}, key=list(SEARCH_MODELS).index)
+
+
+def _indexed_ids(table, kind, after_pk, last_pk=None):
+    """Object ids of a kind in an index table, in the range (after_pk, last_pk]"""
+    sql = f'SELECT object_id FROM {table} WHERE kind = %s AND object_id > %s'
+    params = [kind, after_pk]
+    if last_pk is not None:
+        sql += ' AND object_id <= %s'
+        params.append(last_pk)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def plan_chunks(table, kinds, chunk_size):
+    """
+    Add chunks of up to ``chunk_size`` objects covering the objects of the
+    given kinds past the ranges already planned. Returns the new chunks.
+    """
+    chunks = []
+    for kind in kinds:
+        pks = SEARCH_MODELS[kind].objects.order_by('pk').values_list('pk', flat=True)
+        planned = SearchRebuildChunk.objects.filter(table_name=table, kind=kind).aggregate(last=Max('last_pk'))
+        after_pk = planned['last'] or 0
+        while True:
+            # The pk chunk_size rows ahead is the end of the next chunk
+            end = list(pks.filter(pk__gt=after_pk)[chunk_size - 1:chunk_size])
+            last_pk = end[0] if end else pks.filter(pk__gt=after_pk).aggregate(last=Max('pk'))['last']
+            if last_pk is None:
+                break
+            chunks.append(SearchRebuildChunk(table_name=table, kind=kind, after_pk=after_pk, last_pk=last_pk))
+            after_pk = last_pk
+    return SearchRebuildChunk.objects.bulk_create(chunks)
+
+
+def start_rebuild(kinds, chunk_size):
+    """Prepare the table a new rebuild writes into and plan its chunks"""
+    backend = get_backend()
+    table = ENTRY_TABLE
+    if set(kinds) == set(SEARCH_MODELS) and backend.supports_shadow:
+        table = SHADOW_TABLE
+        backend.create_shadow(table)
+    plan_chunks(table, kinds, chunk_size)
+    return table
+
+
+def discard_rebuild():
+    """Forget the rebuild in progress and drop its shadow table"""
+    tables = shadow_tables()
+    SearchRebuildChunk.objects.all().delete()
+    for table in tables:
+        get_backend().drop_shadow(table)
+
+
+def index_chunk(chunk_id):
+    """Index one chunk and mark it complete. Returns ``(kind, entries written)``"""
+    chunk = SearchRebuildChunk.objects.get(pk=chunk_id)
+    model = SEARCH_MODELS[chunk.kind]
+    ids = list(model.objects.filter(pk__gt=chunk.after_pk, pk__lte=chunk.last_pk).values_list('pk', flat=True))
+    entries = build_entries(chunk.kind, ids)
+    with transaction.atomic():
+        # Replacing the whole range also drops entries of deleted objects
+        indexed = _indexed_ids(chunk.table_name, chunk.kind, chunk.after_pk, chunk.last_pk)
+        remove_objects(chunk.kind, indexed, chunk.table_name)
+        write_entries(chunk.kind, entries, chunk.table_name)
+        SearchRebuildChunk.objects.filter(pk=chunk.pk).update(indexed=len(entries), completed_at=timezone.now())
+    return chunk.kind, len(entries)
+
+
+def _init_worker():
+    # Spawned workers start from a bare interpreter; forked ones are set up
+    # already and this is a no-op
+    django.setup()
+
+
+def run_chunks(chunk_ids, workers=1, progress=None):
+    """
+    Index chunks, in a pool of ``workers`` processes when there is more than
+    one. ``progress(kind, entries)`` is called as each chunk completes.
+    """
+    progress = progress or (lambda kind, entries: None)
+    if workers <= 1:
+        for chunk_id in chunk_ids:
+            progress(*index_chunk(chunk_id))
+        return
+
+    # Workers open their own connections rather than share the parent's
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        futures = [pool.submit(index_chunk, chunk_id) for chunk_id in chunk_ids]
+        try:
+            for future in as_completed(futures):
+                progress(*future.result())
+        except BaseException:
+            # Completed chunks are checkpointed; don't start the others
+            pool.shutdown(wait=True, cancel_futures=True)
+            raise
+
+
+def pending_chunks():
+    return list(SearchRebuildChunk.objects.filter(completed_at__isnull=True).values_list('pk', flat=True))
+
+
+def finish_rebuild(table, kinds):
+    """Drop stale entries past the planned ranges and swap in the shadow table"""
+    for kind in kinds:
+        planned = SearchRebuildChunk.objects.filter(table_name=table, kind=kind).aggregate(last=Max('last_pk'))
+        after_pk = planned['last'] or 0
+        existing = set(SEARCH_MODELS[kind].objects.filter(pk__gt=after_pk).values_list('pk', flat=True))
+        remove_objects(kind, [pk for pk in _indexed_ids(table, kind, after_pk) if pk not in existing], table)
+
+    with transaction.atomic():
+        if table != ENTRY_TABLE:
+            get_backend().swap_shadow(table)
+            transaction.on_commit(invalidate_search_cache)
+        SearchRebuildChunk.objects.filter(table_name=table).delete()
@@ -4,6 +4,8 @@ from django.utils.safestring import mark_safe
 from django.forms import widgets
 from django.template.defaultfilters import truncatewords_html as django_truncatewords_html
 from core.models import Profile
+from core.comment_fragments import PendingVotes, vote_placeholder
+from core.holes import render_hole
 import os
 
 register = template.Library()
@@ -48,6 +50,35 @@ def get_dict_item(dictionary, key):
         return None
     return dictionary.get(key)
 
+@register.simple_tag
+def vote_button_class(user_votes, object_id, value):
+    """
+    'active' when the user's vote on the object is ``value``. While a cached
+    comment fragment is rendered, a placeholder filled in for each viewer.
+    
+    Usage:
+    {% vote_button_class user_comment_votes comment.id 1 %}
+    """
+    if isinstance(user_votes, PendingVotes):
+        return vote_placeholder(object_id, value)
+    if user_votes and user_votes.get(object_id) == value:
+        return 'active'
+    return ''
+
+@register.simple_tag(takes_context=True)
+def hole(context, name, *args):
+    """
+    A part of the page that depends on the viewer, see core.holes. Rendered
+    in place, or left as a placeholder while a cacheable page is rendered.
+    
+    Usage:
+    {% hole 'post_vote' post.id 1 %}
+    """
+    request = context.get('request')
+    if request is None:
+        return ''
+    return render_hole(request, name, *args)
+
 @register.simple_tag
 def get_unread_notification_count(user):
     """
@@ -20,7 +20,7 @@ from .post_views import (
     post_detail, create_text_post, create_link_post,
     delete_post, add_comment, comment_thread,
     delete_comment, vote_post, vote_comment,
-    get_comment_children, comments_test
+    comments_test
 )
 
 # Notification views
@@ -1,22 +1,24 @@
 """
 Views related to communities.
 """
+from urllib.parse import urlencode
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.db.models import Count, Q
 from ..models import Community, Post
 from ..forms import CommunityForm
+from ..ranking import DEFAULT_FEED_SORT
+from ..feeds import feed_page
+from ..page_cache import cached_page
 
 
+@cached_page('communities')
 def community_list(request):
     """
     List all communities
     """
-    communities = Community.objects.annotate(
-        member_count=Count('members'),
-        post_count=Count('posts')
-    ).order_by('-created_at')
+    communities = Community.objects.order_by('-created_at')
     
     return render(request, 'core/community/community_page.html', {
         'communities': communities,
@@ -52,29 +54,34 @@ def create_community(request):
     })
 
 
+@cached_page('community:{pk}')
 def community_detail(request, pk, template='core/community/community_detail.html', extra_context=None):
     """
     View a community and its posts
     """
     community = get_object_or_404(Community, pk=pk)
     
-    # Get posts with vote counts for this community
-    posts = Post.objects.filter(community=community)\
-        .select_related('author')\
-        .prefetch_related('tags')\
-        .annotate(vote_score=Count('votes', filter=Q(votes__value=1)) - 
-                 Count('votes', filter=Q(votes__value=-1)))\
-        .order_by('-created_at')
+    # Get posts for this community, ordered by a precomputed ranking score
+    sort = request.GET.get('sort', DEFAULT_FEED_SORT)
+    posts = Post.objects.select_related('author__profile', 'community')\
+        .prefetch_related('tags')
     
-    # Check if user is a member
-    is_member = request.user.is_authenticated and community.members.filter(id=request.user.id).exists()
+    # From the community's materialized feed, or keyset pagination on the
+    # (community, sort key) index
+    page = feed_page(
+        posts, sort, community_id=community.pk,
+        cursor=request.GET.get('cursor'),
+        per_page=settings.EL_PAGINATION_PER_PAGE,
+    )
     
     # Prepare context
     context = {
         'community': community,
-        'posts': posts,
-        'is_member': is_member,
-        'member_count': community.members.count(),
+        'posts': page.object_list,
+        'page_obj': page,
+        'page_params': urlencode({'sort': sort}),
+        'sort': sort,
+        'member_count': community.member_count,
         'title': community.name,
     }
     
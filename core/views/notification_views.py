@@ -5,24 +5,36 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from ..models import Notification
+from ..notifications import unread_count, invalidate_unread_count
+from ..pagination import paginate_by_cursor
+
+
+NOTIFICATIONS_PER_PAGE = 25
 
 
 def get_unread_notification_count(user):
     """Helper function to get unread notification count for a user"""
     if not user.is_authenticated:
         return 0
-    return Notification.objects.filter(recipient=user, is_read=False).count()
+    return unread_count(user.pk)
 
 
 @login_required
 def notification_list(request):
     """View to display all notifications for the current user"""
-    notifications = Notification.objects.filter(recipient=request.user).order_by('-created_at')
-    unread_count = get_unread_notification_count(request.user)
+    notifications = Notification.objects.filter(recipient=request.user)\
+        .select_related('sender', 'comment')
+    # Keyset pagination on the (recipient, created_at) index
+    page = paginate_by_cursor(
+        notifications, ('-created_at', '-id'),
+        cursor=request.GET.get('cursor'),
+        per_page=NOTIFICATIONS_PER_PAGE,
+    )
+    unread = get_unread_notification_count(request.user)
     
     return render(request, 'core/notifications/notifications_list.html', {
-        'notifications': notifications,
-        'unread_count': unread_count,
+        'notifications': page,
+        'unread_count': unread,
         'title': 'Notifications'
     })
 
@@ -46,6 +58,7 @@ def mark_notification_read(request, pk):
 @login_required
 def mark_all_notifications_read(request):
     """View to mark all notifications as read"""
-    Notification.objects.filter(recipient=request.user).update(is_read=True)
+    Notification.objects.filter(recipient=request.user, is_read=False).update(is_read=True)
+    invalidate_unread_count(request.user.pk)
     messages.success(request, 'All notifications marked as read.')
     return redirect('notification_list')
\ No newline at end of file
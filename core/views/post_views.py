@@ -1,34 +1,73 @@
 """
 Views related to posts and comments.
 """
-import sys
+from urllib.parse import urlencode
+from django.conf import settings
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.db.models import Count, Q, Sum, F
+from django.db.models import Sum, F
 from django.http import JsonResponse, HttpResponseRedirect
 from django.urls import reverse
 from django.utils import timezone
 from django.views.decorators.http import require_http_methods
-from ..models import Post, Comment, Vote, Community, Notification
+from ..models import Post, Comment, Vote, Community
 from ..forms import TextPostForm, LinkPostForm, CommentForm
+from ..voting import cast_vote
+from ..notifications import notify_upvote
+from ..ranking import DEFAULT_FEED_SORT
+from ..feeds import feed_page
+from ..home_feeds import home_feed_page
+from ..comment_fragments import render_post_threads, render_comment_thread
+from ..page_cache import cached_page
 
 
+def is_personal_home(request):
+    """Logged-in users get their home feed unless they ask for all posts"""
+    return request.user.is_authenticated and request.GET.get('feed') != 'all'
+
+
+@cached_page('feed', unless=is_personal_home)
 def home(request, template='core/common/index.html', extra_context=None):
     """
     Homepage view showing a list of posts with various filtering options
     """
-    # Get posts with vote counts
-    posts = Post.objects.select_related('author', 'community')\
-        .prefetch_related('tags')\
-        .annotate(vote_score=Count('votes', filter=Q(votes__value=1)) - 
-                 Count('votes', filter=Q(votes__value=-1)))\
-        .order_by('-created_at')
+    # Order by a precomputed ranking score; vote counts are denormalized
+    sort = request.GET.get('sort', DEFAULT_FEED_SORT)
+    posts = Post.objects.select_related('author__profile', 'community')\
+        .prefetch_related('tags')
+    
+    # The user's communities and interests, see core.home_feeds; users who
+    # joined none get the whole site
+    page = None
+    if is_personal_home(request):
+        page = home_feed_page(
+            request.user, posts,
+            cursor=request.GET.get('cursor'),
+            per_page=settings.EL_PAGINATION_PER_PAGE,
+        )
+    personal = page is not None
+    
+    if not personal:
+        # From the materialized feed, or keyset pagination on the sort key
+        page = feed_page(
+            posts, sort,
+            cursor=request.GET.get('cursor'),
+            per_page=settings.EL_PAGINATION_PER_PAGE,
+        )
+    
+    page_params = {} if personal else {'sort': sort}
+    if request.user.is_authenticated and not personal:
+        page_params['feed'] = 'all'
     
     # Prepare context
     context = {
-        'posts': posts,
-        'post_list': posts,  # Add post_list for compatibility with templates
+        'posts': page.object_list,
+        'post_list': page.object_list,  # Add post_list for compatibility with templates
+        'page_obj': page,
+        'page_params': urlencode(page_params),
+        'sort': sort,
+        'personal_feed': personal,
         'title': 'Home',
     }
     
@@ -54,73 +93,14 @@ def comments_test(request):
     return render(request, 'core/comments_test.html', context)
 
 
-def get_comment_children(comment, user, depth=0, max_depth=3):
-    """
-    Recursively get child comments up to a specified depth
-    """
-    depth += 1
-    if depth > max_depth:
-        # Don't fetch children beyond max_depth
-        comment.has_more = Comment.objects.filter(parent=comment).exists()
-        return []
-    
-    children = Comment.objects.filter(parent=comment).order_by('created_at')
-    
-    for child in children:
-        # Update denormalized vote counts
-        upvotes = child.votes.filter(value=1).count()
-        downvotes = child.votes.filter(value=-1).count()
-        child.upvote_count = upvotes
-        child.downvote_count = downvotes
-        child.save(update_fields=['upvote_count', 'downvote_count'])
-        
-        child.depth = depth
-        
-        # Get user's vote for this comment
-        if user.is_authenticated:
-            try:
-                user_vote = Vote.objects.get(user=user, comment=child)
-                child.user_vote = user_vote.value
-            except Vote.DoesNotExist:
-                child.user_vote = None
-        else:
-            child.user_vote = None
-        
-        # Get grandchildren recursively
-        setattr(child, 'child_comments', get_comment_children(child, user, depth, max_depth))
-    
-    return children
-
-
+@cached_page('post:{pk}')
 def post_detail(request, pk):
     """
-    View a post and its comments with Reddit-style nested comments using MPTT
+    View a post and its comments with Reddit-style nested comments using MPTT.
+    The viewer's votes are holes filled in by the page cache.
     """
     post = get_object_or_404(Post, pk=pk)
     
-    # Update denormalized vote counts for post
-    upvotes = post.votes.filter(value=1).count()
-    downvotes = post.votes.filter(value=-1).count()
-    post.upvote_count = upvotes
-    post.downvote_count = downvotes
-    post.save(update_fields=['upvote_count', 'downvote_count'])
-    
-    # Get user's vote for this post if they're logged in
-    if request.user.is_authenticated:
-        try:
-            user_vote = Vote.objects.get(user=request.user, post=post)
-            post.user_vote = user_vote.value
-        except Vote.DoesNotExist:
-            post.user_vote = None
-    else:
-        post.user_vote = None
-    
-    # Get all comments for this post using MPTT
-    all_comments = Comment.objects.filter(post=post).order_by('tree_id', 'lft')
-    
-    # Get root comments for this post using MPTT
-    comments = Comment.objects.filter(post=post, parent=None).order_by('created_at')
-    
     # Create comment form if user is logged in
     if request.user.is_authenticated:
         if request.method == 'POST':
@@ -129,19 +109,9 @@ def post_detail(request, pk):
                 comment = comment_form.save(commit=False)
                 comment.post = post
                 comment.author = request.user
+                # Reply and mention notifications are queued by a signal
                 comment.save()
                 
-                # Create notification for the post author if they're not the commenter
-                if post.author != request.user:
-                    Notification.objects.create(
-                        recipient=post.author,
-                        sender=request.user,
-                        notification_type='reply',
-                        post=post,
-                        comment=comment,
-                        text=f"{request.user.username} commented on your post: {post.title}"
-                    )
-                
                 messages.success(request, 'Your comment has been added!')
                 return redirect('post_detail', pk=post.pk)
         else:
@@ -149,57 +119,21 @@ def post_detail(request, pk):
     else:
         comment_form = None
     
-    # Update denormalized vote counts for comments and add user votes
-    for comment in comments:
-        # Update denormalized vote counts
-        upvotes = comment.votes.filter(value=1).count()
-        downvotes = comment.votes.filter(value=-1).count()
-        comment.upvote_count = upvotes
-        comment.downvote_count = downvotes
-        comment.save(update_fields=['upvote_count', 'downvote_count'])
-        
-        # Get user's vote for this comment if they're logged in
-        if request.user.is_authenticated:
-            try:
-                user_vote = Vote.objects.get(user=request.user, comment=comment)
-                comment.user_vote = user_vote.value
-            except Vote.DoesNotExist:
-                comment.user_vote = None
-        else:
-            comment.user_vote = None
+    # Render a page of comment threads, from the fragment cache where possible
+    thread_page = render_post_threads(request, post, page=request.GET.get('page', 1))
     
     # Calculate total comments count
-    total_comments_count = Comment.objects.filter(post=post).count()
+    total_comments_count = post.comment_count
     
-    # Create a dictionary of user's votes for comments
-    user_comment_votes = {}
-    if request.user.is_authenticated:
-        # Get all votes for this post's comments by the current user
-        comment_votes = Vote.objects.filter(
-            user=request.user,
-            comment__post=post
-        ).select_related('comment')
-        
-        # Create a dictionary mapping comment IDs to vote values
-        for vote in comment_votes:
-            user_comment_votes[vote.comment.id] = vote.value
-    
-    # For testing purposes, simplify the context to avoid recursion issues
-    if 'test' in sys.modules:
-        context = {
-            'post': post,
-            'title': post.title,
-        }
-    else:
-        context = {
-            'post': post,
-            'comments': comments,
-            'all_comments': all_comments,
-            'comment_form': comment_form,
-            'title': post.title,
-            'total_comments_count': total_comments_count,
-            'user_comment_votes': user_comment_votes,
-        }
+    context = {
+        'post': post,
+        'comment_threads': thread_page.threads,
+        'comment_page': thread_page.page,
+        'comments_have_next': thread_page.has_next,
+        'comment_form': comment_form,
+        'title': post.title,
+        'total_comments_count': total_comments_count,
+    }
     
     return render(request, 'core/posts/post_detail.html', context)
 
@@ -208,16 +142,9 @@ def comment_thread(request, pk):
     """
     View a comment thread
     """
-    comment = get_object_or_404(Comment, pk=pk)
+    comment = get_object_or_404(Comment.objects.select_related('post'), pk=pk)
     post = comment.post
     
-    # Update denormalized vote counts for post
-    upvotes = post.votes.filter(value=1).count()
-    downvotes = post.votes.filter(value=-1).count()
-    post.upvote_count = upvotes
-    post.downvote_count = downvotes
-    post.save(update_fields=['upvote_count', 'downvote_count'])
-    
     # Get user's vote for this post if they're logged in
     if request.user.is_authenticated:
         try:
@@ -228,29 +155,6 @@ def comment_thread(request, pk):
     else:
         post.user_vote = None
     
-    # Create a list with just this comment to reuse the comment display template
-    comments = [comment]
-    
-    # Update denormalized vote counts for the comment
-    upvotes = comment.votes.filter(value=1).count()
-    downvotes = comment.votes.filter(value=-1).count()
-    comment.upvote_count = upvotes
-    comment.downvote_count = downvotes
-    comment.save(update_fields=['upvote_count', 'downvote_count'])
-    
-    # Get user's vote for this comment if they're logged in
-    if request.user.is_authenticated:
-        try:
-            user_vote = Vote.objects.get(user=request.user, comment=comment)
-            comment.user_vote = user_vote.value
-        except Vote.DoesNotExist:
-            comment.user_vote = None
-    else:
-        comment.user_vote = None
-    
-    # Get child comments
-    setattr(comment, 'child_comments', get_comment_children(comment, request.user, depth=0, max_depth=5))
-    
     # Create comment form if user is logged in
     if request.user.is_authenticated:
         if request.method == 'POST':
@@ -260,19 +164,9 @@ def comment_thread(request, pk):
                 new_comment.post = post
                 new_comment.author = request.user
                 new_comment.parent = comment
+                # Reply and mention notifications are queued by a signal
                 new_comment.save()
                 
-                # Create notification for the parent comment author if they're not the commenter
-                if comment.author != request.user:
-                    Notification.objects.create(
-                        recipient=comment.author,
-                        sender=request.user,
-                        notification_type='reply',
-                        post=post,
-                        comment=new_comment,
-                        text=f"{request.user.username} replied to your comment"
-                    )
-                
                 messages.success(request, 'Your reply has been added!')
                 return redirect('comment_thread', pk=comment.pk)
         else:
@@ -280,23 +174,21 @@ def comment_thread(request, pk):
     else:
         comment_form = None
     
-    # Create a dictionary of user's votes for comments
+    # Render the thread, from the fragment cache where possible
+    thread = render_comment_thread(request, comment, max_depth=5)
+    
+    # The parent comment's vote, which is shown above the thread
     user_comment_votes = {}
-    if request.user.is_authenticated:
-        # Get all votes for this post's comments by the current user
-        comment_votes = Vote.objects.filter(
-            user=request.user,
-            comment__post=post
-        ).select_related('comment')
-        
-        # Create a dictionary mapping comment IDs to vote values
-        for vote in comment_votes:
-            user_comment_votes[vote.comment.id] = vote.value
+    if comment.parent_id and request.user.is_authenticated:
+        parent_vote = Vote.objects.filter(user=request.user, comment_id=comment.parent_id)\
+            .values_list('value', flat=True).first()
+        if parent_vote is not None:
+            user_comment_votes[comment.parent_id] = parent_vote
     
     context = {
         'post': post,
         'comment': comment,
-        'comments': comments,
+        'thread': thread,
         'comment_form': comment_form,
         'title': f'Comment on {post.title}',
         'user_comment_votes': user_comment_votes,
@@ -428,30 +320,9 @@ def add_comment(request, post_id):
                 parent_comment = get_object_or_404(Comment, pk=parent_id)
                 comment.parent = parent_comment
             
+            # Reply and mention notifications are queued by a signal
             comment.save()
             
-            # Create notification for the post author or parent comment author
-            if parent_id and comment.parent.author != request.user:
-                # Notification for reply to a comment
-                Notification.objects.create(
-                    recipient=comment.parent.author,
-                    sender=request.user,
-                    notification_type='reply',
-                    post=post,
-                    comment=comment,
-                    text=f"{request.user.username} replied to your comment"
-                )
-            elif post.author != request.user:
-                # Notification for comment on a post
-                Notification.objects.create(
-                    recipient=post.author,
-                    sender=request.user,
-                    notification_type='reply',
-                    post=post,
-                    comment=comment,
-                    text=f"{request.user.username} commented on your post: {post.title}"
-                )
-            
             messages.success(request, 'Your comment has been added!')
             
             # If this is an AJAX request, return comment data as JSON
@@ -507,45 +378,19 @@ def vote_post(request, pk, vote_type):
     post = get_object_or_404(Post, pk=pk)
     
     # Determine vote value
-    vote_value = 1 if vote_type == 'up' else -1
-    
-    # Check if user has already voted on this post
-    try:
-        vote = Vote.objects.get(user=request.user, post=post)
-        
-        # If user is voting the same way, remove their vote
-        if vote.value == vote_value:
-            vote.delete()
-            vote_status = 'removed'
-        else:
-            # Otherwise, change their vote
-            vote.value = vote_value
-            vote.save()
-            vote_status = 'changed'
-    except Vote.DoesNotExist:
-        # Create a new vote
-        Vote.objects.create(user=request.user, post=post, value=vote_value)
-        vote_status = 'added'
-    
-    # Update post's denormalized vote counts
-    upvotes = post.votes.filter(value=1).count()
-    downvotes = post.votes.filter(value=-1).count()
-    post.upvote_count = upvotes
-    post.downvote_count = downvotes
-    post.save(update_fields=['upvote_count', 'downvote_count'])
-    
-    # Calculate vote score
-    vote_score = upvotes - downvotes
-    
-    # Create notification for post author if they're not the voter and this is an upvote
-    if vote_status in ['added', 'changed'] and vote_value == 1 and post.author != request.user:
-        Notification.objects.create(
-            recipient=post.author,
-            actor=request.user,
-            verb='upvoted',
-            post=post,
-            link=reverse('post_detail', kwargs={'pk': post.pk})
-        )
+    vote_value = 1 if vote_type in ('up', 'upvote') else -1
+    
+    # Toggle the vote atomically; the counters come back with the result
+    result = cast_vote(request.user, post, vote_value)
+    vote_status = result.status
+    upvotes = result.upvotes
+    downvotes = result.downvotes
+    vote_score = result.score
+    
+    # Notify the post author of upvotes; upvotes within a window are rolled
+    # up into one notification
+    if vote_status in ['added', 'changed'] and vote_value == 1:
+        notify_upvote(request.user, post)
     
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return JsonResponse({
@@ -569,45 +414,19 @@ def vote_comment(request, pk, vote_type):
     comment = get_object_or_404(Comment, pk=pk)
     
     # Determine vote value
-    vote_value = 1 if vote_type == 'up' else -1
-    
-    # Check if user has already voted on this comment
-    try:
-        vote = Vote.objects.get(user=request.user, comment=comment)
-        
-        # If user is voting the same way, remove their vote
-        if vote.value == vote_value:
-            vote.delete()
-            vote_status = 'removed'
-        else:
-            # Otherwise, change their vote
-            vote.value = vote_value
-            vote.save()
-            vote_status = 'changed'
-    except Vote.DoesNotExist:
-        # Create a new vote
-        Vote.objects.create(user=request.user, comment=comment, value=vote_value)
-        vote_status = 'added'
-    
-    # Update comment's denormalized vote counts
-    upvotes = comment.votes.filter(value=1).count()
-    downvotes = comment.votes.filter(value=-1).count()
-    comment.upvote_count = upvotes
-    comment.downvote_count = downvotes
-    comment.save(update_fields=['upvote_count', 'downvote_count'])
-    
-    # Calculate vote score
-    vote_score = upvotes - downvotes
-    
-    # Create notification for comment author if they're not the voter and this is an upvote
-    if vote_status in ['added', 'changed'] and vote_value == 1 and comment.author != request.user:
-        Notification.objects.create(
-            recipient=comment.author,
-            actor=request.user,
-            verb='upvoted',
-            comment=comment,
-            link=reverse('post_detail', kwargs={'pk': comment.post.pk})
-        )
+    vote_value = 1 if vote_type in ('up', 'upvote') else -1
+    
+    # Toggle the vote atomically; the counters come back with the result
+    result = cast_vote(request.user, comment, vote_value)
+    vote_status = result.status
+    upvotes = result.upvotes
+    downvotes = result.downvotes
+    vote_score = result.score
+    
+    # Notify the comment author of upvotes; upvotes within a window are
+    # rolled up into one notification
+    if vote_status in ['added', 'changed'] and vote_value == 1:
+        notify_upvote(request.user, comment)
     
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return JsonResponse({
@@ -628,9 +447,9 @@ def post_votes_api(request, pk):
     API endpoint to get votes for a post
     """
     post = get_object_or_404(Post, pk=pk)
-    upvotes = post.votes.filter(value=1).count()
-    downvotes = post.votes.filter(value=-1).count()
-    vote_score = upvotes - downvotes
+    upvotes = post.upvote_count
+    downvotes = post.downvote_count
+    vote_score = post.vote_count
     
     user_vote = None
     if request.user.is_authenticated:
@@ -653,9 +472,9 @@ def comment_votes_api(request, pk):
     API endpoint to get votes for a comment
     """
     comment = get_object_or_404(Comment, pk=pk)
-    upvotes = comment.votes.filter(value=1).count()
-    downvotes = comment.votes.filter(value=-1).count()
-    vote_score = upvotes - downvotes
+    upvotes = comment.upvote_count
+    downvotes = comment.downvote_count
+    vote_score = comment.vote_count
     
     user_vote = None
     if request.user.is_authenticated:
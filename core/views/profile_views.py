@@ -14,17 +14,17 @@ def profile(request, username):
     """
     View a user's profile
     """
-    user = get_object_or_404(User, username=username)
-    profile = Profile.objects.get(user=user)
+    user = get_object_or_404(User.objects.select_related('profile'), username=username)
+    profile = user.profile
     
     # Get user's posts with vote counts
-    posts = Post.objects.filter(author=user)\
+    posts = Post.objects.filter(author=user).select_related('community')\
         .annotate(vote_score=Count('votes', filter=Q(votes__value=1)) - 
                  Count('votes', filter=Q(votes__value=-1)))\
         .order_by('-created_at')
     
     # Get user's comments
-    comments = Comment.objects.filter(author=user).order_by('-created_at')
+    comments = Comment.objects.filter(author=user).select_related('post__community').order_by('-created_at')
     
     # Get user's communities
     communities = user.communities.all()
@@ -84,7 +84,9 @@ def edit_profile(request):
         
         if user_form.is_valid() and profile_form.is_valid():
             user_form.save()
-            profile_form.save()
+            profile = profile_form.save(commit=False)
+            profile.save(update_fields=Profile.EDITABLE_FIELDS)
+            profile_form.save_m2m()
             messages.success(request, 'Your profile has been updated!')
             return redirect('profile', username=request.user.username)
     else:
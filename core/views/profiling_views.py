@@ -0,0 +1,72 @@
+"""
+Admin report of the request profiling aggregates, see core/profiling.py.
+"""
+import time
+
+from django.contrib import admin
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import HttpResponse
+from django.shortcuts import render
+from ..profiling import VIEW_ORDERINGS, load_profile, top_queries, top_views
+
+
+# Choices of the report's time window, in hours
+PROFILING_WINDOWS = [1, 6, 24, 24 * 7]
+
+# Rows per table
+PROFILING_TOP_N = 25
+
+# Innermost frames of a sampled stack shown on the report
+STACK_TAIL = 6
+
+
+@staff_member_required
+def profiling_report(request):
+    """
+    Top-N slow views and queries over a recent time window. With ``view``,
+    also the view's most sampled stacks; ``format=collapsed`` downloads all of
+    them for a flame graph tool.
+    """
+    try:
+        hours = int(request.GET.get('hours', 24))
+    except ValueError:
+        hours = 24
+    if hours not in PROFILING_WINDOWS:
+        hours = 24
+    order = request.GET.get('order', 'p95')
+    if order not in VIEW_ORDERINGS:
+        order = 'p95'
+    selected = request.GET.get('view')
+
+    profile = load_profile(since=time.time() - hours * 60 * 60)
+    stacks = profile.stacks.get(selected, {}) if selected else {}
+
+    if selected and request.GET.get('format') == 'collapsed':
+        lines = [f'{stack} {count}' for stack, count in sorted(stacks.items(), key=lambda item: -item[1])]
+        response = HttpResponse('\n'.join(lines) + '\n', content_type='text/plain; charset=utf-8')
+        response['Content-Disposition'] = 'attachment; filename="stacks.txt"'
+        return response
+
+    total_samples = sum(stacks.values())
+    top_stacks = [
+        {
+            'frames': stack.split(';')[-STACK_TAIL:],
+            'count': count,
+            'share': count / total_samples,
+        }
+        for stack, count in sorted(stacks.items(), key=lambda item: -item[1])[:PROFILING_TOP_N]
+    ]
+
+    context = {
+        **admin.site.each_context(request),
+        'title': 'Request profiling',
+        'hours': hours,
+        'windows': PROFILING_WINDOWS,
+        'order': order,
+        'orderings': list(VIEW_ORDERINGS),
+        'views': top_views(profile, PROFILING_TOP_N, order),
+        'queries': top_queries(profile, PROFILING_TOP_N),
+        'selected_view': selected,
+        'stacks': top_stacks,
+    }
+    return render(request, 'core/admin/profiling.html', context)
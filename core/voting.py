@@ -0,0 +1,288 @@
+"""
+Vote toggling service shared by the HTML views and the API.
+
+A vote is applied as a single delete, update or insert of the user's Vote row
+followed by F() updates of the target's denormalized counters and the
+author's karma, all inside one transaction. Concurrent requests cannot lose
+counter updates and a double-click never hits the unique constraints with an
+unhandled error.
+
+``cast_votes`` applies a batch of votes of one user, as sent by API clients
+that queue votes offline, with a fixed number of queries: one insert for the
+new votes, one update per value for the changed ones, one delete, and one F()
+update per distinct counter change, whatever the size of the batch.
+"""
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .models import Post, Comment, Vote
+from .caching import invalidated_update
+from .karma import adjust_karma, adjust_karma_many, vote_karma_delta
+from .ranking import update_many_post_scores, update_post_scores
+from .comment_fragments import invalidate_trees
+from .page_cache import invalidate_pages
+
+
+# Most operations a single cast_votes() call accepts
+BULK_VOTE_LIMIT = 500
+
+# Vote target kinds of cast_votes() and their models
+TARGET_MODELS = {'post': Post, 'comment': Comment}
+
+
+class VoteResult:
+    """
+    Outcome of a vote.
+
+    Attributes:
+        status: 'added', 'changed', 'removed' or 'unchanged', or 'not_found'
+            for a missing target in the results of ``cast_votes``
+        value: The user's vote after the operation (1, -1 or None)
+        upvotes: The target's upvote count after the operation
+        downvotes: The target's downvote count after the operation
+    """
+
+    def __init__(self, status, value, upvotes, downvotes):
+        self.status = status
+        self.value = value
+        self.upvotes = upvotes
+        self.downvotes = downvotes
+
+    @property
+    def score(self):
+        return self.upvotes - self.downvotes
+
+
+def _target_info(target):
+    """Return the model and the Vote foreign key field for a post or comment"""
+    if isinstance(target, Post):
+        return Post, 'post'
+    if isinstance(target, Comment):
+        return Comment, 'comment'
+    raise TypeError(f'Cannot vote on {target.__class__.__name__}')
+
+
+def count_deltas(old_value, new_value):
+    """Return the (upvote, downvote) counter changes for a vote transition"""
+    upvotes = downvotes = 0
+    for value, delta in ((old_value, -1), (new_value, 1)):
+        if value == 1:
+            upvotes += delta
+        elif value == -1:
+            downvotes += delta
+    return upvotes, downvotes
+
+
+def _counter_changes(upvotes, downvotes):
+    # Counters are clamped at zero because the fields are positive integers
+    changes = {}
+    if upvotes:
+        changes['upvote_count'] = Greatest(F('upvote_count') + upvotes, 0)
+    if downvotes:
+        changes['downvote_count'] = Greatest(F('downvote_count') + downvotes, 0)
+    return changes
+
+
+def update_vote_counts(model, pk, upvotes=0, downvotes=0):
+    """
+    Atomically add deltas to the denormalized counters of a post or comment.
+    Counters are clamped at zero because the fields are positive integers.
+    """
+    changes = _counter_changes(upvotes, downvotes)
+    if changes:
+        invalidated_update(model.objects.filter(pk=pk), **changes)
+
+
+def _apply_vote(user, model, field, target_id, value, toggle):
+    """Apply one vote inside the current transaction and return (status, old, new)"""
+    votes = Vote.objects.filter(user=user, **{f'{field}_id': target_id})
+
+    # Voting the same way twice removes the vote
+    if toggle and votes.filter(value=value).delete()[0]:
+        return 'removed', value, None
+
+    # A changed vote counts as cast now, e.g. for upvote rollups
+    if votes.exclude(value=value).update(value=value, created_at=timezone.now()):
+        return 'changed', -value, value
+
+    try:
+        # The savepoint keeps the outer transaction usable if we lose a race
+        with transaction.atomic():
+            Vote.objects.bulk_create([Vote(user=user, value=value, **{f'{field}_id': target_id})])
+        return 'added', None, value
+    except IntegrityError:
+        pass
+
+    # Another request created the vote first; look at what it left behind
+    current = votes.values_list('value', flat=True).first()
+    if current == value and not toggle:
+        return 'unchanged', value, value
+    if current == value:
+        votes.filter(value=value).delete()
+        return 'removed', value, None
+    if current is not None:
+        votes.update(value=value, created_at=timezone.now())
+        return 'changed', current, value
+    return 'unchanged', None, None
+
+
+def cast_vote(user, target, value, toggle=True):
+    """
+    Cast a vote on a post or comment.
+
+    With ``toggle`` (the web UI behaviour) voting the same way twice removes
+    the vote; without it the vote is simply set to ``value``. Returns a
+    ``VoteResult`` with the new counters, read back from the target row
+    rather than recounted from Vote rows.
+    """
+    if value not in (1, -1):
+        raise ValueError('Vote value must be 1 or -1')
+
+    model, field = _target_info(target)
+
+    with transaction.atomic():
+        status, old_value, new_value = _apply_vote(user, model, field, target.pk, value, toggle)
+        update_vote_counts(model, target.pk, *count_deltas(old_value, new_value))
+        adjust_karma(target.author_id, vote_karma_delta(old_value, new_value))
+        upvotes, downvotes = model.objects.filter(pk=target.pk)\
+            .values_list('upvote_count', 'downvote_count').get()
+
+        target.upvote_count = upvotes
+        target.downvote_count = downvotes
+        # An unchanged vote leaves the counters and so the scores as they are
+        if model is Post and new_value != old_value:
+            update_post_scores(target)
+        elif new_value != old_value:
+            invalidate_trees([target.tree_id])
+        if new_value != old_value:
+            invalidate_pages(f'post:{target.pk if model is Post else target.post_id}')
+
+    return VoteResult(status, new_value, upvotes, downvotes)
+
+
+def _vote_status(old_value, new_value):
+    if old_value == new_value:
+        return 'unchanged'
+    if old_value is None:
+        return 'added'
+    if new_value is None:
+        return 'removed'
+    return 'changed'
+
+
+def _cast_votes(user, operations):
+    targets, initial = {}, {}
+    for kind, model in TARGET_MODELS.items():
+        ids = {target_id for target_kind, target_id, _ in operations if target_kind == kind}
+        if not ids:
+            continue
+        fields = ['author', 'upvote_count', 'downvote_count']
+        fields += ['created_at', 'community'] if model is Post else ['tree_id', 'post']
+        for target in model.objects.filter(pk__in=ids).only(*fields):
+            targets[kind, target.pk] = target
+        # Locking the user's votes serializes concurrent batches of one user
+        votes = Vote.objects.select_for_update().filter(user=user, **{f'{kind}_id__in': ids})\
+            .values_list(f'{kind}_id', 'value')
+        initial.update(((kind, target_id), value) for target_id, value in votes)
+
+    # Operations apply in order; only the net change of each target is written
+    current = dict(initial)
+    steps = []
+    for kind, target_id, value in operations:
+        key = (kind, target_id)
+        if key not in targets:
+            steps.append(None)
+            continue
+        old_value, new_value = current.get(key), value or None
+        current[key] = new_value
+        steps.append((key, _vote_status(old_value, new_value), new_value))
+    final = {key: value for key, value in current.items() if value != initial.get(key)}
+
+    karma = defaultdict(int)
+    changed_posts, tree_ids, page_tags = [], set(), set()
+    for kind, model in TARGET_MODELS.items():
+        field = f'{kind}_id'
+        changed = {target_id: value for (target_kind, target_id), value in final.items() if target_kind == kind}
+        if not changed:
+            continue
+        old = {target_id: initial.get((kind, target_id)) for target_id in changed}
+
+        Vote.objects.bulk_create([
+            Vote(user=user, value=value, **{field: target_id})
+            for target_id, value in changed.items() if old[target_id] is None
+        ])
+        for value in (1, -1):
+            ids = [target_id for target_id, new in changed.items() if new == value and old[target_id] is not None]
+            if ids:
+                Vote.objects.filter(user=user, **{f'{field}__in': ids}).update(value=value, created_at=timezone.now())
+        removed = [target_id for target_id, new in changed.items() if new is None]
+        if removed:
+            Vote.objects.filter(user=user, **{f'{field}__in': removed}).delete()
+
+        # One counter update per distinct transition
+        groups = defaultdict(list)
+        for target_id, value in changed.items():
+            groups[count_deltas(old[target_id], value)].append(target_id)
+            karma[targets[kind, target_id].author_id] += vote_karma_delta(old[target_id], value)
+        for deltas, ids in groups.items():
+            invalidated_update(model.objects.filter(pk__in=ids), **_counter_changes(*deltas))
+
+        rows = model.objects.filter(pk__in=list(changed)).values_list('pk', 'upvote_count', 'downvote_count')
+        for pk, upvotes, downvotes in rows:
+            target = targets[kind, pk]
+            target.upvote_count, target.downvote_count = upvotes, downvotes
+            if model is Post:
+                changed_posts.append(target)
+                page_tags.add(f'post:{pk}')
+            else:
+                tree_ids.add(target.tree_id)
+                page_tags.add(f'post:{target.post_id}')
+
+    adjust_karma_many(karma)
+    update_many_post_scores(changed_posts)
+    if tree_ids:
+        invalidate_trees(tree_ids)
+    if page_tags:
+        invalidate_pages(*page_tags)
+
+    results = []
+    for step in steps:
+        if step is None:
+            results.append(VoteResult('not_found', None, 0, 0))
+            continue
+        key, status, value = step
+        target = targets[key]
+        results.append(VoteResult(status, value, target.upvote_count, target.downvote_count))
+    return results
+
+
+def cast_votes(user, operations):
+    """
+    Set many votes of one user in a single transaction.
+
+    ``operations`` is a list of ``(kind, target_id, value)`` with ``kind``
+    'post' or 'comment' and ``value`` 1, -1 or 0 to remove the vote. They
+    apply in order, so a later operation on the same target wins. Returns a
+    ``VoteResult`` per operation, with the target's counters after the
+    whole batch.
+    """
+    if len(operations) > BULK_VOTE_LIMIT:
+        raise ValueError(f'At most {BULK_VOTE_LIMIT} votes can be cast at once')
+    for kind, _, value in operations:
+        if kind not in TARGET_MODELS:
+            raise ValueError(f'Cannot vote on {kind!r}')
+        if value not in (1, -1, 0):
+            raise ValueError('Vote value must be 1, -1 or 0')
+
+    try:
+        with transaction.atomic():
+            return _cast_votes(user, operations)
+    except IntegrityError:
+        # Another request of the user created one of the new votes first;
+        # the second attempt finds it, and locks it, with the others
+        with transaction.atomic():
+            return _cast_votes(user, operations)
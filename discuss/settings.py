@@ -3,6 +3,7 @@ Django settings for discuss project.
 """
 
 import os
+import sys
 import sentry_sdk
 from pathlib import Path
 from sentry_sdk.integrations.django import DjangoIntegration
@@ -76,7 +77,7 @@ INSTALLED_APPS = [
     'allauth.account',
     'allauth.socialaccount',
     'el_pagination',
-    # 'cacheops',  # Temporarily disabled due to compatibility issues
+    # 'cacheops' is appended below when a Redis cache is configured
     # 'avatar',    # Replaced with native ImageField in Profile model
     'taggit',    # For adding tags to profiles and content
     'django_countries',  # For country selection in profiles
@@ -100,7 +101,6 @@ INSTALLED_APPS = [
     
     # Debugging and developer tools
     'django_extensions',  # Various developer extensions
-    'silk',  # Advanced request profiling
 ]
 
 # MIDDLEWARE is defined above based on DEBUG setting
@@ -108,22 +108,24 @@ if DEBUG:
     # Add debug middleware
     MIDDLEWARE.extend([
         'debug_toolbar.middleware.DebugToolbarMiddleware',
-        'silk.middleware.SilkyMiddleware',  # Django Silk profiling middleware
     ])
 
+# Request profiling comes first so that it times the whole middleware stack
+MIDDLEWARE.insert(0, 'core.profiling.ProfilingMiddleware')
+
 # Add django-axes middleware for login security
 MIDDLEWARE.append('axes.middleware.AxesMiddleware')
 
-# Silk configuration
-SILKY_PYTHON_PROFILER = True  # Enable Python profiling
-SILKY_PYTHON_PROFILER_BINARY = True  # Enable binary profiling (for visualization)
-SILKY_META = True  # Collect metadata about requests
-SILKY_INTERCEPT_PERCENT = 10  # Only profile 10% of requests (reduce for production)
-SILKY_AUTHENTICATION = True  # Only allow authenticated users to access Silk
-SILKY_AUTHORISATION = True  # Only allow superusers to access Silk
-SILKY_MAX_RECORDED_REQUESTS = 50  # Limit stored requests to most recent 50
-SILKY_MAX_RECORDED_REQUESTS_CHECK_PERCENT = 100  # Check limits on every request
-SILKY_PYTHON_PROFILER_RESULT_PATH = 'profiles/'  # Store profiles in a subdirectory
+# Request profiling (core/profiling.py). Every request's time and queries are
+# aggregated per view and flushed to PROFILING_DIR, which keeps itself within
+# the retention limits; see the report at /admin/profiling/. Off under tests.
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', '1') == '1' and 'test' not in sys.argv[1:2]
+PROFILING_DIR = os.path.join(BASE_DIR, 'profiles')
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', '0.01'))  # Share of requests stack-sampled
+PROFILING_SAMPLE_INTERVAL = 0.005  # Seconds between stack samples
+PROFILING_FLUSH_INTERVAL = 60  # Seconds between flushes to disk
+PROFILING_RETENTION_DAYS = 7
+PROFILING_MAX_BYTES = 100 * 1024 * 1024
 
 # Debug Toolbar
 INTERNAL_IPS = ['127.0.0.1', '0.0.0.0']
@@ -159,6 +161,7 @@ TEMPLATES = [
                 'core.context_processors.notification_count',
                 'core.context_processors.popular_tags',
                 'core.context_processors.user_profile',
+                'core.context_processors.page_shell',
             ],
         },
     },
@@ -260,10 +263,11 @@ SITE_ID = 1
 AUTHENTICATION_BACKENDS = [
     # AxesStandaloneBackend should be the first backend in the AUTHENTICATION_BACKENDS list
     'axes.backends.AxesStandaloneBackend',
-    # Needed to login by username in Django admin, regardless of `allauth`
-    'django.contrib.auth.backends.ModelBackend',
+    # Needed to login by username in Django admin, regardless of `allauth`.
+    # The core backends load request.user together with its profile
+    'core.backends.ProfileModelBackend',
     # `allauth` specific authentication methods, such as login by e-mail
-    'allauth.account.auth_backends.AuthenticationBackend',
+    'core.backends.ProfileAuthenticationBackend',
 ]
 
 # Allauth settings
@@ -284,24 +288,113 @@ SILENCED_SYSTEM_CHECKS = ['models.E028']
 EL_PAGINATION_PER_PAGE = 10
 EL_PAGINATION_PAGE_OUT_OF_RANGE_404 = True
 
+# Shared cache settings
+# All workers must see the same cache, otherwise invalidation in one worker
+# leaves stale copies in the others. Redis is used when REDIS_URL is set;
+# without it the cache lives in files under CACHE_DIR, which every worker on
+# the host shares. CACHE_BACKEND=db stores it in the database instead (run
+# `manage.py createcachetable` once). Tests get an isolated in-memory cache.
+REDIS_URL = os.environ.get('REDIS_URL', '')
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'redis' if REDIS_URL else 'file')
+if 'test' in sys.argv[1:2]:
+    CACHE_BACKEND = 'locmem'
+
+CACHE_TIMEOUT = 60 * 15
+
+if CACHE_BACKEND == 'redis':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL or 'redis://localhost:6379/0',
+            'KEY_PREFIX': 'discuss',
+            'TIMEOUT': CACHE_TIMEOUT,
+        }
+    }
+elif CACHE_BACKEND == 'db':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'discuss_cache',
+            'TIMEOUT': CACHE_TIMEOUT,
+        }
+    }
+elif CACHE_BACKEND == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('CACHE_DIR', str(BASE_DIR / '.cache')),
+            'TIMEOUT': CACHE_TIMEOUT,
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'unique-snowflake',
+            'TIMEOUT': CACHE_TIMEOUT,
+        }
+    }
+
+# Whole-page cache of the feed, community and post pages, see core.page_cache.
+# Logged-in viewers get the cached page with their own votes, counts and
+# buttons filled in. Lists may show vote and comment counts this many seconds
+# old; everything else is invalidated when it changes.
+PAGE_CACHE_ENABLED = os.environ.get('PAGE_CACHE_ENABLED', '1') == '1' and 'test' not in sys.argv[1:2]
+PAGE_CACHE_TIMEOUT = 60
+
+# Materialized feeds, see core.feeds: the first FEED_LENGTH post ids of the
+# new, hot and top feeds of the site and of each community, kept in Redis
+# sorted sets. FEED_STORE=memory keeps them in the process instead (single
+# process development only); without a store feeds are read from the post
+# indexes.
+FEED_STORE = os.environ.get('FEED_STORE', 'redis' if REDIS_URL else '')
+if 'test' in sys.argv[1:2]:
+    FEED_STORE = ''
+FEED_REDIS_URL = os.environ.get('FEED_REDIS_URL', REDIS_URL or 'redis://localhost:6379/2')
+FEED_LENGTH = 1000
+
+# Personalized home feeds, see core.home_feeds. Posts of communities with up
+# to HOME_FEED_FANOUT_LIMIT members are pushed to their members' home feeds
+# by the notification worker; larger communities are merged in on read.
+# Each interest tag a post matches ranks it this many seconds newer.
+HOME_FEED_FANOUT_LIMIT = 10000
+HOME_FEED_INTEREST_BOOST = 6 * 60 * 60
+
 # django-cacheops settings
-CACHEOPS_REDIS = {
-    'host': 'localhost',
-    'port': 6379,
-    'db': 1,
-}
+# Query caching with automatic invalidation. cacheops only works with Redis,
+# so it is enabled only with the Redis cache backend; set CACHEOPS_ENABLED=0
+# to turn it off there too.
+CACHEOPS_ENABLED = CACHE_BACKEND == 'redis' and os.environ.get('CACHEOPS_ENABLED', '1') == '1'
+if CACHEOPS_ENABLED:
+    INSTALLED_APPS.append('cacheops')
+
+CACHEOPS_REDIS = os.environ.get('CACHEOPS_REDIS_URL', REDIS_URL or 'redis://localhost:6379/1')
+
+# Serve from the database when Redis is unavailable instead of failing
+CACHEOPS_DEGRADE_ON_FAILURE = True
 
 CACHEOPS_DEFAULTS = {
-    'timeout': 60*60  # 1 hour cache timeout
+    'timeout': CACHE_TIMEOUT
 }
 
+# Per model switches: 'ops' lists the cached operations ('get', 'fetch',
+# 'count', 'aggregate', 'exists' or 'all'); an empty tuple turns caching off.
+# Counter columns of these models are changed with QuerySet.update(), which
+# cacheops does not see, so such writes go through
+# core.caching.invalidated_update().
 CACHEOPS = {
-    # Cache all queries in core app for 1 hour
-    'core.*': {'ops': 'all', 'timeout': 60*60},
-    # Cache specific models for different durations
-    'auth.user': {'ops': {'fetch', 'get'}, 'timeout': 60*60},
-    'auth.*': {'ops': ('fetch', 'get'), 'timeout': 60*60},
-    '*.*': {'ops': (), 'timeout': 60*60},  # Disable caching for all other models
+    'auth.user': {'ops': ('get',)},
+    'taggit.tag': {'ops': ('get', 'fetch')},
+    'core.community': {'ops': ('get', 'fetch')},
+    'core.post': {'ops': ('get', 'fetch')},
+    'core.comment': {'ops': ('get', 'fetch')},
+    'core.profile': {'ops': ('get',)},
+    # Written on every vote or read; caching them costs more than it saves
+    'core.vote': {'ops': ()},
+    'core.notification': {'ops': ()},
+    'core.payment': {'ops': ()},
+    '*.*': {'ops': ()},  # Disable caching for all other models
 }
 
 # Custom Avatar settings (replaced django-avatar with direct ImageField)
@@ -365,14 +458,6 @@ HITCOUNT_KEEP_HIT_ACTIVE = {'days': 7}
 HITCOUNT_HITS_PER_IP_LIMIT = 0  # Unlimited hits per IP
 HITCOUNT_EXCLUDE_USER_GROUP = ()  # Don't exclude any user groups
 
-# Django Cache settings - using local memory for testing
-CACHES = {
-    "default": {
-        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
-        "LOCATION": "unique-snowflake",
-    }
-}
-
 # Django Crispy Forms settings
 CRISPY_TEMPLATE_PACK = 'bootstrap5'
 
@@ -438,4 +523,16 @@ HAYSTACK_CONNECTIONS = {
         'ENGINE': 'haystack.backends.simple_backend.SimpleEngine',
     },
 }
-HAYSTACK_SIGNAL_PROCESSOR = 'haystack.signals.RealtimeSignalProcessor'
+# No haystack indexes are defined; the realtime processor only added work to
+# every save. Search index updates go through the core.search queue.
+HAYSTACK_SIGNAL_PROCESSOR = 'haystack.signals.BaseSignalProcessor'
+
+# Search index updates are queued and applied in batches by
+# `manage.py process_search_queue --loop`. Set SEARCH_INDEX_ASYNC=0 to apply
+# them right after each commit instead, e.g. when no worker is running.
+SEARCH_INDEX_ASYNC = os.environ.get('SEARCH_INDEX_ASYNC', '1') == '1'
+
+# Reply and mention notifications of new posts and comments are delivered by
+# `manage.py process_notification_queue --loop`. Set NOTIFICATIONS_ASYNC=0 to
+# deliver them right after each commit instead.
+NOTIFICATIONS_ASYNC = os.environ.get('NOTIFICATIONS_ASYNC', '1') == '1'
@@ -6,13 +6,14 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from core.views.profiling_views import profiling_report
 
 urlpatterns = [
+    path('admin/profiling/', profiling_report, name='admin_profiling'),
     path('admin/', admin.site.urls),
     path('markdownx/', include('markdownx.urls')),
     path('api-auth/', include('rest_framework.urls')),
     path('api/', include('core.api.urls')),  # API endpoints
-    path('silk/', include('silk.urls', namespace='silk')),  # Django Silk profiling
     # Override specific auth URLs with our consolidated templates
     path('accounts/', include('core.views.auth_urls')),
     # Include remaining allauth URLs